@@ -0,0 +1,266 @@
+import glob
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import cv2
+import numpy as np
+
+# CPU inference backends behind the model registry. "torch" is the plain
+# ultralytics YOLO model; "onnx" and "openvino" export the weights once, cache
+# the exported model on disk (keyed by the weights hash and the input size) and
+# run it with the runtime directly, with a configurable number of threads.
+# Every backend returns objects that Detections.from_results() reads the same
+# way, so nothing downstream depends on the backend. "onnx-int8" and
+# "openvino-int8" run the post-training INT8 models written by quantization.py.
+
+BACKENDS = ('torch', 'onnx', 'openvino', 'onnx-int8', 'openvino-int8')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'exported_models')
+# Same class offset and IoU default as ultralytics' own NMS
+MAX_WH = 7680
+DEFAULT_IOU = 0.7
+
+
+def weights_hash(path, chunk=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def export_suffix(backend):
+    return '.onnx' if backend == 'onnx' else '_openvino_model'
+
+
+def cached_export(weights, backend, imgsz, cache_dir=CACHE_DIR):
+    """(path, class names) of an existing export of the weights, or None.
+
+    Weights that are not a local file (released weights such as "yolov8n.pt",
+    downloaded by ultralytics) cannot be hashed; they never change, so the
+    latest export of that name is used.
+    """
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    suffix = export_suffix(backend)
+    if os.path.exists(weights):
+        candidates = [os.path.join(cache_dir, f"{stem}-{weights_hash(weights)}-{imgsz}{suffix}")]
+    else:
+        pattern = f"{glob.escape(stem)}-{'[0-9a-f]' * 16}-{imgsz}{suffix}"
+        candidates = sorted(glob.glob(os.path.join(glob.escape(cache_dir), pattern)), key=os.path.getmtime,
+                            reverse=True)
+    for target in candidates:
+        if os.path.exists(target) and os.path.exists(target + '.json'):
+            with open(target + '.json', encoding='utf-8') as f:
+                return target, json.load(f)
+    return None
+
+
+def export_model(weights, backend, imgsz, cache_dir=CACHE_DIR):
+    """Exported model path for (weights, backend, imgsz), exporting it on the first call.
+
+    Returns (path, class names). The names are kept in a JSON file next to the
+    export so that a cached model loads without torch: ultralytics is only
+    imported to export.
+    """
+    cached = cached_export(weights, backend, imgsz, cache_dir)
+    if cached is not None:
+        return cached
+
+    from ultralytics import YOLO
+    model = None
+    if not os.path.exists(weights):
+        # Released weights (e.g. "yolov8n.pt") are downloaded on first load
+        model = YOLO(weights)
+        weights = model.ckpt_path or weights
+        cached = cached_export(weights, backend, imgsz, cache_dir)
+        if cached is not None:
+            return cached
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    target = os.path.join(cache_dir, f"{stem}-{weights_hash(weights)}-{imgsz}{export_suffix(backend)}")
+    names_file = target + '.json'
+
+    print(f"Exporting {weights} to {backend} at {imgsz} px (cached in {cache_dir})")
+    model = model or YOLO(weights)
+    # Dynamic axes: the scheduler sends batches of a varying size
+    exported = model.export(format=backend, imgsz=imgsz, dynamic=True, half=False, verbose=False)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    elif os.path.exists(target):
+        os.remove(target)
+    shutil.move(str(exported), target)
+    names = [model.names[i] for i in range(len(model.names))]
+    with open(names_file, 'w', encoding='utf-8') as f:
+        json.dump(names, f)
+    return target, names
+
+
+def quantized_path(path):
+    """INT8 counterpart of an exported FP32 model (written by quantization.py calibrate)"""
+    for suffix in ('.onnx', '_openvino_model'):
+        if path.endswith(suffix):
+            return path[:-len(suffix)] + '-int8' + suffix
+    raise ValueError(f"Not an exported model: {path}")
+
+
+class OnnxRuntimeSession:
+    def __init__(self, path, threads=None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoSession:
+    def __init__(self, path, threads=None):
+        import openvino
+        core = openvino.Core()
+        xml = os.path.join(path, next(name for name in os.listdir(path) if name.endswith('.xml')))
+        config = {'PERFORMANCE_HINT': 'LATENCY'}
+        if threads:
+            config['INFERENCE_NUM_THREADS'] = threads
+        self.model = core.compile_model(core.read_model(xml), 'CPU', config)
+
+    def __call__(self, blob):
+        return self.model(blob)[0]
+
+
+RUNTIMES = {'onnx': OnnxRuntimeSession, 'openvino': OpenVinoSession}
+RUNTIME_MODULES = {'onnx': 'onnxruntime', 'openvino': 'openvino'}
+
+
+class RuntimeBoxes:
+    """Boxes.data equivalent: (N, 6) x1, y1, x2, y2, confidence, class"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class RuntimeResult:
+    """The part of an ultralytics Results that Detections.from_results() reads"""
+
+    def __init__(self, names, orig_shape, data):
+        self.names = names
+        self.orig_shape = orig_shape
+        self.boxes = RuntimeBoxes(data)
+
+
+def letterbox(frame, size):
+    """Resizes keeping the aspect ratio and pads to size x size; returns (image, gain, (pad_x, pad_y))"""
+    height, width = frame.shape[:2]
+    gain = min(size / height, size / width)
+    new_width, new_height = round(width * gain), round(height * gain)
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    if (new_width, new_height) != (width, height):
+        frame = cv2.resize(frame, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, left = round(pad_y - 0.1), round(pad_x - 0.1)
+    image = cv2.copyMakeBorder(frame, top, size - new_height - top, left, size - new_width - left,
+                               cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return image, gain, (left, top)
+
+
+class ExportedModel:
+    """YOLO detector exported to ONNX or OpenVINO, called like an ultralytics model.
+
+    One exported model (and runtime session) per input size, created when a
+    profile first asks for that size. An "-int8" backend uses the calibrated
+    INT8 model of that size, or the FP32 one if it has not been calibrated.
+    """
+
+    def __init__(self, weights, backend, threads=None, cache_dir=CACHE_DIR, imgsz=640):
+        self.weights = weights
+        self.backend = backend
+        self.runtime, _, precision = backend.partition('-')
+        self.int8 = precision == 'int8'
+        self.threads = threads
+        self.cache_dir = cache_dir
+        self.sessions = {}
+        self.names = {}
+        # A missing runtime fails here, before paying for an export that could not run
+        importlib.import_module(RUNTIME_MODULES[self.runtime])
+        self.session(imgsz)
+
+    def session(self, imgsz):
+        session = self.sessions.get(imgsz)
+        if session is None:
+            path, names = export_model(self.weights, self.runtime, imgsz, self.cache_dir)
+            if self.int8:
+                if os.path.exists(quantized_path(path)):
+                    path = quantized_path(path)
+                else:
+                    print(f"No INT8 {self.runtime} model of {self.weights} at {imgsz} px "
+                          f"(run quantization.py calibrate); using FP32")
+            session = RUNTIMES[self.runtime](path, self.threads)
+            self.names = dict(enumerate(names))
+            self.sessions[imgsz] = session
+        return session
+
+    def __call__(self, frames, imgsz=640, conf=0.25, iou=DEFAULT_IOU, classes=None, max_det=300, **_):
+        # Other predict() arguments (half, verbose...) do not apply to an exported model
+        if isinstance(frames, np.ndarray) and frames.ndim == 3:
+            frames = [frames]
+        imgsz = imgsz if isinstance(imgsz, int) else max(imgsz)
+        session = self.session(imgsz)
+        letterboxed = [letterbox(frame, imgsz) for frame in frames]
+        blob = cv2.dnn.blobFromImages([image for image, _, _ in letterboxed], 1 / 255.0, swapRB=True)
+        output = session(blob)
+        return [RuntimeResult(self.names, frame.shape[:2],
+                              self.postprocess(prediction, gain, pad, frame.shape, conf, iou, classes, max_det))
+                for frame, (_, gain, pad), prediction in zip(frames, letterboxed, output)]
+
+    @staticmethod
+    def postprocess(prediction, gain, pad, shape, conf, iou, classes, max_det):
+        """(4 + classes, anchors) head output -> (N, 6) boxes in frame pixels after class-wise NMS"""
+        prediction = prediction.T
+        class_scores = prediction[:, 4:]
+        class_ids = class_scores.argmax(axis=1)
+        scores = class_scores[np.arange(len(class_ids)), class_ids]
+        keep = scores > conf
+        if classes is not None:
+            keep &= np.isin(class_ids, classes)
+        xywh, scores, class_ids = prediction[keep, :4], scores[keep], class_ids[keep]
+        if not len(scores):
+            return np.empty((0, 6), dtype=np.float32)
+
+        # Class offsets so that a single NMS call never merges boxes of different classes
+        corners = xywh[:, :2] - xywh[:, 2:] / 2
+        offset = (class_ids * MAX_WH)[:, None]
+        rects = np.column_stack((corners + offset, xywh[:, 2:]))
+        indices = np.asarray(cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), conf, iou), dtype=np.int64).reshape(-1)
+        indices = indices[:max_det]
+
+        boxes = np.column_stack((corners[indices], corners[indices] + xywh[indices, 2:]))
+        boxes = (boxes - np.array(pad * 2, dtype=np.float32)) / gain
+        np.clip(boxes, 0, [shape[1], shape[0], shape[1], shape[0]], out=boxes)
+        return np.column_stack((boxes, scores[indices], class_ids[indices])).astype(np.float32)
+
+
+def load_torch(weights, threads=None):
+    from ultralytics import YOLO
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    return YOLO(weights)
+
+
+def load_model(weights, backend='torch', threads=None, cache_dir=CACHE_DIR):
+    """Model for `weights` on the given backend, or the PyTorch model when that backend cannot run here"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r} (known: {', '.join(BACKENDS)})")
+    if backend != 'torch':
+        try:
+            return ExportedModel(weights, backend, threads, cache_dir)
+        except Exception as e:
+            # Runtime not installed, export dependencies missing, unsupported model...
+            print(f"{backend} backend unavailable for {weights} ({e}); falling back to PyTorch")
+    return load_torch(weights, threads)
@@ -0,0 +1,75 @@
+"""Throughput of every inference profile on the same frames, to pick one per site.
+
+Example (no camera needed):
+    python bench_inference_profiles.py --source "synthetic:1920x1080?fps=0&density=300" --frames 100
+    python bench_inference_profiles.py --source match.mp4 --profile dense_stadium --profile light_concourse
+    python bench_inference_profiles.py --backend openvino --threads 4
+"""
+import argparse
+import time
+from detections import Detections
+from inference import model_registry
+from inference_profiles import load_profiles
+from video_sources import open_source
+
+def grab_frames(spec, count):
+    """Reads `count` frames once so every profile sees exactly the same input"""
+    source = open_source(spec)
+    if not source.open():
+        raise SystemExit(f"Could not open source {spec}")
+    frames = []
+    try:
+        while len(frames) < count:
+            ok, frame, _, _ = source.read()
+            if not ok:
+                break
+            frames.append(frame)
+    finally:
+        source.release()
+    return frames
+
+def bench_profile(model, profile, frames, batch, warmup):
+    args = dict(profile.predict_args(model.names), verbose=False)
+    for _ in range(warmup):
+        model(frames[:batch], **args)
+
+    detections = 0
+    start = time.perf_counter()
+    for offset in range(0, len(frames), batch):
+        for result in model(frames[offset:offset + batch], **args):
+            detections += len(Detections.from_results(result))
+    elapsed = time.perf_counter() - start
+    return len(frames) / elapsed, 1000 * elapsed / len(frames), detections / len(frames)
+
+def run(weights, spec, frame_count, names, batch, warmup, backend=None, threads=None):
+    model_registry.configure(backend, threads)
+    profiles, _ = load_profiles()
+    frames = grab_frames(spec, frame_count)
+    if not frames:
+        raise SystemExit("No frames to benchmark")
+    model = model_registry.get(weights)
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {spec}, batch {batch}, "
+          f"{getattr(model, 'backend', 'torch')} backend")
+    print(f"{'profile':<18} {'fps':>8} {'ms/frame':>10} {'boxes/frame':>12}")
+    for name in names or list(profiles):
+        if name not in profiles:
+            print(f"{name:<18} unknown profile")
+            continue
+        profile = profiles[name]
+        # A profile may run on its own backend (e.g. the INT8 model)
+        profile_model = model_registry.get(weights, profile.backend) if profile.backend else model
+        fps, ms, boxes = bench_profile(profile_model, profile, frames, batch, warmup)
+        print(f"{name:<18} {fps:>8.1f} {ms:>10.1f} {boxes:>12.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--source', default='synthetic:1920x1080?fps=0&density=300')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--profile', action='append', dest='profiles', help="Profile to run (repeatable, default all)")
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--backend', choices=('torch', 'onnx', 'openvino'), default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+    run(args.weights, args.source, args.frames, args.profiles, args.batch, args.warmup, args.backend, args.threads)
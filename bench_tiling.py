@@ -0,0 +1,104 @@
+"""Count accuracy gained by tiled inference against its cost.
+
+Runs the same frames through the single downscaled pass used by the front
+ends (640x480) and through tiled inference ("all" tiles, then "dense" tiles
+only). It prints ms/frame, fps and people per frame for each. With --truth
+(JSON list of per-frame person counts, or {frame index: count}) it also prints
+the count error; without it, it prints the people each mode finds beyond the
+single pass. --threads can be repeated to see how each mode scales with cores.
+
+Example:
+    python bench_tiling.py --source stands_4k.mp4 --frames 100 --threads 2 --threads 8
+    python bench_tiling.py --source stands_4k.mp4 --truth stands_4k_counts.json --backend openvino
+"""
+import argparse
+import json
+import time
+import cv2
+import numpy as np
+from backends import load_model
+from bench_inference_profiles import grab_frames
+from detections import Detections
+from tiling import TiledInference
+
+
+def load_truth(path, frame_count):
+    with open(path, encoding='utf-8') as f:
+        truth = json.load(f)
+    if isinstance(truth, dict):
+        truth = [truth.get(str(index)) for index in range(frame_count)]
+    return np.array([np.nan if count is None else count for count in truth[:frame_count]], dtype=np.float64)
+
+
+def count_people(detections, conf):
+    names = list(detections.names)
+    if 'person' not in names:
+        return 0
+    return int(np.count_nonzero((detections.class_ids == names.index('person')) & (detections.scores > conf)))
+
+
+def run_mode(model, frames, mode, imgsz, conf):
+    """(seconds per frame, person count of every frame) for one mode"""
+    args = dict(imgsz=imgsz, conf=conf, max_det=1000, verbose=False)
+    tiler = TiledInference(tile=imgsz, mode=mode) if mode != 'single' else None
+    counts = []
+    start = time.perf_counter()
+    for frame in frames:
+        if tiler is None:
+            detections = Detections.from_results(model([cv2.resize(frame, (640, 480))], **args)[0])
+        else:
+            images, windows = tiler.crops(frame)
+            detections = tiler.merge(model(images, **args), windows, frame.shape)
+            tiler.update(detections)
+        counts.append(count_people(detections, conf))
+    elapsed = time.perf_counter() - start
+    return elapsed / len(frames), np.array(counts), tiler
+
+
+def run(weights, spec, frame_count, backend, thread_counts, imgsz, conf, truth_path):
+    frames = grab_frames(spec, frame_count)
+    if not frames:
+        raise SystemExit("No frames to benchmark")
+    truth = load_truth(truth_path, len(frames)) if truth_path else None
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {spec}, "
+          f"{backend} backend, tile {imgsz} px")
+    header = f"{'threads':>7} {'mode':<7} {'ms/frame':>9} {'fps':>6} {'people':>7} {'tiles':>6}"
+    header += f" {'count MAE':>10} {'count err':>10}" if truth is not None else f" {'extra':>7} {'cost':>6}"
+    print(header)
+    for threads in thread_counts:
+        model = load_model(weights, backend, threads)
+        # Warm-up: first-call setup (and any export) stays out of the timings
+        model(frames[:1], imgsz=imgsz, verbose=False)
+        baseline = None
+        for mode in ('single', 'all', 'dense'):
+            seconds, counts, tiler = run_mode(model, frames, mode, imgsz, conf)
+            tiles = tiler.tiles_run / tiler.frames if tiler else 0.0
+            line = (f"{threads or 'auto':>7} {mode:<7} {1000 * seconds:>9.1f} {1 / seconds:>6.1f} "
+                    f"{counts.mean():>7.1f} {tiles:>6.1f}")
+            if truth is not None:
+                known = ~np.isnan(truth)
+                error = np.abs(counts[known] - truth[known])
+                line += f" {error.mean():>10.2f} {100 * error.sum() / max(truth[known].sum(), 1):>9.1f}%"
+            else:
+                if baseline is None:
+                    baseline = (seconds, counts)
+                line += (f" {(counts - baseline[1]).mean():>+7.1f} "
+                         f"{seconds / baseline[0]:>5.1f}x")
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--source', required=True, help="Video file or any video_sources spec, at full resolution")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--backend', choices=('torch', 'onnx', 'openvino', 'onnx-int8', 'openvino-int8'),
+                        default='torch')
+    parser.add_argument('--threads', type=int, action='append', dest='thread_counts',
+                        help="Inference threads (repeatable, default: the runtime's choice)")
+    parser.add_argument('--imgsz', type=int, default=640, help="Model input size, also the tile size")
+    parser.add_argument('--conf', type=float, default=0.4)
+    parser.add_argument('--truth', default=None, help="JSON ground-truth person counts per frame")
+    args = parser.parse_args()
+    run(args.weights, args.source, args.frames, args.backend, args.thread_counts or [None], args.imgsz, args.conf,
+        args.truth)
@@ -0,0 +1,86 @@
+"""Cost of a CentroidTracker update from 10 to 2,000 people per frame.
+
+A synthetic crowd walks across a 1920x1080 frame (constant velocity plus
+jitter); every frame a few people are missed by the detector and the boxes
+come in shuffled order. For each crowd size it prints the update time (mean
+and 95th percentile) of the dense gated assignment and of the grid-gated
+sparse one, whether both gave the same ids on every frame, and the identity
+switches: boxes given a different track id than the previous time that person
+was seen. --max-distance 0 times the ungated dense tracker alone.
+
+Example:
+    python bench_tracking.py
+    python bench_tracking.py --people 500 --people 2000 --frames 300 --max-distance 80
+"""
+import argparse
+import time
+import numpy as np
+from tracking import CentroidTracker
+
+FRAME_SIZE = np.array([1920, 1080], dtype=np.float32)
+BOX_SIZE = np.array([24, 60], dtype=np.float32)
+
+
+def simulate(people, frames, miss_rate, jitter, seed=0):
+    """Per frame: (person index of every box, (N, 4) boxes) in detection order"""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(BOX_SIZE, FRAME_SIZE - BOX_SIZE, size=(people, 2)).astype(np.float32)
+    velocities = rng.normal(0, 2, size=(people, 2)).astype(np.float32)
+    for _ in range(frames):
+        positions += velocities + rng.normal(0, jitter, size=(people, 2)).astype(np.float32)
+        # Bounce on the frame edges
+        outside = (positions < BOX_SIZE) | (positions > FRAME_SIZE - BOX_SIZE)
+        velocities[outside] *= -1
+        positions = np.clip(positions, BOX_SIZE, FRAME_SIZE - BOX_SIZE)
+        seen = rng.permutation(np.flatnonzero(rng.random(people) >= miss_rate))
+        centers = positions[seen]
+        yield seen, np.concatenate((centers - BOX_SIZE / 2, centers + BOX_SIZE / 2), axis=1)
+
+
+def run(people, frames, miss_rate, jitter, max_distance):
+    """Update times per mode, share of frames where the modes agree, identity switch rate, tracks"""
+    if max_distance:
+        trackers = {'dense': CentroidTracker(max_distance=max_distance, grid=False),
+                    'grid': CentroidTracker(max_distance=max_distance, grid=True)}
+    else:
+        trackers = {'dense': CentroidTracker()}
+    times = {mode: [] for mode in trackers}
+    last_id = np.full(people, -1, dtype=np.int64)
+    switches = assigned = agreeing = 0
+    for seen, boxes in simulate(people, frames, miss_rate, jitter):
+        results = {}
+        for mode, tracker in trackers.items():
+            start = time.perf_counter()
+            results[mode] = tracker.update(boxes)
+            times[mode].append(time.perf_counter() - start)
+        ids = results[mode]
+        agreeing += all(np.array_equal(ids, other) for other in results.values())
+        known = last_id[seen] >= 0
+        switches += int(np.count_nonzero(ids[known] != last_id[seen][known]))
+        assigned += int(np.count_nonzero(known))
+        last_id[seen] = ids
+    # The first update only registers tracks
+    times = {mode: np.array(values[1:]) for mode, values in times.items()}
+    return times, agreeing / frames, switches / max(assigned, 1), len(trackers[mode])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--people', type=int, action='append', dest='crowds',
+                        help="People per frame (repeatable, default: 10 to 2000)")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--miss-rate', type=float, default=0.05, help="Share of people missed in each frame")
+    parser.add_argument('--jitter', type=float, default=1.5, help="Position noise per frame, in pixels")
+    parser.add_argument('--max-distance', type=float, default=50,
+                        help="Tracker gate, in pixels per frame (0: no gate)")
+    args = parser.parse_args()
+    print(f"{args.frames} frames of {FRAME_SIZE[0]:.0f}x{FRAME_SIZE[1]:.0f}, {args.miss_rate:.0%} missed per frame, "
+          f"gate {args.max_distance or 'none'}")
+    print(f"{'people':>7} {'mode':<6} {'ms/update':>10} {'p95 ms':>8} {'updates/s':>10} {'same ids':>9} "
+          f"{'id switches':>12} {'tracks':>7}")
+    for people in args.crowds or [10, 50, 100, 250, 500, 1000, 2000]:
+        times, agreement, switch_rate, tracks = run(people, args.frames, args.miss_rate, args.jitter,
+                                                    args.max_distance)
+        for mode, values in times.items():
+            print(f"{people:>7} {mode:<6} {1000 * values.mean():>10.2f} {1000 * np.percentile(values, 95):>8.2f} "
+                  f"{1 / values.mean():>10.0f} {100 * agreement:>8.1f}% {100 * switch_rate:>11.2f}% {tracks:>7}")
@@ -1,23 +1,400 @@
 import cv2
 import socket
-import pickle
-import struct
 import threading
 import time
+import collections
+import argparse
+import functools
+import os
+import queue
+import numpy as np
+from stream_protocol import (CODEC_CONTROL, CODEC_DELTA, CODEC_DETECTIONS, CODEC_JPEG, CODEC_UNCHANGED,
+                             FrameReceiver, ProtocolError, decode_control, encode_control, encode_frame,
+                             pack_delta)
+from detections import Detections
+from inference import model_registry
+from inference_profiles import load_profiles
+from shm_transport import SharedFrameRing, ring_name
+from video_sources import open_source
+
+class StreamProfile:
+    """Named rendition of the stream: output width (None keeps capture size) and JPEG quality"""
+    
+    def __init__(self, name, width=None, quality=80):
+        self.name = name
+        self.width = width
+        self.quality = quality
+    
+    def resize(self, frame):
+        if self.width and frame.shape[1] > self.width:
+            height = int(round(frame.shape[0] * self.width / frame.shape[1]))
+            frame = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return frame
+    
+    def encode(self, frame):
+        ok, buffer = cv2.imencode('.jpg', self.resize(frame), [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer if ok else None
+
+DEFAULT_PROFILES = [
+    StreamProfile('full', None, 80),      # Operator screens
+    StreamProfile('operator', 1280, 80),
+    StreamProfile('worker', 640, 75),     # Inference workers
+]
+
+class DeltaEncoder:
+    """Motion-delta encoder for one (stream, profile): periodic keyframes and, in between,
+    only the tiles whose mean absolute difference exceeds a threshold"""
+    
+    def __init__(self, quality, tile_size=32, keyframe_interval=60, threshold=8.0, max_changed_ratio=0.5):
+        self.quality = quality
+        self.tile_size = tile_size
+        self.keyframe_interval = keyframe_interval
+        self.threshold = threshold
+        self.max_changed_ratio = max_changed_ratio
+        self.lock = threading.Lock()
+        self.reference = None
+        self.reference_sequence = 0
+        self.frames_since_keyframe = 0
+        
+        # Bandwidth accounting: actual bytes vs. what full JPEGs would have cost
+        self.bytes_sent = 0
+        self.bytes_full = 0
+        self.keyframe_size = 0
+    
+    def jpeg(self, image):
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buffer if ok else None
+    
+    def changed_tiles(self, frame):
+        """Boolean (rows, cols) grid of tiles that differ from the reference"""
+        height, width = frame.shape[:2]
+        size = self.tile_size
+        rows, cols = -(-height // size), -(-width // size)
+        diff = cv2.absdiff(frame, self.reference)
+        if rows * size != height or cols * size != width:
+            diff = cv2.copyMakeBorder(diff, 0, rows * size - height, 0, cols * size - width,
+                                      cv2.BORDER_CONSTANT, value=0)
+        tile_means = diff.reshape(rows, size, cols, size, -1).mean(axis=(1, 3))
+        return tile_means.max(axis=2) > self.threshold
+    
+    def encode(self, frame, sequence, force_keyframe=False):
+        """Returns (codec, payload, is_keyframe); payload is None if encoding failed"""
+        height, width = frame.shape[:2]
+        keyframe = (force_keyframe or self.reference is None or self.reference.shape != frame.shape
+                    or self.frames_since_keyframe >= self.keyframe_interval)
+        
+        if not keyframe:
+            changed = self.changed_tiles(frame)
+            if not changed.any():
+                self.frames_since_keyframe += 1
+                self.bytes_full += self.keyframe_size
+                return CODEC_UNCHANGED, b'', False
+            # When most of the view moves a keyframe is cheaper than the tiles
+            keyframe = changed.mean() > self.max_changed_ratio
+        
+        if keyframe:
+            buffer = self.jpeg(frame)
+            if buffer is None:
+                return CODEC_JPEG, None, True
+            self.reference = frame.copy()
+            self.reference_sequence = sequence
+            self.frames_since_keyframe = 0
+            self.keyframe_size = len(buffer)
+            self.bytes_sent += len(buffer)
+            self.bytes_full += len(buffer)
+            return CODEC_JPEG, buffer, True
+        
+        # Horizontal runs of changed tiles become one JPEG each
+        size = self.tile_size
+        tiles = []
+        for row in np.flatnonzero(changed.any(axis=1)):
+            columns = np.flatnonzero(changed[row])
+            breaks = np.flatnonzero(np.diff(columns) > 1)
+            starts = np.concatenate(([columns[0]], columns[breaks + 1]))
+            ends = np.concatenate((columns[breaks], [columns[-1]]))
+            y = int(row) * size
+            h = min(y + size, height) - y
+            for start, end in zip(starts, ends):
+                x = int(start) * size
+                w = min((int(end) + 1) * size, width) - x
+                buffer = self.jpeg(frame[y:y + h, x:x + w])
+                if buffer is None:
+                    return CODEC_DELTA, None, False
+                tiles.append((x, y, w, h, buffer))
+        
+        # The reference only moves on once the whole delta is encoded: a dropped delta leaves it as the clients have it
+        for x, y, w, h, _ in tiles:
+            self.reference[y:y + h, x:x + w] = frame[y:y + h, x:x + w]
+        payload = pack_delta(width, height, self.reference_sequence, tiles)
+        self.reference_sequence = sequence
+        self.frames_since_keyframe += 1
+        self.bytes_sent += len(payload)
+        self.bytes_full += self.keyframe_size
+        return CODEC_DELTA, payload, False
+    
+    def saved_ratio(self):
+        return 1.0 - self.bytes_sent / self.bytes_full if self.bytes_full else 0.0
+
+class LatestFrame:
+    """Single-slot mailbox between pipeline stages: a new frame replaces any unread one"""
+    
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.item = None
+        self.closed = False
+        self.overwritten = 0
+    
+    def put(self, sequence, timestamp, frame):
+        """Stores a frame; returns True when the slot was empty (a new pending frame)"""
+        with self.condition:
+            was_empty = self.item is None
+            if not was_empty:
+                self.overwritten += 1
+            self.item = (sequence, timestamp, frame)
+            self.condition.notify()
+            return was_empty
+    
+    def take(self, timeout=None):
+        """Waits for a frame and removes it from the slot; None when closed or timed out"""
+        with self.condition:
+            if self.item is None and not self.closed:
+                self.condition.wait(timeout)
+            item, self.item = self.item, None
+            return item
+    
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+class ClientConnection:
+    """A connected viewer with its own bounded send queue and writer thread"""
+    
+    def __init__(self, client_socket, addr, profile, streams, video=True, detections=False, shm=False,
+                 max_queue=3, send_timeout=10.0):
+        self.socket = client_socket
+        self.addr = addr
+        self.profile = profile
+        self.streams = frozenset(streams)
+        self.video = video
+        self.detections = detections
+        self.shm = shm
+        # In motion-delta mode a client can only start (or resume after a drop) on a keyframe
+        self.awaiting_keyframe = set(streams) if video else set()
+        self.max_queue = max_queue
+        self.queue = collections.deque()
+        self.condition = threading.Condition()
+        self.connected = True
+        
+        # Per-client counters
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        
+        # A stalled viewer only blocks its own writer, and only up to the timeout
+        self.socket.settimeout(send_timeout)
+        self.writer_thread = threading.Thread(target=self.write_loop)
+        self.writer_thread.daemon = True
+        # A shared-memory client may get nothing on its socket, only a read notices it leaving
+        self.reader_thread = threading.Thread(target=self.read_loop) if shm else None
+        if self.reader_thread:
+            self.reader_thread.daemon = True
+    
+    def start(self):
+        self.writer_thread.start()
+        if self.reader_thread:
+            self.reader_thread.start()
+    
+    def enqueue(self, message, channel=0, keyframe=True, dependent=False):
+        """Queues a message, dropping the oldest one when the queue is full.
+        
+        The channel is the stream id for video and ('detections', stream id) for detection
+        records. Deltas are only valid on top of the message before them: once a keyframe
+        or delta of a channel is dropped, that channel is skipped until its next keyframe.
+        """
+        with self.condition:
+            if not self.connected:
+                return False
+            if len(self.queue) >= self.max_queue:
+                dropped_channel, dropped_keyframe, dropped_dependent, _ = self.queue.popleft()
+                self.frames_dropped += 1
+                if dropped_keyframe or dropped_dependent:
+                    self.drop_until_keyframe(dropped_channel)
+            if keyframe:
+                self.awaiting_keyframe.discard(channel)
+            elif channel in self.awaiting_keyframe:
+                self.frames_dropped += 1
+                return True
+            self.queue.append((channel, keyframe, dependent, message))
+            self.condition.notify()
+        return True
+    
+    def drop_until_keyframe(self, channel):
+        """Discards the queued messages of a channel up to its next keyframe (lock held)"""
+        kept = collections.deque()
+        skipping = True
+        for item in self.queue:
+            if skipping and item[0] == channel:
+                if not item[1]:
+                    self.frames_dropped += 1
+                    continue
+                skipping = False
+            kept.append(item)
+        self.queue = kept
+        if skipping:
+            self.awaiting_keyframe.add(channel)
+    
+    def write_loop(self):
+        try:
+            while True:
+                with self.condition:
+                    while self.connected and not self.queue:
+                        self.condition.wait()
+                    if not self.connected:
+                        break
+                    message = self.queue.popleft()[3]
+                self.send_message(message)
+                self.frames_sent += 1
+        except OSError:
+            pass
+        finally:
+            self.close()
+    
+    def read_loop(self):
+        """Waits for the client to close its socket (it sends nothing after the handshake)"""
+        while self.connected:
+            try:
+                if not self.socket.recv(4096):
+                    break
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+        self.close()
+    
+    def send_message(self, message):
+        # send() may write only part of the buffer, keep going until it is all out
+        view = memoryview(message)
+        while view:
+            sent = self.socket.send(view)
+            self.bytes_sent += sent
+            view = view[sent:]
+    
+    def close(self):
+        with self.condition:
+            if not self.connected:
+                return
+            self.connected = False
+            self.queue.clear()
+            self.condition.notify()
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        print(f"Client {self.addr} disconnected ({self.stats()})")
+    
+    def stats(self):
+        kinds = '+'.join(kind for kind, wanted in (('video', self.video), ('detections', self.detections)) if wanted)
+        return f"profile={self.profile} streams={sorted(self.streams)} {kinds or 'nothing'} sent={self.frames_sent} dropped={self.frames_dropped} bytes={self.bytes_sent}"
+
+class StreamPipeline:
+    """One source shared by every subscriber: a single capture thread feeding latest-frame slots"""
+    
+    def __init__(self, stream_id, source):
+        self.stream_id = stream_id
+        self.source = source
+        self.encode_slot = LatestFrame()
+        self.preview_slot = LatestFrame()
+        self.detect_slot = LatestFrame()
+        self.last_published = {}
+        self.delta_encoders = {}
+        # Raw frame ring for same-host clients, created once one of them subscribes
+        self.ring = None
+        self.ring_warned = False
+        self.started = False
+        self.active = False
+        self.frames_captured = 0
+        self.frames_encoded = 0
+        self.frames_published = 0
+        self.frames_stale = 0
+        self.encode_time = 0.0
+        self.frames_detected = 0
+        self.detect_time = 0.0
+        self.last_stats = (time.time(), 0, 0, 0, 0.0)
+        self.last_detect_stats = (0, 0.0)
+    
+    def stats(self):
+        """Capture vs published fps since the previous call"""
+        now = time.time()
+        last_time, last_captured, last_encoded, last_published, last_encode_time = self.last_stats
+        elapsed = max(now - last_time, 1e-6)
+        captured = self.frames_captured - last_captured
+        encoded = self.frames_encoded - last_encoded
+        published = self.frames_published - last_published
+        encode_ms = 1000 * (self.encode_time - last_encode_time) / encoded if encoded else 0.0
+        self.last_stats = (now, self.frames_captured, self.frames_encoded, self.frames_published, self.encode_time)
+        text = (f"capture {captured / elapsed:.1f} fps | published {published / elapsed:.1f} fps | "
+                f"encode {encode_ms:.1f} ms/frame | superseded {self.encode_slot.overwritten} | stale {self.frames_stale}")
+        for profile_name, encoder in self.delta_encoders.items():
+            text += f" | delta {profile_name} saved {100 * encoder.saved_ratio():.1f}%"
+        detected = self.frames_detected - self.last_detect_stats[0]
+        if detected:
+            detect_ms = 1000 * (self.detect_time - self.last_detect_stats[1]) / detected
+            text += f" | detect {detected / elapsed:.1f} fps ({detect_ms:.1f} ms latency)"
+        self.last_detect_stats = (self.frames_detected, self.detect_time)
+        if self.ring is not None:
+            text += f" | shm {self.ring.frames_written} frames"
+        return text
 
 class VideoStreamServer:
-    def __init__(self, host='0.0.0.0', port=8485):
+    def __init__(self, host='0.0.0.0', port=8485, sources=None, profiles=None, default_profile='full',
+                 headless=False, encoder_threads=None, delta_keyframe_interval=None,
+                 detect_weights=None, detect_conf=0.25, detect_batch=4, detect_profile=None,
+                 shared_memory=True, stats_interval=5.0, handshake_timeout=5.0):
         self.host = host
         self.port = port
+        self.headless = headless
+        # Local clients may read raw frames from shared memory instead of JPEG over TCP
+        self.shm_enabled = shared_memory
+        # Motion-delta mode is enabled by giving a keyframe interval (in frames)
+        self.delta_keyframe_interval = delta_keyframe_interval
+        # Server-side inference: one YOLO pass per frame shared by every detections subscriber
+        self.detect_weights = detect_weights
+        self.detect_conf = detect_conf
+        self.detect_batch = detect_batch
+        self.detect_profile = detect_profile
+        self.detector = None
+        self.scheduler = None
+        self.class_names = []
+        self.encoder_threads = encoder_threads or max(1, min(4, (os.cpu_count() or 2) - 1))
+        self.profiles = {profile.name: profile for profile in (profiles or DEFAULT_PROFILES)}
+        self.default_profile = default_profile if default_profile in self.profiles else next(iter(self.profiles))
+        self.handshake_timeout = handshake_timeout
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen(5)
         self.clients = []
+        self.clients_lock = threading.Lock()
+        self.stats_interval = stats_interval
         self.running = False
         
+        # One pipeline per source, multiplexed on the same port by stream id
+        self.streams = [StreamPipeline(stream_id, open_source(spec) if isinstance(spec, str) else spec)
+                        for stream_id, spec in enumerate(sources or ['0'])]
+        self.streams_lock = threading.Lock()
+        # Stream ids with a pending frame, consumed by the shared encoder pool
+        self.ready_streams = queue.Queue()
+        self.detect_ready = queue.Queue()
+        self.publish_lock = threading.Lock()
+    
     def start(self):
+        # Load the model before accepting anyone, so detections can be granted in the handshake
+        if self.detect_weights:
+            self.load_detector()
         self.running = True
         print(f"Video stream server started on {self.host}:{self.port}")
+        for stream in self.streams:
+            print(f"  stream {stream.stream_id}: {stream.source.name}")
         print("Waiting for client connections...")
         
         # Start accepting clients in a separate thread
@@ -25,73 +402,384 @@ class VideoStreamServer:
         accept_thread.daemon = True
         accept_thread.start()
         
-        # Start video streaming
-        self.stream_video()
+        # Encoders are shared by all streams, captures start on first subscription
+        for _ in range(self.encoder_threads):
+            encoder_thread = threading.Thread(target=self.encode_loop)
+            encoder_thread.daemon = True
+            encoder_thread.start()
+        
+        if self.detector is not None:
+            detect_thread = threading.Thread(target=self.detect_loop)
+            detect_thread.daemon = True
+            detect_thread.start()
+        
+        # The calling thread shows the preview (or just reports in headless mode)
+        if self.headless:
+            self.report_loop()
+        else:
+            self.preview_loop()
+        self.stop()
     
     def accept_clients(self):
         while self.running:
             try:
                 client_socket, addr = self.server_socket.accept()
-                print(f"Client connected from {addr}")
-                self.clients.append(client_socket)
-            except:
+            except OSError:
                 break
+            print(f"Client connected from {addr}")
+            handshake_thread = threading.Thread(target=self.handshake, args=(client_socket, addr))
+            handshake_thread.daemon = True
+            handshake_thread.start()
     
-    def stream_video(self):
-        cap = cv2.VideoCapture(0)  # Use default camera (0)
+    def handshake(self, client_socket, addr):
+        """Reads the client hello and subscribes it to the requested profile and streams"""
+        try:
+            client_socket.settimeout(self.handshake_timeout)
+            header, payload = FrameReceiver(client_socket, initial_size=4096).receive()
+            if header.codec != CODEC_CONTROL:
+                raise ProtocolError("Expected a hello message")
+            hello = decode_control(payload)
+            profile = hello.get('profile', self.default_profile)
+            if profile not in self.profiles:
+                print(f"Client {addr} asked for unknown profile {profile!r}, using {self.default_profile!r}")
+                profile = self.default_profile
+            streams = [int(stream_id) for stream_id in hello.get('streams', [0])
+                       if 0 <= int(stream_id) < len(self.streams)]
+            video = bool(hello.get('video', True))
+            detections = bool(hello.get('detections', False)) and self.detector is not None
+            shm = video and bool(hello.get('shm', False)) and self.shm_enabled
+            client_socket.sendall(encode_control({
+                'profile': profile,
+                'profiles': list(self.profiles),
+                'streams': streams,
+                'available_streams': [{'id': s.stream_id, 'name': s.source.name} for s in self.streams],
+                'video': video,
+                'detections': detections,
+                'class_names': self.class_names if detections else [],
+                'shm': {str(stream_id): ring_name(self.port, stream_id) for stream_id in streams} if shm else {},
+            }))
+        except (OSError, ProtocolError, ValueError, TypeError) as e:
+            print(f"Handshake with {addr} failed: {e}")
+            client_socket.close()
+            return
         
-        if not cap.isOpened():
-            print("Error: Could not open camera")
+        # Shared-memory clients take their video from the ring, the socket only carries detections
+        client = ClientConnection(client_socket, addr, profile, streams, video and not shm, detections, shm)
+        with self.clients_lock:
+            self.clients.append(client)
+        client.start()
+        for stream_id in streams:
+            self.ensure_capture(self.streams[stream_id])
+        transport = " over shared memory" if shm else ""
+        print(f"Client {addr} subscribed to streams {streams} with profile '{profile}'{transport}")
+    
+    def ensure_capture(self, stream):
+        """Starts the capture thread of a stream the first time somebody subscribes to it"""
+        with self.streams_lock:
+            if stream.started:
+                return
+            stream.started = True
+        capture_thread = threading.Thread(target=self.capture_loop, args=(stream,))
+        capture_thread.daemon = True
+        capture_thread.start()
+    
+    def subscribed_profiles(self, stream_id):
+        with self.clients_lock:
+            return {client.profile for client in self.clients if client.video and stream_id in client.streams}
+    
+    def has_detection_subscribers(self, stream_id):
+        with self.clients_lock:
+            return any(client.detections and stream_id in client.streams for client in self.clients)
+    
+    def has_shm_subscribers(self, stream_id):
+        with self.clients_lock:
+            # A shared-memory client without detections is never given a message, so deliver() cannot drop it
+            self.clients = [client for client in self.clients if client.connected]
+            return any(client.shm and stream_id in client.streams for client in self.clients)
+    
+    def keyframe_requested(self, stream_id, profile):
+        """True when a subscriber of the stream/profile cannot use deltas until the next keyframe"""
+        with self.clients_lock:
+            return any(client.video and client.profile == profile and stream_id in client.awaiting_keyframe
+                       for client in self.clients)
+    
+    def publish(self, stream_id, profile, message, keyframe=True, dependent=False):
+        """Hands a message to every matching client queue without ever blocking on the network"""
+        with self.clients_lock:
+            clients = [client for client in self.clients
+                       if client.video and client.profile == profile and stream_id in client.streams]
+        self.deliver(clients, message, stream_id, keyframe, dependent)
+    
+    def publish_detections(self, stream_id, message):
+        with self.clients_lock:
+            clients = [client for client in self.clients if client.detections and stream_id in client.streams]
+        self.deliver(clients, message, ('detections', stream_id))
+    
+    def deliver(self, clients, message, channel, keyframe=True, dependent=False):
+        disconnected = [client for client in clients
+                        if not client.enqueue(message, channel, keyframe, dependent)]
+        if disconnected:
+            with self.clients_lock:
+                for client in disconnected:
+                    if client in self.clients:
+                        self.clients.remove(client)
+    
+    def print_client_stats(self):
+        with self.clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            print(f"Client {client.addr}: {client.stats()}")
+    
+    def capture_loop(self, stream):
+        """Captures a stream until its source fails or ends; the next subscription starts it again"""
+        try:
+            self.capture(stream)
+        finally:
+            with self.streams_lock:
+                stream.active = False
+                stream.started = False
+    
+    def capture(self, stream):
+        source = stream.source
+        if not source.open():
+            print(f"Error: Could not open source {source.name}")
             return
         
-        print("Camera opened successfully")
+        print(f"Source {source.name} opened successfully")
+        stream.active = True
         
         while self.running:
-            ret, frame = cap.read()
+            # Sources stamp their frames, so the wire carries the original timestamp and sequence
+            ret, frame, timestamp, sequence = source.read()
             if not ret:
-                print("Error: Could not read frame")
+                print(f"Error: Could not read frame from {source.name}")
                 break
             
-            # Encode frame
-            _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
-            message = pickle.dumps(buffer)
-            
-            # Send to all connected clients
-            clients_to_remove = []
-            for client in self.clients:
-                try:
-                    # Send message size first
-                    message_size = struct.pack("L", len(message))
-                    client.send(message_size + message)
-                except:
-                    clients_to_remove.append(client)
+            stream.frames_captured += 1
+            if stream.encode_slot.put(sequence, timestamp, frame):
+                self.ready_streams.put(stream)
+            if self.has_shm_subscribers(stream.stream_id):
+                self.write_shared(stream, sequence, timestamp, frame)
+            if not self.headless:
+                stream.preview_slot.put(sequence, timestamp, frame)
+            if self.detector is not None and self.has_detection_subscribers(stream.stream_id):
+                if stream.detect_slot.put(sequence, timestamp, frame):
+                    self.detect_ready.put(stream)
+        
+        source.release()
+    
+    def write_shared(self, stream, sequence, timestamp, frame):
+        """Copies the raw frame into the stream's shared-memory ring, sized on the first frame"""
+        if stream.ring is not None and frame.nbytes > stream.ring.slot_capacity:
+            # The source changed resolution: the clients see the old ring retired and attach the new one
+            stream.ring.retire()
+            stream.ring.close()
+            stream.ring = None
+        if stream.ring is None:
+            stream.ring = SharedFrameRing.create(ring_name(self.port, stream.stream_id), frame.shape)
+            print(f"Stream {stream.stream_id} shared at {stream.ring.shm.name} for {frame.shape} frames")
+        if not stream.ring.write(sequence, timestamp, frame) and not stream.ring_warned:
+            stream.ring_warned = True
+            print(f"Stream {stream.stream_id}: {frame.dtype} frames cannot go through the shared ring")
+    
+    def encode_loop(self):
+        """Encoder worker: takes the newest frame of whichever stream is ready"""
+        while self.running:
+            try:
+                stream = self.ready_streams.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            item = stream.encode_slot.take(timeout=0)
+            if item is None:
+                continue
+            sequence, timestamp, frame = item
             
-            # Remove disconnected clients
-            for client in clients_to_remove:
-                self.clients.remove(client)
-                client.close()
-                print("Client disconnected")
+            # Encode each subscribed profile once and fan out to its writers
+            start = time.perf_counter()
+            published = False
+            for profile_name in self.subscribed_profiles(stream.stream_id):
+                if self.delta_keyframe_interval:
+                    published = self.publish_delta(stream, profile_name, sequence, timestamp, frame) or published
+                    continue
+                buffer = self.profiles[profile_name].encode(frame)
+                if buffer is None:
+                    continue
+                message = encode_frame(CODEC_JPEG, stream.stream_id, sequence, timestamp, buffer)
+                
+                # Workers finish out of order: never send a frame older than one already sent
+                with self.publish_lock:
+                    if sequence <= stream.last_published.get(profile_name, -1):
+                        stream.frames_stale += 1
+                        continue
+                    stream.last_published[profile_name] = sequence
+                    self.publish(stream.stream_id, profile_name, message)
+                published = True
             
-            # Show local preview (optional)
-            cv2.imshow('Camera Server', frame)
+            with self.publish_lock:
+                stream.encode_time += time.perf_counter() - start
+                stream.frames_encoded += 1
+                if published:
+                    stream.frames_published += 1
+    
+    def publish_delta(self, stream, profile_name, sequence, timestamp, frame):
+        """Motion-delta publishing: deltas chain on each other, so encoding is serialized per profile"""
+        profile = self.profiles[profile_name]
+        resized = profile.resize(frame)
+        with self.publish_lock:
+            encoder = stream.delta_encoders.get(profile_name)
+            if encoder is None:
+                encoder = DeltaEncoder(profile.quality, keyframe_interval=self.delta_keyframe_interval)
+                stream.delta_encoders[profile_name] = encoder
+        
+        with encoder.lock:
+            if sequence <= stream.last_published.get(profile_name, -1):
+                stream.frames_stale += 1
+                return False
+            force = self.keyframe_requested(stream.stream_id, profile_name)
+            codec, payload, keyframe = encoder.encode(resized, sequence, force_keyframe=force)
+            if payload is None:
+                return False
+            stream.last_published[profile_name] = sequence
+            message = encode_frame(codec, stream.stream_id, sequence, timestamp, payload)
+            self.publish(stream.stream_id, profile_name, message, keyframe, codec == CODEC_DELTA)
+        return True
+    
+    def load_detector(self):
+        # Loaded through the registry so a streaming-only server never imports torch/ultralytics
+        self.detector = model_registry.get(self.detect_weights)
+        names = self.detector.names
+        self.class_names = [names[i] for i in range(len(names))]
+        # Frames of several streams share one forward pass
+        self.scheduler = model_registry.scheduler(self.detect_weights, max_batch=self.detect_batch,
+                                                  max_wait=0.01, conf=self.detect_conf)
+        if self.detect_profile:
+            profiles = load_profiles()[0]
+            if self.detect_profile not in profiles:
+                raise ValueError(f"Unknown inference profile {self.detect_profile!r} (known: {', '.join(profiles)})")
+            self.scheduler.set_profile(profiles[self.detect_profile])
+        print(f"Server-side detection enabled with {self.detect_weights} "
+              f"({getattr(self.detector, 'backend', 'torch')} backend)"
+              + (f" (profile {self.detect_profile})" if self.detect_profile else ""))
+    
+    def detect_loop(self):
+        """Submits the newest frame of each stream to the batched detector"""
+        while self.running:
+            try:
+                stream = self.detect_ready.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            item = stream.detect_slot.take(timeout=0)
+            if item is None:
+                continue
+            sequence, timestamp, frame = item
+            future = self.scheduler.submit(stream.stream_id, frame)
+            future.add_done_callback(functools.partial(self.publish_detection_result, stream, sequence,
+                                                       timestamp, frame.shape, time.perf_counter()))
+    
+    def publish_detection_result(self, stream, sequence, timestamp, shape, start, future):
+        """Scheduler callback: packs the columnar detections of one frame into a compact record"""
+        if future.cancelled():
+            return
+        try:
+            # Boxes are in capture coordinates, receivers rescale them to their rendition
+            detections = Detections.from_results(future.result(), frame_shape=shape[:2])
+        except Exception as e:
+            print(f"Detection failed on stream {stream.stream_id}: {e}")
+            return
+        payload = detections.to_payload()
+        stream.detect_time += time.perf_counter() - start
+        stream.frames_detected += 1
+        
+        message = encode_frame(CODEC_DETECTIONS, stream.stream_id, sequence, timestamp, payload)
+        self.publish_detections(stream.stream_id, message)
+    
+    def preview_loop(self):
+        last_report = time.time()
+        while self.running:
+            shown = False
+            for stream in self.streams:
+                item = stream.preview_slot.take(timeout=0)
+                if item is not None:
+                    cv2.imshow(f'Camera Server - {stream.source.name}', item[2])
+                    shown = True
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
-        
-        cap.release()
+            if not shown:
+                time.sleep(0.01)
+            if time.time() - last_report >= self.stats_interval:
+                self.print_stats()
+                last_report = time.time()
         cv2.destroyAllWindows()
-        self.stop()
+    
+    def report_loop(self):
+        while self.running:
+            time.sleep(self.stats_interval)
+            self.print_stats()
+    
+    def print_stats(self):
+        """Prints capture vs published fps per active stream, then per-client counters"""
+        for stream in self.streams:
+            if stream.active:
+                print(f"Stream {stream.stream_id} ({stream.source.name}): {stream.stats()}")
+        if self.scheduler is not None:
+            print(f"Detection: {self.scheduler.summary()}")
+        self.print_client_stats()
     
     def stop(self):
+        if not self.server_socket:
+            return
         self.running = False
-        for client in self.clients:
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        for stream in self.streams:
+            stream.encode_slot.close()
+            stream.preview_slot.close()
+        with self.clients_lock:
+            clients = list(self.clients)
+            self.clients = []
+        for client in clients:
             client.close()
+        for stream in self.streams:
+            if stream.ring is not None:
+                stream.ring.close()
         self.server_socket.close()
+        self.server_socket = None
         print("Server stopped")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Crowd camera stream server")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8485)
+    parser.add_argument('--source', action='append', dest='sources',
+                        help="Camera index, stream URL, video file (?rate=native|max|N&loop=1) "
+                             "or synthetic[:WxH][?fps=30&density=100] (repeatable)")
+    parser.add_argument('--headless', action='store_true', help="No preview window (no HighGUI calls)")
+    parser.add_argument('--encoders', type=int, default=None, help="Number of JPEG encoder threads")
+    parser.add_argument('--delta', type=int, default=None, metavar='KEYFRAME_INTERVAL',
+                        help="Motion-delta mode: send changed tiles, with a full keyframe every N frames")
+    parser.add_argument('--detect', nargs='?', const='yolov8n.pt', default=None, metavar='WEIGHTS',
+                        help="Run YOLO on the server and offer detections-only subscriptions")
+    parser.add_argument('--detect-batch', type=int, default=4,
+                        help="Maximum number of streams batched in one detection pass")
+    parser.add_argument('--inference-profile', default=None,
+                        help="Named profile from inference_profiles.json for server-side detection")
+    parser.add_argument('--backend', choices=('torch', 'onnx', 'openvino'), default=None,
+                        help="CPU inference backend for --detect (exported once and cached; falls back to torch)")
+    parser.add_argument('--threads', type=int, default=None, help="Inference runtime threads")
+    parser.add_argument('--no-shm', dest='shared_memory', action='store_false',
+                        help="Do not offer the shared-memory frame ring to local clients")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    server = VideoStreamServer()
+    args = parse_args()
+    model_registry.configure(args.backend, args.threads)
+    server = VideoStreamServer(args.host, args.port, sources=args.sources,
+                               headless=args.headless, encoder_threads=args.encoders,
+                               delta_keyframe_interval=args.delta, detect_weights=args.detect,
+                               detect_batch=args.detect_batch, detect_profile=args.inference_profile,
+                               shared_memory=args.shared_memory)
     try:
         server.start()
     except KeyboardInterrupt:
         print("\nShutting down server...")
-        server.stop() 
\ No newline at end of file
+        server.stop()
@@ -0,0 +1,150 @@
+import numpy as np
+from stream_protocol import pack_detections, unpack_detections
+
+# Columnar detection results shared by every front end. Instead of walking the
+# ultralytics Boxes one box at a time (a tensor index and a device transfer per
+# field), a frame's results are copied to NumPy once and then filtered with
+# boolean masks and class-id lookup arrays.
+
+
+def class_name_list(names):
+    """ultralytics names ({id: name}) or any sequence -> list indexed by class id"""
+    if isinstance(names, dict):
+        return [names[i] for i in range(len(names))]
+    return list(names)
+
+
+def box_iou(a, b):
+    """(N, 4) x (M, 4) xyxy boxes -> (N, M) intersection over union"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return intersection / np.maximum(area_a[:, None] + area_b[None, :] - intersection, 1e-9)
+
+
+class ClassTable:
+    """Lookup arrays indexed by class id, built once per model instead of once per box"""
+
+    def __init__(self, names):
+        self.names = class_name_list(names)
+        self.ids = {name: class_id for class_id, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def mask(self, wanted):
+        """Boolean array: True for the class ids whose name is in `wanted`"""
+        lookup = np.zeros(len(self.names), dtype=bool)
+        lookup[[self.ids[name] for name in wanted if name in self.ids]] = True
+        return lookup
+
+    def thresholds(self, per_class, default=np.inf):
+        """Float array of per-class confidence thresholds; classes not listed use `default`
+        (infinite by default, i.e. never kept)"""
+        lookup = np.full(len(self.names), default, dtype=np.float32)
+        for name, threshold in per_class.items():
+            if name in self.ids:
+                lookup[self.ids[name]] = threshold
+        return lookup
+
+    def labels(self, per_class, default=''):
+        """Object array mapping class ids to display labels"""
+        lookup = np.full(len(self.names), default, dtype=object)
+        for name, label in per_class.items():
+            if name in self.ids:
+                lookup[self.ids[name]] = label
+        return lookup
+
+
+class Detections:
+    """Detections of one frame as contiguous columns.
+
+    boxes: (N, 4) float32 xyxy in frame pixels, scores: (N,) float32,
+    class_ids: (N,) int64, plus the class names and the frame metadata.
+    """
+
+    __slots__ = ('boxes', 'scores', 'class_ids', 'names', 'frame_shape', 'source_id', 'sequence', 'timestamp')
+
+    def __init__(self, boxes, scores, class_ids, names=(), frame_shape=None, source_id=None,
+                 sequence=None, timestamp=None):
+        self.boxes = np.ascontiguousarray(boxes, dtype=np.float32).reshape(-1, 4)
+        self.scores = np.ascontiguousarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.ascontiguousarray(class_ids, dtype=np.int64).reshape(-1)
+        self.names = names
+        self.frame_shape = frame_shape
+        self.source_id = source_id
+        self.sequence = sequence
+        self.timestamp = timestamp
+
+    @classmethod
+    def empty(cls, names=(), **metadata):
+        return cls(np.empty((0, 4)), np.empty(0), np.empty(0), names, **metadata)
+
+    @classmethod
+    def from_results(cls, result, **metadata):
+        """Builds the columns from one ultralytics Results with a single device-to-host copy"""
+        names = class_name_list(result.names)
+        metadata.setdefault('frame_shape', tuple(result.orig_shape))
+        if result.boxes is None or len(result.boxes) == 0:
+            return cls.empty(names, **metadata)
+        # Boxes.data is (N, 6): x1, y1, x2, y2, confidence, class (a track id column may precede them).
+        # A tensor for the torch backend, already a NumPy array for the exported ones (backends.py)
+        data = result.boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        return cls(data[:, :4], data[:, -2], data[:, -1], names, **metadata)
+
+    @classmethod
+    def from_payload(cls, payload, names=(), **metadata):
+        """Decodes a CODEC_DETECTIONS record (see stream_protocol.pack_detections)"""
+        width, height, boxes, class_ids, scores = unpack_detections(payload)
+        return cls(boxes, scores, class_ids, names, frame_shape=(height, width), **metadata)
+
+    def to_payload(self):
+        height, width = self.frame_shape[:2]
+        return pack_detections(width, height, self.boxes, self.class_ids, self.scores)
+
+    def __len__(self):
+        return len(self.scores)
+
+    def select(self, mask):
+        """Subset for a boolean mask or index array; metadata is kept"""
+        return Detections(self.boxes[mask], self.scores[mask], self.class_ids[mask], self.names,
+                          self.frame_shape, self.source_id, self.sequence, self.timestamp)
+
+    def of_classes(self, class_mask):
+        """Mask of the detections whose class is set in a ClassTable.mask() array"""
+        return class_mask[self.class_ids]
+
+    def above(self, thresholds):
+        """Mask of the detections above their class threshold (ClassTable.thresholds() array)"""
+        return self.scores > thresholds[self.class_ids]
+
+    def with_boxes(self, boxes):
+        """Same detections (scores, classes, metadata) at new box positions"""
+        return Detections(boxes, self.scores, self.class_ids, self.names, self.frame_shape,
+                          self.source_id, self.sequence, self.timestamp)
+
+    def scaled(self, frame_shape):
+        """Same detections with the boxes mapped onto a frame of another size"""
+        scale = np.array([frame_shape[1] / self.frame_shape[1], frame_shape[0] / self.frame_shape[0]] * 2,
+                         dtype=np.float32)
+        return Detections(self.boxes * scale, self.scores, self.class_ids, self.names, tuple(frame_shape[:2]),
+                          self.source_id, self.sequence, self.timestamp)
+
+    def int_boxes(self):
+        """Boxes as int pixel coordinates for drawing and ROI slicing"""
+        return self.boxes.astype(np.int32)
+
+    def centroids(self):
+        return np.column_stack(((self.boxes[:, 0] + self.boxes[:, 2]) / 2, (self.boxes[:, 1] + self.boxes[:, 3]) / 2))
+
+    def foot_points(self):
+        """Bottom centre of each box: where a person stands on the ground"""
+        return np.column_stack(((self.boxes[:, 0] + self.boxes[:, 2]) / 2, self.boxes[:, 3]))
+
+    def class_names(self):
+        """Class name of every detection (a list, for labelling)"""
+        return [self.names[class_id] for class_id in self.class_ids]
@@ -1,15 +1,31 @@
+from startup import StartupTimer
+# Chronométrage du démarrage (imports, interface, modèle, préchauffage, première image)
+chrono_demarrage = StartupTimer('gestion_foule')
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
-from PIL import Image, ImageTk
 import numpy as np
 import threading
 import time
 from datetime import datetime
 import json
 import os
-from ultralytics import YOLO
-import pygame
+from inference import model_registry
+from detections import ClassTable, Detections
+from inference_profiles import load_profiles
+from propagation import AdaptiveCadence, BoxPropagator
+from tiling import TiledInference
+from heatmap import DensityHeatmap
+from zones import ZoneConfig
+
+# Objets potentiellement dangereux et seuils de confiance par classe
+OBJETS_DANGEREUX = ['knife', 'scissors', 'bottle', 'baseball bat']
+SEUIL_PERSONNE = 0.5
+SEUIL_OBJET_DANGEREUX = 0.3
+# Tuilage de l'image pleine résolution (libellé de l'interface -> mode de TiledInference)
+MODES_TUILAGE = {'désactivé': None, 'toutes les tuiles': 'all', 'zones denses': 'dense'}
+# Importé en arrière-plan au démarrage (voir initialiser_son); PIL l'est à la première image
+pygame = None
 
 class SystemeGestionFoule:
     def __init__(self, root):
@@ -21,26 +37,49 @@ class SystemeGestionFoule:
         # Variables de contrôle
         self.video_active = False
         self.cap = None
-        self.model_yolo = None
-        self.model_weapons = None
+        self.ordonnanceur = None
+        self.ordonnanceur_armes = None
+        self.source_video = None
+        
+        # Poids des modèles: un seul passage quand personnes et armes utilisent le même fichier
+        self.poids_personnes = 'yolov8n.pt'
+        self.poids_armes = 'yolov8n.pt'  # Remplacer par modèle d'armes
+        # Tableaux de seuils indexés par id de classe, construits une fois par modèle
+        self.seuils_par_modele = {}
+        # Profils d'inférence (taille d'entrée, classes, seuils...) modifiables sans arrêter la vidéo
+        self.profils, self.nom_profil = load_profiles()
+        
+        # Cadence de détection: YOLO toutes les N images, boîtes propagées par flux optique entre deux
+        self.fps_cible = 25.0
+        self.cadence = AdaptiveCadence(self.fps_cible, fixed_interval=1)
+        self.propagateur = BoxPropagator()
+        # Inférence par tuiles sur l'image pleine résolution (None = image réduite à 640x480)
+        self.tuilage = None
+        # Carte de densité des personnes (accumulée en continu, superposée à la demande)
+        self.carte_densite = DensityHeatmap()
+        self.afficher_densite = False
         
         # Paramètres de détection
         self.seuil_foule_danger = 50  # Nombre de personnes considéré dangereux
         self.temps_surveillance = 10  # Secondes avant alarme
-        self.compteur_temps_foule = 0
+        self.compteur_temps_foule = None  # Début du dépassement du seuil global
         self.derniere_detection = time.time()
         
         # Compteurs
         self.nombre_personnes = 0
         self.historique_personnes = []
         self.alerte_foule_active = False
+        self.motif_alerte_foule = ""
         self.alerte_arme_active = False
-        
-        # Initialiser pygame pour les alarmes sonores
-        pygame.mixer.init()
+        # Zones de la caméra (zones.json): comptage, seuil et durée par zone
+        self.config_zones = ZoneConfig('default')
         
         self.creer_interface()
-        self.charger_modeles()
+        
+        # La fenêtre s'affiche tout de suite: son, modèles et préchauffage se chargent en arrière-plan
+        self.premiere_image_mesuree = False
+        self.root.after(0, lambda: chrono_demarrage.mark('ui'))
+        threading.Thread(target=self.preparer_en_arriere_plan, daemon=True).start()
         
     def creer_interface(self):
         # Titre principal
@@ -88,7 +127,12 @@ class SystemeGestionFoule:
         # Dashboard
         dashboard_label = tk.Label(right_frame, text="📊 TABLEAU DE BORD", 
                                   font=('Arial', 16, 'bold'), fg='white', bg='#34495e')
-        dashboard_label.pack(pady=(10, 20))
+        dashboard_label.pack(pady=(10, 5))
+        
+        # Indicateur de disponibilité du modèle (chargé en arrière-plan)
+        self.label_modele = tk.Label(right_frame, text="⏳ Modèle: chargement...", 
+                                    font=('Arial', 10, 'bold'), fg='#f39c12', bg='#34495e')
+        self.label_modele.pack(pady=(0, 10))
         
         # Compteur de personnes
         self.compteur_frame = tk.Frame(right_frame, bg='#2ecc71', relief='raised', bd=3)
@@ -162,28 +206,110 @@ class SystemeGestionFoule:
         temps_entry.pack(anchor='w', pady=2)
         temps_entry.bind('<Return>', self.mettre_a_jour_temps)
         
+        # Profil d'inférence
+        profil_frame = tk.Frame(right_frame, bg='#34495e')
+        profil_frame.pack(pady=5, padx=20, fill='x')
+        
+        tk.Label(profil_frame, text="Profil d'inférence:", 
+                font=('Arial', 10), fg='white', bg='#34495e').pack(anchor='w')
+        
+        self.profil_var = tk.StringVar(value=self.nom_profil)
+        profil_combo = ttk.Combobox(profil_frame, textvariable=self.profil_var, 
+                                    values=list(self.profils), state='readonly', width=18)
+        profil_combo.pack(anchor='w', pady=2)
+        profil_combo.bind('<<ComboboxSelected>>', self.changer_profil)
+        
+        # Cadence de détection adaptative
+        cadence_frame = tk.Frame(right_frame, bg='#34495e')
+        cadence_frame.pack(pady=5, padx=20, fill='x')
+        
+        self.cadence_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(cadence_frame, text="Cadence adaptative (FPS cible):", variable=self.cadence_var,
+                      command=self.changer_cadence, font=('Arial', 10), fg='white', bg='#34495e',
+                      selectcolor='#2c3e50', activebackground='#34495e').pack(side='left')
+        
+        self.fps_var = tk.StringVar(value=str(int(self.fps_cible)))
+        fps_entry = tk.Entry(cadence_frame, textvariable=self.fps_var, width=5)
+        fps_entry.pack(side='left', padx=5)
+        fps_entry.bind('<Return>', self.changer_cadence)
+        
+        # Tuilage haute résolution (foules denses et lointaines)
+        tuilage_frame = tk.Frame(right_frame, bg='#34495e')
+        tuilage_frame.pack(pady=5, padx=20, fill='x')
+        
+        tk.Label(tuilage_frame, text="Tuilage haute résolution:", 
+                font=('Arial', 10), fg='white', bg='#34495e').pack(side='left')
+        
+        self.tuilage_var = tk.StringVar(value='désactivé')
+        tuilage_combo = ttk.Combobox(tuilage_frame, textvariable=self.tuilage_var, 
+                                     values=list(MODES_TUILAGE), state='readonly', width=16)
+        tuilage_combo.pack(side='left', padx=5)
+        tuilage_combo.bind('<<ComboboxSelected>>', self.changer_tuilage)
+        
+        # Carte de densité (où la foule se concentre dans les tribunes)
+        densite_frame = tk.Frame(right_frame, bg='#34495e')
+        densite_frame.pack(pady=5, padx=20, fill='x')
+        
+        self.densite_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(densite_frame, text="Carte de densité", variable=self.densite_var,
+                      command=self.changer_densite, font=('Arial', 10), fg='white', bg='#34495e',
+                      selectcolor='#2c3e50', activebackground='#34495e').pack(side='left')
+        
         # Historique
         self.historique_text = tk.Text(right_frame, height=8, width=40, bg='#2c3e50', fg='white')
         self.historique_text.pack(pady=10, padx=20, fill='x')
         
     def charger_modeles(self):
-        """Charge les modèles YOLO"""
+        """Prépare les modèles YOLO (chaque fichier est chargé une seule fois, au premier usage)"""
         try:
             # Modèle pour détection de personnes (YOLO standard)
-            self.model_yolo = YOLO('yolov8n.pt')  # Modèle léger pour personnes
-            self.ajouter_log("✅ Modèle YOLO chargé avec succès")
+            self.ordonnanceur = model_registry.scheduler(self.poids_personnes, conf=0.5)
+            self.ajouter_log(f"✅ Modèle YOLO prêt ({self.poids_personnes})")
             
             # Pour la détection d'armes, vous devrez entraîner un modèle spécialisé
             # ou utiliser un modèle pré-entraîné pour objets dangereux
-            try:
-                self.model_weapons = YOLO('yolov8n.pt')  # Remplacer par modèle d'armes
-                self.ajouter_log("✅ Modèle détection d'armes chargé")
-            except:
-                self.ajouter_log("⚠️ Modèle détection d'armes non disponible")
+            if self.poids_armes == self.poids_personnes:
+                self.ordonnanceur_armes = None
+                self.ajouter_log("✅ Détection d'armes dans le même passage que les personnes")
+            else:
+                self.ordonnanceur_armes = model_registry.scheduler(self.poids_armes, conf=0.3)
+                self.ajouter_log(f"✅ Modèle détection d'armes prêt ({self.poids_armes})")
+            
+            self.appliquer_profil(self.nom_profil)
                 
         except Exception as e:
-            messagebox.showerror("Erreur", f"Erreur lors du chargement des modèles: {str(e)}")
-            self.ajouter_log(f"❌ Erreur chargement modèles: {str(e)}")
+            message = str(e)
+            self.root.after(0, lambda: messagebox.showerror("Erreur", f"Erreur lors du chargement des modèles: {message}"))
+            self.ajouter_log(f"❌ Erreur chargement modèles: {message}")
+    
+    def preparer_en_arriere_plan(self):
+        """Son, modèles et inférence de préchauffage, hors du thread de l'interface"""
+        self.initialiser_son()
+        self.charger_modeles()
+        try:
+            if not self.ordonnanceur:
+                raise RuntimeError("modèle non chargé")
+            for ordonnanceur in (self.ordonnanceur, self.ordonnanceur_armes):
+                if ordonnanceur:
+                    chargement, prechauffage = ordonnanceur.warmup()
+                    chrono_demarrage.record('model_load', chargement)
+                    chrono_demarrage.record('warmup', prechauffage)
+        except Exception as e:
+            self.root.after(0, lambda: self.label_modele.config(text="❌ Modèle: erreur", fg='#e74c3c'))
+            self.ajouter_log(f"❌ Erreur préchauffage du modèle: {str(e)}")
+            return
+        self.root.after(0, lambda: self.label_modele.config(text="✅ Modèle prêt", fg='#2ecc71'))
+        self.ajouter_log(f"🚀 Démarrage: {chrono_demarrage.summary()}")
+    
+    def initialiser_son(self):
+        """Importe et initialise pygame pour les alarmes sonores"""
+        global pygame
+        try:
+            import pygame as module_pygame
+            module_pygame.mixer.init()
+            pygame = module_pygame
+        except Exception as e:
+            self.ajouter_log(f"⚠️ Alarmes sonores indisponibles: {str(e)}")
     
     def choisir_fichier_video(self):
         """Sélectionne un fichier vidéo"""
@@ -209,6 +335,11 @@ class SystemeGestionFoule:
                 raise Exception("Impossible d'ouvrir la source vidéo")
             
             self.video_active = True
+            self.source_video = str(source)
+            self.reinitialiser_cadence()
+            self.carte_densite.reset()
+            self.config_zones = ZoneConfig(source)
+            self.ajouter_log(f"🗺️ Zones: {self.config_zones.summary()}")
             self.ajouter_log(f"📹 Détection démarrée - Source: {source}")
             
             # Démarrer le thread de traitement
@@ -224,6 +355,14 @@ class SystemeGestionFoule:
         self.video_active = False
         if self.cap:
             self.cap.release()
+        for ordonnanceur in (self.ordonnanceur, self.ordonnanceur_armes):
+            if ordonnanceur:
+                ordonnanceur.unregister(self.source_video)
+                self.ajouter_log(f"📊 Inférence: {ordonnanceur.summary()}")
+        if not self.cadence.fixed_interval:
+            self.ajouter_log(f"⏱️ Cadence: {self.cadence.summary()}")
+        if self.tuilage:
+            self.ajouter_log(f"🔲 Tuilage: {self.tuilage.summary()}")
         self.ajouter_log("⏹️ Détection arrêtée")
         self.video_label.config(text="📹 Sélectionnez une source vidéo")
     
@@ -233,13 +372,15 @@ class SystemeGestionFoule:
             ret, frame = self.cap.read()
             if not ret:
                 break
+            debut = time.perf_counter()
             
-            # Redimensionner pour l'affichage
+            # Redimensionner pour l'affichage (le tuilage détecte sur l'image pleine résolution)
+            frame_complet = frame
             frame = cv2.resize(frame, (640, 480))
             
             # Détection avec YOLO
-            if self.model_yolo:
-                frame_traite = self.detecter_objets(frame)
+            if self.ordonnanceur:
+                frame_traite = self.detecter_objets(frame, frame_complet)
             else:
                 frame_traite = frame
             
@@ -249,46 +390,50 @@ class SystemeGestionFoule:
             # Vérifier les alertes
             self.verifier_alertes()
             
-            time.sleep(0.03)  # ~30 FPS
+            ecoule = time.perf_counter() - debut
+            if self.ordonnanceur and not self.premiere_image_mesuree:
+                self.premiere_image_mesuree = True
+                chrono_demarrage.record('first_frame', ecoule)
+            self.cadence.frame_done(ecoule)
+            if self.cadence.fixed_interval:
+                time.sleep(0.03)  # ~30 FPS
+            else:
+                # Cadence adaptative: on attend seulement le reste de la période cible
+                time.sleep(max(0.0, self.cadence.frame_period - ecoule))
     
-    def detecter_objets(self, frame):
+    def detecter_objets(self, frame, frame_complet=None):
         """Détecte les personnes et objets dangereux"""
         frame_resultat = frame.copy()
         
         try:
-            # Détection des personnes
-            resultats = self.model_yolo(frame, conf=0.5)
+            # YOLO sur les images clés, propagation des boîtes par flux optique entre deux
+            cadence = self.cadence
+            debut = time.perf_counter()
+            detection = cadence.detect_now()
+            if detection:
+                personnes, armes = self.inferer(frame, frame_complet)
+                self.propagateur.reset(frame, personnes, armes)
+            else:
+                personnes, armes = self.propagateur.propagate(frame)
+            cadence.record_step(detection, time.perf_counter() - debut)
+            # Carte de densité: toutes les personnes, dessinée sous les boîtes
+            self.carte_densite.update(personnes.boxes, frame.shape)
+            if self.afficher_densite:
+                self.dessiner_densite(frame_resultat)
+            self.compter_zones(personnes, frame_resultat)
             
-            personnes_detectees = 0
-            armes_detectees = False
+            personnes_detectees = len(personnes)
+            armes_detectees = len(armes) > 0
             
-            for resultat in resultats:
-                boxes = resultat.boxes
-                if boxes is not None:
-                    for box in boxes:
-                        # Coordonnées de la boîte
-                        x1, y1, x2, y2 = map(int, box.xyxy[0])
-                        conf = float(box.conf[0])
-                        cls = int(box.cls[0])
-                        
-                        # Noms des classes COCO
-                        noms_classes = self.model_yolo.names
-                        nom_classe = noms_classes[cls]
-                        
-                        # Détecter les personnes
-                        if nom_classe == 'person' and conf > 0.5:
-                            personnes_detectees += 1
-                            cv2.rectangle(frame_resultat, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                            cv2.putText(frame_resultat, f'Personne {conf:.2f}', 
-                                       (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                        
-                        # Détecter objets potentiellement dangereux
-                        objets_dangereux = ['knife', 'scissors', 'bottle', 'baseball bat']
-                        if nom_classe in objets_dangereux and conf > 0.3:
-                            armes_detectees = True
-                            cv2.rectangle(frame_resultat, (x1, y1), (x2, y2), (0, 0, 255), 3)
-                            cv2.putText(frame_resultat, f'DANGER: {nom_classe}', 
-                                       (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            for (x1, y1, x2, y2), conf in zip(personnes.int_boxes().tolist(), personnes.scores.tolist()):
+                cv2.rectangle(frame_resultat, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.putText(frame_resultat, f'Personne {conf:.2f}', 
+                           (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+            
+            for (x1, y1, x2, y2), nom_classe in zip(armes.int_boxes().tolist(), armes.class_names()):
+                cv2.rectangle(frame_resultat, (x1, y1), (x2, y2), (0, 0, 255), 3)
+                cv2.putText(frame_resultat, f'DANGER: {nom_classe}', 
+                           (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
             # Mettre à jour les compteurs
             self.nombre_personnes = personnes_detectees
@@ -305,6 +450,9 @@ class SystemeGestionFoule:
             # Afficher les statistiques sur l'image
             cv2.putText(frame_resultat, f'Personnes: {personnes_detectees}', 
                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            if not cadence.fixed_interval:
+                cv2.putText(frame_resultat, f'Detection 1/{cadence.interval}', 
+                           (10, frame_resultat.shape[0] - 15), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             
             if armes_detectees:
                 cv2.putText(frame_resultat, 'ALERTE ARME DETECTEE!', 
@@ -318,8 +466,52 @@ class SystemeGestionFoule:
         
         return frame_resultat
     
+    def inferer(self, frame, frame_complet=None):
+        """Passe YOLO et filtrage: retourne les Detections (personnes, objets dangereux) retenues,
+        dans les coordonnées de `frame`"""
+        tuilage = self.tuilage if frame_complet is not None else None
+        if tuilage:
+            # Tuiles de l'image pleine résolution + image entière, dans un seul lot
+            images, fenetres = tuilage.crops(frame_complet)
+        else:
+            images = frame
+        
+        # Détection des personnes (et des armes si c'est le même modèle)
+        futur_personnes = self.ordonnanceur.submit(self.source_video, images)
+        futur_armes = self.ordonnanceur_armes.submit(self.source_video, images) if self.ordonnanceur_armes else None
+        if tuilage:
+            detections_personnes = tuilage.merge(futur_personnes.result(), fenetres, frame_complet.shape)
+            detections_armes = tuilage.merge(futur_armes.result(), fenetres, frame_complet.shape) if futur_armes \
+                else detections_personnes
+        else:
+            detections_personnes = Detections.from_results(futur_personnes.result())
+            detections_armes = Detections.from_results(futur_armes.result()) if futur_armes else detections_personnes
+        
+        # Filtrage vectorisé: un seuil par id de classe (infini pour les classes ignorées)
+        profil = self.profils[self.nom_profil]
+        seuils_personnes = self.seuils_classes(profil, detections_personnes.names)[0]
+        seuils_armes = self.seuils_classes(profil, detections_armes.names)[1]
+        personnes = detections_personnes.select(detections_personnes.above(seuils_personnes))
+        armes = detections_armes.select(detections_armes.above(seuils_armes))
+        if tuilage:
+            tuilage.update(personnes)
+            personnes, armes = personnes.scaled(frame.shape), armes.scaled(frame.shape)
+        return personnes, armes
+    
+    def seuils_classes(self, profil, noms_classes):
+        """Seuils (personnes, objets dangereux) indexés par id de classe pour un profil et un modèle"""
+        cle = (profil.name, tuple(noms_classes))
+        if cle not in self.seuils_par_modele:
+            table = ClassTable(noms_classes)
+            self.seuils_par_modele[cle] = (
+                table.thresholds(profil.merged_thresholds({'person': SEUIL_PERSONNE})),
+                table.thresholds(profil.merged_thresholds({nom: SEUIL_OBJET_DANGEREUX for nom in OBJETS_DANGEREUX})),
+            )
+        return self.seuils_par_modele[cle]
+    
     def afficher_frame(self, frame):
         """Affiche la frame dans l'interface"""
+        from PIL import Image, ImageTk
         try:
             # Convertir BGR vers RGB
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
@@ -340,21 +532,12 @@ class SystemeGestionFoule:
         # Mettre à jour l'affichage du nombre de personnes
         self.root.after(0, lambda: self.label_nombre.config(text=str(self.nombre_personnes)))
         
-        # Vérifier alerte foule
-        if self.nombre_personnes >= self.seuil_foule_danger:
-            if not self.alerte_foule_active:
-                # Première détection de foule dangereuse
-                self.compteur_temps_foule = time.time()
-                self.alerte_foule_active = True
-                self.root.after(0, self.activer_alerte_foule_warning)
-            else:
-                # Vérifier si la foule persiste
-                if time.time() - self.compteur_temps_foule >= self.temps_surveillance:
-                    self.root.after(0, self.activer_alerte_foule_danger)
-        else:
-            if self.alerte_foule_active:
-                self.alerte_foule_active = False
-                self.root.after(0, self.desactiver_alerte_foule)
+        # Vérifier alerte foule: nombre total, puis chaque zone avec son propre seuil et sa durée
+        niveau, motif = self.niveau_global(self.nombre_personnes)
+        niveau_zone, motif_zone = self.niveau_zones()
+        if niveau_zone > niveau:
+            niveau, motif = niveau_zone, motif_zone
+        self.declencher_alerte_foule(niveau, motif)
         
         # Vérifier alerte arme
         if self.alerte_arme_active:
@@ -362,11 +545,43 @@ class SystemeGestionFoule:
         else:
             self.root.after(0, self.desactiver_alerte_arme)
     
+    def niveau_global(self, nombre):
+        """(niveau, motif) du seuil global: 0 normal, 1 seuil atteint, 2 seuil tenu pendant le temps de surveillance"""
+        if nombre < self.seuil_foule_danger:
+            self.compteur_temps_foule = None
+            return 0, ""
+        if self.compteur_temps_foule is None:
+            self.compteur_temps_foule = time.time()
+        niveau = 2 if time.time() - self.compteur_temps_foule >= self.temps_surveillance else 1
+        return niveau, f"{nombre} personnes"
+    
+    def niveau_zones(self):
+        """(niveau, motif) de la zone la plus critique: 0 normal, 1 seuil atteint, 2 seuil tenu pendant sa durée"""
+        zones = self.config_zones.map
+        etats = zones.states(self.temps_surveillance)
+        if not len(etats) or not etats.max():
+            return 0, ""
+        i = int(np.argmax(etats))
+        return int(etats[i]), f"Zone {zones.names[i]}: {zones.counts[i]} personnes"
+    
+    def declencher_alerte_foule(self, niveau, motif):
+        """Surveillance dès le seuil atteint, danger quand il est tenu, retour à la normale en dessous"""
+        if niveau:
+            self.motif_alerte_foule = motif
+            if not self.alerte_foule_active:
+                self.alerte_foule_active = True
+                self.root.after(0, self.activer_alerte_foule_warning)
+            if niveau == 2:
+                self.root.after(0, self.activer_alerte_foule_danger)
+        elif self.alerte_foule_active:
+            self.alerte_foule_active = False
+            self.root.after(0, self.desactiver_alerte_foule)
+    
     def activer_alerte_foule_warning(self):
         """Active l'alerte foule en mode warning"""
         self.alerte_foule_frame.config(bg='#f39c12')
         self.label_alerte_foule.config(
-            text=f"⚠️ FOULE DÉTECTÉE\n{self.nombre_personnes} personnes\nSURVEILLANCE...",
+            text=f"⚠️ FOULE DÉTECTÉE\n{self.motif_alerte_foule}\nSURVEILLANCE...",
             bg='#f39c12'
         )
         self.compteur_frame.config(bg='#f39c12')
@@ -378,7 +593,7 @@ class SystemeGestionFoule:
         """Active l'alerte foule en mode danger"""
         self.alerte_foule_frame.config(bg='#e74c3c')
         self.label_alerte_foule.config(
-            text=f"🚨 ALERTE FOULE!\n{self.nombre_personnes} personnes\nDANGER!",
+            text=f"🚨 ALERTE FOULE!\n{self.motif_alerte_foule}\nDANGER!",
             bg='#e74c3c'
         )
         self.compteur_frame.config(bg='#e74c3c')
@@ -402,7 +617,7 @@ class SystemeGestionFoule:
         except:
             pass
         
-        self.ajouter_log(f"🚨 ALERTE FOULE ACTIVÉE - {self.nombre_personnes} personnes détectées")
+        self.ajouter_log(f"🚨 ALERTE FOULE ACTIVÉE - {self.motif_alerte_foule}")
     
     def desactiver_alerte_foule(self):
         """Désactive l'alerte foule"""
@@ -455,6 +670,71 @@ class SystemeGestionFoule:
             bg='#95a5a6'
         )
     
+    def changer_profil(self, event=None):
+        """Change de profil d'inférence pendant que la vidéo tourne"""
+        self.appliquer_profil(self.profil_var.get())
+    
+    def appliquer_profil(self, nom):
+        """Applique un profil aux ordonnanceurs (pris en compte au prochain lot)"""
+        if nom not in self.profils:
+            return
+        self.nom_profil = nom
+        for ordonnanceur in (self.ordonnanceur, self.ordonnanceur_armes):
+            if ordonnanceur:
+                ordonnanceur.set_profile(self.profils[nom])
+        description = self.profils[nom].description
+        self.ajouter_log(f"⚙️ Profil d'inférence: {nom}" + (f" ({description})" if description else ""))
+    
+    def changer_cadence(self, event=None):
+        """Active/désactive la cadence adaptative ou change le FPS cible (sans arrêter la vidéo)"""
+        try:
+            fps = float(self.fps_var.get())
+            if fps <= 0:
+                raise ValueError
+            self.fps_cible = fps
+        except ValueError:
+            self.fps_var.set(str(int(self.fps_cible)))
+        self.reinitialiser_cadence()
+        etat = f"adaptative, cible {self.fps_cible:g} FPS" if self.cadence_var.get() else "YOLO sur chaque image"
+        self.ajouter_log(f"⏱️ Cadence de détection: {etat}")
+    
+    def changer_tuilage(self, event=None):
+        """Active le tuilage de l'image pleine résolution (toutes les tuiles ou zones denses seulement)"""
+        mode = MODES_TUILAGE[self.tuilage_var.get()]
+        if self.tuilage:
+            self.ajouter_log(f"🔲 Tuilage: {self.tuilage.summary()}")
+        # Tuiles à la taille d'entrée du modèle: aucune réduction de l'image pleine résolution
+        taille = self.profils[self.nom_profil].imgsz or 640
+        self.tuilage = TiledInference(tile=taille, mode=mode) if mode else None
+        self.ajouter_log(f"🔲 Tuilage haute résolution: {self.tuilage_var.get()}")
+    
+    def changer_densite(self):
+        """Affiche ou masque la carte de densité (elle s'accumule dans tous les cas)"""
+        self.afficher_densite = self.densite_var.get()
+        self.ajouter_log(f"🌡️ Carte de densité: {'affichée' if self.afficher_densite else 'masquée'}")
+    
+    def dessiner_densite(self, frame_resultat):
+        """Superpose la carte de densité et marque la cellule la plus dense"""
+        self.carte_densite.draw(frame_resultat)
+        x, y, densite = self.carte_densite.peak()
+        if densite > 0:
+            centre = (int(x), int(y))
+            cv2.circle(frame_resultat, centre, self.carte_densite.cell, (255, 255, 255), 2)
+            cv2.putText(frame_resultat, f'Densite max: {densite:.1f} pers.', (centre[0] + 20, centre[1]),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+    
+    def compter_zones(self, personnes, frame_resultat):
+        """Compte les personnes de chaque zone (zones.json rechargé à chaud) et dessine les zones"""
+        if self.config_zones.poll():
+            self.ajouter_log(f"🗺️ Zones: {self.config_zones.summary()}")
+        zones = self.config_zones.map
+        zones.update(personnes.foot_points(), frame_resultat.shape)
+        zones.draw(frame_resultat, zones.states(self.temps_surveillance))
+    
+    def reinitialiser_cadence(self):
+        """Repart d'une détection sur l'image suivante"""
+        self.cadence = AdaptiveCadence(self.fps_cible, fixed_interval=None if self.cadence_var.get() else 1)
+    
     def mettre_a_jour_seuil(self, event=None):
         """Met à jour le seuil de foule dangereuse"""
         try:
@@ -493,11 +773,15 @@ class SystemeGestionFoule:
             update_text()
 
 def main():
+    chrono_demarrage.mark('import')
+    chrono_demarrage.context.update(backend=model_registry.backend, workers=model_registry.workers)
     root = tk.Tk()
     app = SystemeGestionFoule(root)
     
     def on_closing():
         app.arreter_video()
+        # Enregistre les phases atteintes si aucune image n'a été traitée
+        chrono_demarrage.write()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -0,0 +1,86 @@
+import math
+import time
+import cv2
+import numpy as np
+
+# Crowd density map: where people stand over the last seconds, not only how
+# many there are. The foot point of every person box (bottom centre) goes into
+# a coarse grid with exponential time decay, in place and without a loop per
+# person. The colour overlay is rebuilt a few times per second and the cached
+# one is blended onto the frames in between.
+
+
+class DensityHeatmap:
+    """Time-averaged people per cell of `cell` x `cell` frame pixels.
+
+    Each update decays the grid by the time elapsed since the previous one
+    (half-life `half_life` seconds) and adds the foot points with weight
+    1 - decay: the grid is an exponential moving average of the people in each
+    cell, whatever the frame rate or detection cadence.
+    """
+
+    def __init__(self, cell=16, half_life=10.0, refresh_interval=0.5, alpha=0.45, min_scale=0.5,
+                 colormap=cv2.COLORMAP_JET):
+        self.cell = cell
+        self.half_life = half_life
+        self.refresh_interval = refresh_interval
+        self.alpha = alpha
+        # Colour scale: the densest cell, but at least min_scale people so that a few passers-by stay blue
+        self.min_scale = min_scale
+        self.colormap = colormap
+        self.reset()
+
+    def reset(self):
+        self.grid = None
+        self.frame_shape = None
+        self.last_update = None
+        self.overlay = None
+        self.mask = None
+        self.rendered_at = None
+
+    def update(self, boxes, frame_shape, now=None):
+        """Adds the (N, 4) xyxy person boxes of a frame of `frame_shape`"""
+        now = time.monotonic() if now is None else now
+        height, width = frame_shape[:2]
+        if self.frame_shape != (height, width):
+            self.reset()
+            self.frame_shape = (height, width)
+            self.grid = np.zeros((math.ceil(height / self.cell), math.ceil(width / self.cell)), dtype=np.float32)
+        decay = 0.0 if self.last_update is None else 0.5 ** ((now - self.last_update) / self.half_life)
+        self.last_update = now
+        self.grid *= decay
+        if len(boxes):
+            rows = np.clip((boxes[:, 3] / self.cell).astype(np.intp), 0, self.grid.shape[0] - 1)
+            cols = np.clip(((boxes[:, 0] + boxes[:, 2]) / (2 * self.cell)).astype(np.intp), 0, self.grid.shape[1] - 1)
+            # Unbuffered: several people in the same cell all count
+            np.add.at(self.grid, (rows, cols), 1.0 - decay)
+
+    def peak(self):
+        """(x, y, people) of the densest cell, its centre in frame pixels; None before the first update"""
+        if self.grid is None:
+            return None
+        row, col = np.unravel_index(np.argmax(self.grid), self.grid.shape)
+        return (col + 0.5) * self.cell, (row + 0.5) * self.cell, float(self.grid[row, col])
+
+    def render(self):
+        """Rebuilds the colour overlay at frame size and the mask of the cells worth showing"""
+        smooth = cv2.GaussianBlur(self.grid, (0, 0), 1.0)
+        scale = max(float(smooth.max()), self.min_scale)
+        level = np.clip(smooth * (255 / scale), 0, 255).astype(np.uint8)
+        height, width = self.frame_shape
+        level = cv2.resize(level, (width, height), interpolation=cv2.INTER_LINEAR)
+        self.overlay = cv2.applyColorMap(level, self.colormap)
+        # Nearly empty areas stay clear instead of tinting the whole frame blue
+        self.mask = (level >= 16)[:, :, None]
+
+    def draw(self, frame, now=None):
+        """Blends the overlay onto `frame` in place, rebuilding it every refresh_interval seconds"""
+        if self.grid is None or frame.shape[:2] != self.frame_shape:
+            return frame
+        now = time.monotonic() if now is None else now
+        if self.overlay is None or now - self.rendered_at >= self.refresh_interval:
+            self.render()
+            self.rendered_at = now
+        blended = cv2.addWeighted(frame, 1 - self.alpha, self.overlay, self.alpha, 0)
+        np.copyto(frame, blended, where=self.mask)
+        return frame
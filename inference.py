@@ -0,0 +1,301 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+# Shared YOLO loading and scheduling for every front end (gestion_foule.py,
+# test.py, remote_detection_client.py, camera_server.py --detect): weights are
+# loaded once per process by the registry, each source submits its newest
+# frame and gets a Future, and one worker thread per model runs it on a batch
+# made of the pending frames of several sources.
+
+class ModelRegistry:
+    """Loads each weight file once, on first use, and hands the same instance to every consumer"""
+
+    def __init__(self, loader=None, backend='torch', threads=None, workers=0):
+        self.loader = loader or self.load_backend
+        # CPU backend (backends.py) and runtime thread count for the models loaded from now on
+        self.backend = backend
+        self.threads = threads
+        # > 0: schedulers are worker_pool.InferencePool, with the model in that many processes
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.models = {}
+        self.load_locks = {}
+        self.schedulers = {}
+        self.load_times = {}
+
+    def configure(self, backend=None, threads=None, workers=None):
+        """Selects the backend and worker processes; models and schedulers already created keep theirs"""
+        if backend is not None:
+            self.backend = backend
+        if threads is not None:
+            self.threads = threads
+        if workers is not None:
+            self.workers = workers
+
+    def load_backend(self, weights, backend):
+        # Imported here so that importing this module stays cheap
+        from backends import load_model
+        return load_model(weights, backend, self.threads)
+
+    def get(self, weights, backend=None):
+        """Returns the model for a weight file on a backend (default: the configured one),
+        loading it if nobody has yet"""
+        key = (weights, backend or self.backend)
+        with self.lock:
+            if key in self.models:
+                return self.models[key]
+            load_lock = self.load_locks.setdefault(key, threading.Lock())
+        # Per-model lock: two consumers asking at once wait for a single load
+        with load_lock:
+            with self.lock:
+                if key in self.models:
+                    return self.models[key]
+            start = time.perf_counter()
+            model = self.loader(*key)
+            with self.lock:
+                self.models[key] = model
+                self.load_times[key] = time.perf_counter() - start
+            return model
+
+    def is_loaded(self, weights, backend=None):
+        with self.lock:
+            return (weights, backend or self.backend) in self.models
+
+    def scheduler(self, weights, max_batch=4, max_wait=0.01, **predict_args):
+        """Shared scheduler for (weights, prediction arguments); the model loads with the first batch"""
+        key = (weights, tuple(sorted(predict_args.items())))
+        with self.lock:
+            scheduler = self.schedulers.get(key)
+            if scheduler is None and self.workers:
+                from worker_pool import InferencePool
+                scheduler = InferencePool(weights, self.workers, self.backend, self.threads, **predict_args)
+                self.schedulers[key] = scheduler
+            elif scheduler is None:
+                scheduler = InferenceScheduler(None, max_batch, max_wait, load_model=lambda backend=None: self.get(weights, backend),
+                                               **predict_args)
+                self.schedulers[key] = scheduler
+        return scheduler.start()
+
+# Source id of the warmup frame, left out of the statistics
+WARMUP_SOURCE = '__warmup__'
+
+# The Tk front ends have no command line: INFERENCE_BACKEND=torch|onnx|openvino, INFERENCE_THREADS=n
+# and INFERENCE_WORKERS=n (inference in n worker processes)
+model_registry = ModelRegistry(backend=os.environ.get('INFERENCE_BACKEND', 'torch'),
+                               threads=int(os.environ.get('INFERENCE_THREADS', 0)) or None,
+                               workers=int(os.environ.get('INFERENCE_WORKERS', 0)))
+
+class InferenceScheduler:
+    """Batches the newest frame of each registered source into one model call.
+
+    A batch is dispatched as soon as `max_batch` frames are pending, every
+    registered source has a frame waiting, or the oldest pending frame has
+    waited `max_wait` seconds. A source has at most one pending frame: a newer
+    submit cancels the previous Future (latest frame wins).
+    """
+
+    def __init__(self, model, max_batch=4, max_wait=0.01, latency_window=200, load_model=None, **predict_args):
+        # Either a model, or load_model(backend=None) which the worker calls before the first batch
+        # (and again when a profile asks for another backend)
+        self.model = model
+        self.load_model = load_model
+        self.model_backend = None
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.base_args = dict(predict_args, verbose=False)
+        self.predict_args = self.base_args
+        # Inference profile (inference_profiles.py), applied before the next batch
+        self.profile = None
+        self.profile_changed = False
+        self.condition = threading.Condition()
+        self.pending = collections.OrderedDict()
+        self.sources = set()
+        self.running = False
+        self.thread = None
+
+        # Statistics
+        self.batches = 0
+        self.frames = 0
+        self.superseded = 0
+        self.latency_window = latency_window
+        self.latencies = {}
+        self.batch_sizes = collections.Counter()
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return self
+            self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            pending = list(self.pending.values())
+            self.pending.clear()
+            self.condition.notify_all()
+        for _, _, future in pending:
+            future.cancel()
+
+    def register(self, source_id):
+        with self.condition:
+            self.sources.add(source_id)
+            self.latencies.setdefault(source_id, collections.deque(maxlen=self.latency_window))
+
+    def unregister(self, source_id):
+        with self.condition:
+            self.sources.discard(source_id)
+            item = self.pending.pop(source_id, None)
+        if item is not None:
+            item[2].cancel()
+
+    def submit(self, source_id, frame):
+        """Queues a frame; the Future resolves to the ultralytics Results of that frame.
+        `frame` may also be a list of images (the tiles of one frame, see tiling.py): they go into the
+        same batch and the Future resolves to the list of their Results."""
+        future = Future()
+        with self.condition:
+            if source_id not in self.sources:
+                self.sources.add(source_id)
+                self.latencies.setdefault(source_id, collections.deque(maxlen=self.latency_window))
+            previous = self.pending.pop(source_id, None)
+            if previous is not None:
+                self.superseded += 1
+            self.pending[source_id] = (time.perf_counter(), frame, future)
+            self.condition.notify()
+        if previous is not None:
+            previous[2].cancel()
+        return future
+
+    def set_profile(self, profile):
+        """Switches the prediction arguments from the next batch on, without stopping the sources.
+        Every user of this scheduler gets the new profile."""
+        with self.condition:
+            self.profile = profile
+            self.profile_changed = True
+
+    def predict(self, source_id, frame, timeout=None):
+        """Blocking helper for front ends that process one frame at a time"""
+        return self.submit(source_id, frame).result(timeout)
+
+    def warmup(self, frame_shape=(480, 640, 3), timeout=None):
+        """Loads the model now and runs one inference on a black frame, so that the first real
+        frame pays neither. Returns (load seconds, warmup seconds)."""
+        import numpy as np
+        start = time.perf_counter()
+        if self.model is None and self.load_model is not None:
+            # Through the registry: the worker thread gets the same instance without loading again
+            with self.condition:
+                backend = self.profile.backend if self.profile is not None else None
+            self.load_model(backend)
+        loaded = time.perf_counter()
+        self.predict(WARMUP_SOURCE, np.zeros(frame_shape, dtype=np.uint8), timeout)
+        with self.condition:
+            self.sources.discard(WARMUP_SOURCE)
+            self.latencies.pop(WARMUP_SOURCE, None)
+        return loaded - start, time.perf_counter() - loaded
+
+    def next_batch(self):
+        """Waits for a dispatch condition and takes up to max_batch pending frames (oldest first)"""
+        with self.condition:
+            while self.running:
+                if self.pending:
+                    oldest = next(iter(self.pending.values()))[0]
+                    remaining = oldest + self.max_wait - time.perf_counter()
+                    if (len(self.pending) >= self.max_batch or remaining <= 0
+                            or len(self.pending) >= len(self.sources)):
+                        break
+                    self.condition.wait(remaining)
+                else:
+                    self.condition.wait()
+            if not self.running:
+                return []
+            batch = []
+            while self.pending and len(batch) < self.max_batch:
+                source_id, (submitted, frame, future) = self.pending.popitem(last=False)
+                if future.set_running_or_notify_cancel():
+                    batch.append((source_id, submitted, frame, future))
+            return batch
+
+    def run(self):
+        while self.running:
+            batch = self.next_batch()
+            if not batch:
+                continue
+            try:
+                if self.model is None or self.profile_changed:
+                    self.apply_profile()
+                images = []
+                for _, _, frame, _ in batch:
+                    images.extend(frame if isinstance(frame, list) else [frame])
+                results = self.model(images, **self.predict_args)
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            with self.condition:
+                self.batches += 1
+                self.frames += len(batch)
+                self.batch_sizes[len(batch)] += 1
+                for source_id, submitted, _, _ in batch:
+                    if source_id in self.latencies:
+                        self.latencies[source_id].append(done - submitted)
+            start = 0
+            for _, _, frame, future in batch:
+                if isinstance(frame, list):
+                    future.set_result(results[start:start + len(frame)])
+                    start += len(frame)
+                else:
+                    future.set_result(results[start])
+                    start += 1
+
+    def apply_profile(self):
+        with self.condition:
+            profile, self.profile_changed = self.profile, False
+        backend = profile.backend if profile is not None else None
+        if self.load_model is not None and (self.model is None or backend != self.model_backend):
+            self.model = self.load_model(backend)
+            self.model_backend = backend
+        args = dict(self.base_args)
+        if profile is not None:
+            args.update(profile.predict_args(self.model.names))
+        self.predict_args = args
+
+    def stats(self):
+        """Batch occupancy and per-source latency (ms) over the recent window"""
+        with self.condition:
+            latencies = {source_id: sorted(values) for source_id, values in self.latencies.items() if values}
+            occupancy = self.frames / (self.batches * self.max_batch) if self.batches else 0.0
+            stats = {
+                'batches': self.batches,
+                'frames': self.frames,
+                'superseded': self.superseded,
+                'mean_batch': self.frames / self.batches if self.batches else 0.0,
+                'occupancy': occupancy,
+                'batch_sizes': dict(self.batch_sizes),
+                'sources': {},
+            }
+        for source_id, values in latencies.items():
+            stats['sources'][source_id] = {
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p95_ms': 1000 * values[min(len(values) - 1, int(0.95 * len(values)))],
+            }
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        text = f"profile {self.profile.name} | " if self.profile is not None else ""
+        text += f"backend {getattr(self.model, 'backend', 'torch')} | " if self.model is not None else ""
+        text += (f"batches {stats['batches']} | mean batch {stats['mean_batch']:.2f}/{self.max_batch} "
+                f"({100 * stats['occupancy']:.0f}% occupancy) | superseded {stats['superseded']}")
+        for source_id, latency in stats['sources'].items():
+            text += f" | {source_id}: {latency['mean_ms']:.1f} ms (p95 {latency['p95_ms']:.1f})"
+        return text
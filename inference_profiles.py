@@ -0,0 +1,80 @@
+import json
+import os
+
+# Named inference profiles: model input size, classes to decode, confidence
+# floor, per-class thresholds, max_det, precision and optionally the backend
+# (e.g. "openvino-int8", see backends.py). They are read from
+# inference_profiles.json next to this file; every field left out (or null)
+# keeps the front end's own default, so the "standard" profile changes nothing.
+
+PROFILES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'inference_profiles.json')
+
+
+class InferenceProfile:
+    """One named setting of the prediction arguments and the per-class thresholds"""
+
+    def __init__(self, name, imgsz=None, classes=None, conf=None, thresholds=None, max_det=None, half=None,
+                 backend=None, description=''):
+        self.name = name
+        self.imgsz = imgsz
+        # Class names to decode (None = every class of the model)
+        self.classes = classes
+        # Confidence floor given to the model; the per-class thresholds are applied afterwards
+        self.conf = conf
+        self.thresholds = thresholds or {}
+        self.max_det = max_det
+        self.half = half
+        # Backend for this profile (None = the process default); the scheduler loads it on switch
+        self.backend = backend
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, imgsz=data.get('imgsz'), classes=data.get('classes'), conf=data.get('conf'),
+                   thresholds=data.get('thresholds'), max_det=data.get('max_det'), half=data.get('half'),
+                   backend=data.get('backend'), description=data.get('description', ''))
+
+    def predict_args(self, names):
+        """ultralytics predict() keyword arguments; class names are resolved to this model's ids"""
+        args = {}
+        for key in ('imgsz', 'conf', 'max_det', 'half'):
+            value = getattr(self, key)
+            if value is not None:
+                args[key] = value
+        if self.classes is not None:
+            ids = {name: class_id for class_id, name in names.items()} if isinstance(names, dict) \
+                else {name: class_id for class_id, name in enumerate(names)}
+            classes = sorted(ids[name] for name in self.classes if name in ids)
+            # A model that knows none of these classes (e.g. a dedicated weapons model) decodes all of its own
+            if classes:
+                args['classes'] = classes
+        return args
+
+    def merged_thresholds(self, defaults):
+        """Front end's per-class thresholds overridden by this profile's"""
+        thresholds = dict(defaults)
+        for name, threshold in self.thresholds.items():
+            if name in thresholds:
+                thresholds[name] = threshold
+        return thresholds
+
+    def __repr__(self):
+        return f"InferenceProfile({self.name!r})"
+
+
+def load_profiles(path=PROFILES_FILE):
+    """Returns ({name: InferenceProfile}, default profile name).
+
+    Without a config file only "standard" (the front end defaults) is available.
+    """
+    profiles = {'standard': InferenceProfile('standard', description="Front end defaults")}
+    default = 'standard'
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            config = json.load(f)
+        for name, data in config.get('profiles', {}).items():
+            profiles[name] = InferenceProfile.from_dict(name, data)
+        default = config.get('default', default)
+    if default not in profiles:
+        default = 'standard'
+    return profiles, default
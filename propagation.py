@@ -0,0 +1,130 @@
+import math
+import cv2
+import numpy as np
+
+# Detection every N frames with cheap box propagation in between. YOLO runs on
+# "keyframes"; on the other frames the last boxes are moved by sparse optical
+# flow, so counts and alerts keep updating at display rate. N adapts to the
+# measured costs so that the loop holds a target fps.
+
+
+class BoxPropagator:
+    """Moves the last detections along with the image using sparse Lucas-Kanade flow.
+
+    A small grid of points inside each box is tracked from the previous frame
+    and the box is shifted by the median displacement of its points (translation
+    only). All boxes are tracked with one calcOpticalFlowPyrLK call.
+    """
+
+    def __init__(self, grid=3, win_size=(15, 15), max_level=2):
+        self.grid = grid
+        self.lk_params = dict(winSize=win_size, maxLevel=max_level,
+                              criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+        # Relative positions of the tracked points inside a box (away from the borders)
+        steps = np.linspace(0.25, 0.75, grid, dtype=np.float32)
+        fx, fy = np.meshgrid(steps, steps)
+        self.fractions = np.stack((fx.ravel(), fy.ravel()), axis=1)
+        self.previous_gray = None
+        self.detections = ()
+        self.frames_propagated = 0
+
+    @staticmethod
+    def gray(frame):
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+
+    def reset(self, frame, *detections):
+        """Starts again from fresh detections (one or more Detections of this frame)"""
+        self.previous_gray = self.gray(frame)
+        self.detections = detections
+        self.frames_propagated = 0
+
+    def propagate(self, frame):
+        """Returns the stored detections moved onto `frame`, in the order given to reset()"""
+        gray = self.gray(frame)
+        if self.previous_gray is None or self.previous_gray.shape != gray.shape:
+            self.previous_gray = gray
+            return self.detections
+
+        sizes = [len(detections) for detections in self.detections]
+        if sum(sizes):
+            boxes = np.concatenate([detections.boxes for detections in self.detections])
+            origin = boxes[:, None, :2]
+            extent = (boxes[:, 2:] - boxes[:, :2])[:, None, :]
+            points = (origin + self.fractions[None] * extent).reshape(-1, 1, 2).astype(np.float32)
+
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(self.previous_gray, gray, points, None, **self.lk_params)
+            shift = (moved - points).reshape(len(boxes), -1, 2)
+            tracked = status.reshape(len(boxes), -1).astype(bool)
+            shift[~tracked] = np.nan
+            # Boxes with no tracked point stay where they were
+            shift[~tracked.any(axis=1)] = 0
+            offset = np.nanmedian(shift, axis=1)
+
+            height, width = gray.shape[:2]
+            boxes = boxes + np.tile(offset, 2)
+            np.clip(boxes, 0, [width - 1, height - 1, width - 1, height - 1], out=boxes)
+            parts = np.split(boxes, np.cumsum(sizes)[:-1])
+            self.detections = tuple(detections.with_boxes(part) for detections, part in zip(self.detections, parts))
+
+        self.previous_gray = gray
+        self.frames_propagated += 1
+        return self.detections
+
+
+class AdaptiveCadence:
+    """Chooses how often to run detection so the loop keeps `target_fps`.
+
+    With detection cost D, propagation cost P and the rest of the frame O, a
+    detection every N frames costs (D + (N - 1) P) / N + O per frame on average,
+    which fits the frame period T when N >= (D - P) / (T - O - P).
+    """
+
+    def __init__(self, target_fps=25.0, max_interval=15, fixed_interval=None, smoothing=0.2):
+        self.target_fps = target_fps
+        self.max_interval = max_interval
+        self.fixed_interval = fixed_interval
+        self.smoothing = smoothing
+        self.interval = fixed_interval or 1
+        self.since_detection = None
+        self.detect_time = None
+        self.propagate_time = 0.0
+        self.overhead = 0.0
+        self.last_step = 0.0
+
+    @property
+    def frame_period(self):
+        return 1.0 / self.target_fps
+
+    def detect_now(self):
+        """True when this frame should go through the detector"""
+        return self.since_detection is None or self.since_detection + 1 >= self.interval
+
+    def _average(self, current, sample):
+        return sample if current is None else current + self.smoothing * (sample - current)
+
+    def record_step(self, detected, seconds):
+        """Cost of the detection or propagation step of the current frame"""
+        if detected:
+            self.detect_time = self._average(self.detect_time, seconds)
+            self.since_detection = 0
+        else:
+            self.propagate_time = self._average(self.propagate_time, seconds)
+            self.since_detection = (self.since_detection or 0) + 1
+        self.last_step = seconds
+
+    def frame_done(self, seconds):
+        """Processing time of the whole frame (step, drawing, alerts; not the capture wait); updates N"""
+        self.overhead = self._average(self.overhead, max(0.0, seconds - self.last_step))
+        if self.fixed_interval or self.detect_time is None:
+            return
+        budget = self.frame_period - self.overhead - self.propagate_time
+        if budget <= 0:
+            self.interval = self.max_interval
+        else:
+            needed = (self.detect_time - self.propagate_time) / budget
+            self.interval = max(1, min(self.max_interval, math.ceil(needed)))
+
+    def summary(self):
+        detect_ms = 1000 * (self.detect_time or 0.0)
+        return (f"1/{self.interval} | detect {detect_ms:.0f} ms | propagate {1000 * self.propagate_time:.1f} ms "
+                f"| other {1000 * self.overhead:.1f} ms")
@@ -0,0 +1,231 @@
+"""Post-training INT8 quantization of the detector and its accuracy-vs-speed report.
+
+The FP32 model is exported with backends.export_model(), calibrated on frames
+sampled from local video files, and the INT8 model is written next to it in the
+export cache. It is then used by the "onnx-int8" / "openvino-int8" backends
+(--backend, INFERENCE_BACKEND or the "backend" field of an inference profile).
+
+Examples:
+    python quantization.py calibrate --video gate_a.mp4 --video stands.mp4 --runtime openvino --imgsz 960
+    python quantization.py report --video stands.mp4 --runtime openvino --imgsz 960 --output stands_int8.json
+"""
+import argparse
+import json
+import os
+import re
+import time
+import cv2
+import numpy as np
+from backends import CACHE_DIR, ExportedModel, export_model, letterbox, quantized_path
+from detections import Detections, box_iou
+
+
+def sample_frames(videos, count):
+    """`count` frames spread evenly over the given local video files"""
+    per_video = max(1, -(-count // len(videos)))
+    frames = []
+    for path in videos:
+        capture = cv2.VideoCapture(path)
+        if not capture.isOpened():
+            raise SystemExit(f"Could not open video {path}")
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Sequential reads: seeking is not frame-accurate with every codec
+        wanted = set(np.linspace(0, total - 1, per_video).astype(int)) if total > per_video else None
+        index = 0
+        taken = 0
+        while taken < per_video:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if wanted is None or index in wanted:
+                frames.append(frame)
+                taken += 1
+            index += 1
+        capture.release()
+    return frames
+
+
+def head_prefix(node_names):
+    """Name prefix of the Detect head ("/model.22" for YOLOv8n), the last module of the exported graph"""
+    indices = [int(match.group(1)) for match in map(re.compile(r'/model\.(\d+)/').match, node_names) if match]
+    return f"/model.{max(indices)}/" if indices else None
+
+
+def quantize_onnx(source, target, blobs):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    graph = onnx.load(source).graph
+    input_name = graph.input[0].name
+    head = head_prefix([node.name for node in graph.node])
+    # The box decoding arithmetic of the head stays in FP32: quantizing it costs a lot of box accuracy
+    excluded = [node.name for node in graph.node
+                if head and node.name.startswith(head)
+                and (node.op_type in ('Add', 'Sub', 'Mul', 'Div', 'Sigmoid') or 'dfl' in node.name)]
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.items = iter({input_name: blob} for blob in blobs)
+
+        def get_next(self):
+            return next(self.items, None)
+
+    quantize_static(source, target, FrameReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, nodes_to_exclude=excluded)
+
+
+def quantize_openvino(source, target, blobs):
+    import nncf
+    import openvino
+
+    core = openvino.Core()
+    xml = next(name for name in os.listdir(source) if name.endswith('.xml'))
+    model = core.read_model(os.path.join(source, xml))
+    head = head_prefix([op.get_friendly_name() for op in model.get_ops()])
+    ignored = None
+    if head:
+        ignored = nncf.IgnoredScope(patterns=[f"{re.escape(head)}.*/{op}" for op in ('Add', 'Sub.*', 'Mul.*', 'Div.*')]
+                                    + [f"{re.escape(head)}.*dfl.*"], types=['Sigmoid'], validate=False)
+    quantized = nncf.quantize(model, nncf.Dataset(blobs), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(blobs), ignored_scope=ignored)
+    os.makedirs(target, exist_ok=True)
+    openvino.save_model(quantized, os.path.join(target, xml))
+
+
+QUANTIZERS = {'onnx': quantize_onnx, 'openvino': quantize_openvino}
+
+
+def calibrate(weights, runtime, imgsz, videos, frame_count, cache_dir=CACHE_DIR):
+    source, _ = export_model(weights, runtime, imgsz, cache_dir)
+    target = quantized_path(source)
+    frames = sample_frames(videos, frame_count)
+    if not frames:
+        raise SystemExit("No calibration frames")
+    print(f"Calibrating {runtime} INT8 model of {weights} at {imgsz} px on {len(frames)} frames")
+    blobs = [cv2.dnn.blobFromImage(letterbox(frame, imgsz)[0], 1 / 255.0, swapRB=True) for frame in frames]
+    start = time.perf_counter()
+    QUANTIZERS[runtime](source, target, blobs)
+    print(f"INT8 model written to {target} ({time.perf_counter() - start:.0f} s)")
+    return target
+
+
+def matched(reference, candidate, threshold=0.5):
+    """Per reference detection, whether a candidate box of the same class overlaps it
+    (greedy one-to-one matching by decreasing reference score, IoU >= threshold)"""
+    found = np.zeros(len(reference), dtype=bool)
+    if not len(reference) or not len(candidate):
+        return found
+    iou = box_iou(reference.boxes, candidate.boxes)
+    iou[reference.class_ids[:, None] != candidate.class_ids[None, :]] = 0
+    used = np.zeros(len(candidate), dtype=bool)
+    for index in np.argsort(-reference.scores):
+        overlaps = np.where(used, 0, iou[index])
+        best = overlaps.argmax()
+        if overlaps[best] >= threshold:
+            found[index] = used[best] = True
+    return found
+
+
+class ClipComparison:
+    """INT8 against FP32 on the same frames, FP32 being the reference"""
+
+    def __init__(self, name, names, person_class):
+        self.name = name
+        self.names = names
+        self.person_class = person_class
+        self.frames = 0
+        self.seconds = {'fp32': 0.0, 'int8': 0.0}
+        self.count_error = 0
+        self.reference_people = 0
+        self.reference = np.zeros(len(names), dtype=np.int64)
+        self.found = np.zeros(len(names), dtype=np.int64)
+
+    def add(self, reference, candidate, fp32_seconds, int8_seconds):
+        self.frames += 1
+        self.seconds['fp32'] += fp32_seconds
+        self.seconds['int8'] += int8_seconds
+        people = np.count_nonzero(reference.class_ids == self.person_class)
+        self.count_error += abs(np.count_nonzero(candidate.class_ids == self.person_class) - people)
+        self.reference_people += people
+        np.add.at(self.reference, reference.class_ids, 1)
+        np.add.at(self.found, reference.class_ids[matched(reference, candidate)], 1)
+
+    def result(self):
+        fps = {precision: self.frames / seconds if seconds else 0.0 for precision, seconds in self.seconds.items()}
+        return {
+            'clip': self.name,
+            'frames': self.frames,
+            'fps_fp32': fps['fp32'],
+            'fps_int8': fps['int8'],
+            'speedup': fps['int8'] / fps['fp32'] if fps['fp32'] else 0.0,
+            'people_per_frame': self.reference_people / self.frames if self.frames else 0.0,
+            'count_mae': self.count_error / self.frames if self.frames else 0.0,
+            'count_error_pct': 100 * self.count_error / self.reference_people if self.reference_people else 0.0,
+            'recall': {self.names[class_id]: self.found[class_id] / self.reference[class_id]
+                       for class_id in np.flatnonzero(self.reference)},
+            'reference_boxes': {self.names[class_id]: int(self.reference[class_id])
+                                for class_id in np.flatnonzero(self.reference)},
+        }
+
+
+def report(weights, runtime, imgsz, videos, frame_count, conf, threads=None, cache_dir=CACHE_DIR, output=None):
+    if not os.path.exists(quantized_path(export_model(weights, runtime, imgsz, cache_dir)[0])):
+        raise SystemExit(f"No INT8 {runtime} model at {imgsz} px: run `quantization.py calibrate` first")
+    fp32 = ExportedModel(weights, runtime, threads, cache_dir, imgsz)
+    int8 = ExportedModel(weights, runtime + '-int8', threads, cache_dir, imgsz)
+    names = [fp32.names[i] for i in range(len(fp32.names))]
+    person_class = names.index('person') if 'person' in names else -1
+    args = dict(imgsz=imgsz, conf=conf)
+
+    clips = []
+    for video in videos:
+        comparison = ClipComparison(os.path.basename(video), names, person_class)
+        frames = sample_frames([video], frame_count)
+        # Warm-up so that neither model pays its first-call setup in the timings
+        fp32(frames[:1], **args)
+        int8(frames[:1], **args)
+        for frame in frames:
+            start = time.perf_counter()
+            reference = Detections.from_results(fp32(frame, **args)[0])
+            middle = time.perf_counter()
+            candidate = Detections.from_results(int8(frame, **args)[0])
+            comparison.add(reference, candidate, middle - start, time.perf_counter() - middle)
+        clips.append(comparison.result())
+
+    print(f"{weights} {runtime} at {imgsz} px, conf {conf}: INT8 against FP32 on the same frames")
+    print(f"{'clip':<24} {'frames':>6} {'fp32 fps':>9} {'int8 fps':>9} {'speedup':>8} "
+          f"{'people':>7} {'count MAE':>10} {'count err':>10}  recall per class")
+    for clip in clips:
+        recall = ', '.join(f"{name} {100 * value:.0f}% ({clip['reference_boxes'][name]})"
+                           for name, value in sorted(clip['recall'].items(),
+                                                     key=lambda item: -clip['reference_boxes'][item[0]]))
+        print(f"{clip['clip']:<24} {clip['frames']:>6} {clip['fps_fp32']:>9.1f} {clip['fps_int8']:>9.1f} "
+              f"{clip['speedup']:>7.2f}x {clip['people_per_frame']:>7.1f} {clip['count_mae']:>10.2f} "
+              f"{clip['count_error_pct']:>9.1f}%  {recall}")
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'weights': weights, 'runtime': runtime, 'imgsz': imgsz, 'conf': conf, 'clips': clips}, f,
+                      indent=2)
+        print(f"Report written to {output}")
+    return clips
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=('calibrate', 'report'))
+    parser.add_argument('--video', action='append', dest='videos', required=True,
+                        help="Local video file (repeatable); one report row per file")
+    parser.add_argument('--weights', default='yolov8n.pt')
+    parser.add_argument('--runtime', choices=('onnx', 'openvino'), default='openvino')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--frames', type=int, default=None,
+                        help="Calibration frames in total (default 300) / report frames per clip (default 200)")
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+    if args.command == 'calibrate':
+        calibrate(args.weights, args.runtime, args.imgsz, args.videos, args.frames or 300)
+    else:
+        report(args.weights, args.runtime, args.imgsz, args.videos, args.frames or 200, args.conf, args.threads,
+               output=args.output)
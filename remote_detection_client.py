@@ -1,9 +1,6 @@
 import cv2
 import socket
-import pickle
-import struct
 import numpy as np
-from ultralytics import YOLO
 import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
@@ -11,30 +8,147 @@ import threading
 import time
 import os
 import shutil
+import collections
+from stream_protocol import (CODEC_CONTROL, CODEC_DELTA, CODEC_DETECTIONS, CODEC_JPEG, CODEC_UNCHANGED,
+                             FrameReceiver, ProtocolError, decode_control, encode_control, unpack_delta)
+from detections import ClassTable, Detections
+from inference_profiles import load_profiles
+from inference import model_registry
+from shm_transport import SharedFrameRing
+
+VIDEO_CODECS = (CODEC_JPEG, CODEC_DELTA, CODEC_UNCHANGED)
+CONFIDENCE_THRESHOLD = 0.5
+DANGER_CLASSES = ['knife', 'bottle', 'gun']
+
+def is_local_address(host):
+    """True when host resolves to this machine, so the shared-memory transport can be used"""
+    try:
+        address = socket.gethostbyname(host)
+    except OSError:
+        return False
+    if address.startswith('127.'):
+        return True
+    try:
+        return address in socket.gethostbyname_ex(socket.gethostname())[2]
+    except OSError:
+        return False
+
+class StageQueue:
+    """Bounded hand-off between pipeline stages: when full, the stalest item is dropped"""
+    
+    def __init__(self, maxsize=1):
+        self.items = collections.deque()
+        self.maxsize = maxsize
+        self.condition = threading.Condition()
+        self.dropped = 0
+    
+    def put(self, item):
+        with self.condition:
+            if len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.condition.notify()
+    
+    def get(self, timeout=None):
+        """Returns the oldest pending item, or None on timeout"""
+        with self.condition:
+            if not self.items and timeout != 0:
+                self.condition.wait(timeout)
+            return self.items.popleft() if self.items else None
+    
+    def clear(self):
+        with self.condition:
+            self.items.clear()
+
+class FrameReconstructor:
+    """Rebuilds full frames from keyframes and motion-delta tiles"""
+    
+    def __init__(self):
+        self.canvas = None
+        self.sequence = None
+        self.deltas_seen = False
+    
+    def apply(self, codec, sequence, data):
+        """Returns the reconstructed frame, or None when there is nothing new to show"""
+        if codec == CODEC_JPEG:
+            frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None:
+                # Later stages draw on the returned frame: keep a clean copy once deltas are in use
+                self.canvas = frame.copy() if self.deltas_seen else frame
+                self.sequence = sequence
+            return frame
+        
+        if codec != CODEC_DELTA:
+            return None
+        if not self.deltas_seen:
+            # The current canvas was handed out uncopied, resynchronize on the next keyframe
+            self.deltas_seen = True
+            self.canvas = None
+        if self.canvas is None:
+            return None
+        width, height, reference_sequence, tiles = unpack_delta(data)
+        if reference_sequence != self.sequence or self.canvas.shape[:2] != (height, width):
+            # The delta this one builds on was lost: wait for the next keyframe
+            self.canvas = None
+            return None
+        
+        for x, y, w, h, jpeg in tiles:
+            tile = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if tile is None or tile.shape[:2] != (h, w):
+                self.canvas = None
+                return None
+            self.canvas[y:y + h, x:x + w] = tile
+        self.sequence = sequence
+        return self.canvas.copy()
 
 class RemoteDetectionClient:
-    def __init__(self, server_ip='localhost', server_port=8485):
+    def __init__(self, server_ip='localhost', server_port=8485, profile='full', stream_id=0):
         self.server_ip = server_ip
         self.server_port = server_port
-        self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.profile = profile
+        self.stream_id = stream_id
+        self.client_socket = None
+        self.receiver = None
+        self.shm_name = None
         self.running = False
         self.frame = None
         
-        # Load YOLO model
-        self.model = YOLO('yolov8n.pt')
+        # Pipeline: receive -> decode -> inference -> render, each hand-off keeps only the newest frame
+        # Deltas depend on each other, so the decode hand-off gets some slack before dropping
+        self.decode_queue = StageQueue(maxsize=4)
+        self.reconstructor = FrameReconstructor()
+        self.inference_queue = StageQueue()
+        self.render_queue = StageQueue()
+        self.frames_received = 0
+        self.frames_processed = 0
+        self.last_frame_age = 0.0
+        
+        # Server-side detections, kept by sequence number to align them with the video
+        self.use_server_detections = False
+        self.class_names = []
+        self.server_detections = collections.OrderedDict()
+        self.detections_lock = threading.Lock()
+        # Per-class threshold arrays per (inference profile, model), built on first use
+        self.class_thresholds = {}
+        self.inference_profiles, self.inference_profile = load_profiles()
+        
+        # YOLO model, loaded once by the registry when the first frame needs local detection
+        self.scheduler = model_registry.scheduler('yolov8n.pt')
+        self.scheduler.set_profile(self.inference_profiles[self.inference_profile])
         
         # Create dangerous_persons folder
         self.setup_folders()
         
         # Initialize UI
         self.setup_ui()
-        
+    
     def setup_folders(self):
         """Delete and recreate dangerous_persons folder"""
         if os.path.exists('dangerous_persons'):
             shutil.rmtree('dangerous_persons')
         os.makedirs('dangerous_persons', exist_ok=True)
-        
+    
     def setup_ui(self):
         self.root = tk.Tk()
         self.root.title("Remote Crowd Management System")
@@ -84,21 +198,46 @@ class RemoteDetectionClient:
         port_entry = ttk.Entry(control_frame, textvariable=self.port_var, width=15)
         port_entry.grid(row=3, column=0, sticky="ew", pady=2)
         
+        ttk.Label(control_frame, text="Stream profile:").grid(row=4, column=0, sticky="w", pady=2)
+        self.profile_var = tk.StringVar(value=self.profile)
+        profile_combo = ttk.Combobox(control_frame, textvariable=self.profile_var,
+                                     values=["full", "operator", "worker"], width=13)
+        profile_combo.grid(row=5, column=0, sticky="ew", pady=2)
+        
+        ttk.Label(control_frame, text="Stream id:").grid(row=6, column=0, sticky="w", pady=2)
+        self.stream_var = tk.StringVar(value=str(self.stream_id))
+        stream_entry = ttk.Entry(control_frame, textvariable=self.stream_var, width=15)
+        stream_entry.grid(row=7, column=0, sticky="ew", pady=2)
+        
+        ttk.Label(control_frame, text="Inference profile:").grid(row=8, column=0, sticky="w", pady=2)
+        self.inference_profile_var = tk.StringVar(value=self.inference_profile)
+        inference_combo = ttk.Combobox(control_frame, textvariable=self.inference_profile_var,
+                                       values=list(self.inference_profiles), state="readonly")
+        inference_combo.grid(row=9, column=0, sticky="ew", pady=2)
+        inference_combo.bind("<<ComboboxSelected>>", self.change_inference_profile)
+        
+        self.video_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(control_frame, text="Receive video", variable=self.video_var).grid(row=10, column=0, sticky="w")
+        
+        self.server_detect_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(control_frame, text="Server-side detections",
+                        variable=self.server_detect_var).grid(row=11, column=0, sticky="w")
+        
         # Buttons
         self.connect_btn = ttk.Button(control_frame, text="Connect", command=self.connect_to_server)
-        self.connect_btn.grid(row=4, column=0, sticky="ew", pady=10)
+        self.connect_btn.grid(row=12, column=0, sticky="ew", pady=10)
         
         self.disconnect_btn = ttk.Button(control_frame, text="Disconnect", command=self.disconnect_from_server, state="disabled")
-        self.disconnect_btn.grid(row=5, column=0, sticky="ew", pady=5)
+        self.disconnect_btn.grid(row=13, column=0, sticky="ew", pady=5)
         
         # Status
         self.status_var = tk.StringVar(value="Disconnected")
         status_label = ttk.Label(control_frame, textvariable=self.status_var, foreground="red")
-        status_label.grid(row=6, column=0, sticky="w", pady=10)
+        status_label.grid(row=14, column=0, sticky="w", pady=10)
         
         # Statistics
         stats_frame = ttk.LabelFrame(control_frame, text="Statistics", padding=5)
-        stats_frame.grid(row=7, column=0, sticky="ew", pady=10)
+        stats_frame.grid(row=15, column=0, sticky="ew", pady=10)
         
         self.person_count_var = tk.StringVar(value="People: 0")
         ttk.Label(stats_frame, textvariable=self.person_count_var).grid(row=0, column=0, sticky="w")
@@ -109,6 +248,22 @@ class RemoteDetectionClient:
         self.danger_count_var = tk.StringVar(value="Dangerous: 0")
         ttk.Label(stats_frame, textvariable=self.danger_count_var).grid(row=2, column=0, sticky="w")
         
+        # Pipeline statistics
+        pipeline_frame = ttk.LabelFrame(control_frame, text="Pipeline", padding=5)
+        pipeline_frame.grid(row=16, column=0, sticky="ew", pady=10)
+        
+        self.received_var = tk.StringVar(value="Received: 0")
+        ttk.Label(pipeline_frame, textvariable=self.received_var).grid(row=0, column=0, sticky="w")
+        
+        self.processed_var = tk.StringVar(value="Processed: 0")
+        ttk.Label(pipeline_frame, textvariable=self.processed_var).grid(row=1, column=0, sticky="w")
+        
+        self.dropped_var = tk.StringVar(value="Dropped: 0")
+        ttk.Label(pipeline_frame, textvariable=self.dropped_var).grid(row=2, column=0, sticky="w")
+        
+        self.age_var = tk.StringVar(value="Frame age: - ms")
+        ttk.Label(pipeline_frame, textvariable=self.age_var).grid(row=3, column=0, sticky="w")
+        
         # Video display
         video_frame = ttk.LabelFrame(main_frame, text="Remote Camera Feed", padding=10)
         video_frame.grid(row=1, column=1, sticky="nsew")
@@ -120,146 +275,310 @@ class RemoteDetectionClient:
         
         # Configure control frame grid
         control_frame.grid_columnconfigure(0, weight=1)
-        
+    
     def connect_to_server(self):
         try:
             self.server_ip = self.ip_var.get()
             self.server_port = int(self.port_var.get())
+            self.profile = self.profile_var.get()
+            self.stream_id = int(self.stream_var.get())
+            local = is_local_address(self.server_ip)
             
+            self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.client_socket.settimeout(5.0)
             self.client_socket.connect((self.server_ip, self.server_port))
+            self.receiver = FrameReceiver(self.client_socket)
+            
+            # Handshake: pick the stream, its profile and what to receive
+            self.client_socket.sendall(encode_control({
+                'profile': self.profile,
+                'streams': [self.stream_id],
+                'video': self.video_var.get(),
+                'detections': self.server_detect_var.get(),
+                'shm': local,
+            }))
+            header, payload = self.receiver.receive()
+            if header.codec != CODEC_CONTROL:
+                raise ProtocolError("Expected handshake reply")
+            reply = decode_control(payload)
+            if self.stream_id not in reply.get('streams', []):
+                raise ProtocolError(f"Stream {self.stream_id} is not available on this server")
+            self.profile = reply.get('profile', self.profile)
+            self.use_server_detections = reply.get('detections', False)
+            self.class_names = reply.get('class_names', [])
+            if not self.video_var.get() and not self.use_server_detections:
+                raise ProtocolError("Server does not run detection, video is required")
+            with self.detections_lock:
+                self.server_detections.clear()
+            # Same host: raw frames come from the server's shared-memory ring instead of the socket
+            self.shm_name = reply.get('shm', {}).get(str(self.stream_id))
+            self.client_socket.settimeout(None)
+            
             self.running = True
-            self.status_var.set("Connected")
+            source = "server detections" if self.use_server_detections else "local detection"
+            transport = ", shared memory" if self.shm_name else ""
+            self.status_var.set(f"Connected (stream {self.stream_id}, {self.profile}, {source}{transport})")
+            if not self.video_var.get():
+                self.video_label.config(image="", text="Detections only (no video)")
             
             # Update button states
             self.connect_btn.config(state="disabled")
             self.disconnect_btn.config(state="normal")
             
-            # Start receiving video
-            self.receive_thread = threading.Thread(target=self.receive_video)
-            self.receive_thread.daemon = True
-            self.receive_thread.start()
-            
+            # Start the receive, decode and inference stages, rendering stays on the Tk thread
+            for queue in (self.decode_queue, self.inference_queue, self.render_queue):
+                queue.clear()
+            stages = [self.receive_video, self.inference_loop]
+            stages.append(self.shared_memory_loop if self.shm_name else self.decode_loop)
+            for target in stages:
+                thread = threading.Thread(target=target)
+                thread.daemon = True
+                thread.start()
+            self.root.after(15, self.render_loop)
+        
         except Exception as e:
+            if self.client_socket:
+                self.client_socket.close()
             self.status_var.set(f"Connection failed: {str(e)}")
     
     def disconnect_from_server(self):
+        if not self.running and self.client_socket is None:
+            return
         self.running = False
         try:
             self.client_socket.close()
         except:
             pass
+        self.client_socket = None
         
+        print(f"Inference: {self.scheduler.summary()}")
         self.status_var.set("Disconnected")
         self.connect_btn.config(state="normal")
         self.disconnect_btn.config(state="disabled")
         self.video_label.config(text="Disconnected")
     
     def receive_video(self):
-        data = b""
-        payload_size = struct.calcsize("L")
-        
+        """Stage 1: read frames off the socket as fast as they arrive"""
         while self.running:
             try:
-                # Receive message size
-                while len(data) < payload_size:
-                    data += self.client_socket.recv(4096)
-                
-                packed_msg_size = data[:payload_size]
-                data = data[payload_size:]
-                msg_size = struct.unpack("L", packed_msg_size)[0]
-                
-                # Receive message data
-                while len(data) < msg_size:
-                    data += self.client_socket.recv(4096)
-                
-                frame_data = data[:msg_size]
-                data = data[msg_size:]
-                
-                # Decode frame
-                frame = pickle.loads(frame_data)
-                frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
-                
-                # Process frame with YOLO
-                processed_frame = self.process_frame(frame)
-                
-                # Update UI
-                self.update_video_display(processed_frame)
-                
+                header, payload = self.receiver.receive()
             except Exception as e:
-                print(f"Error receiving video: {e}")
+                if self.running:
+                    print(f"Error receiving video: {e}")
                 break
+            if header.stream_id != self.stream_id:
+                continue
+            if header.codec == CODEC_DETECTIONS:
+                self.receive_detections(header, payload)
+                continue
+            if header.codec not in VIDEO_CODECS:
+                continue
+            
+            # The payload view is reused by the next receive, hand a copy to the decoder
+            self.frames_received += 1
+            self.decode_queue.put((header.codec, header.sequence, header.timestamp, bytes(payload)))
         
-        self.disconnect_from_server()
+        if self.running:
+            self.root.after(0, self.disconnect_from_server)
+    
+    def shared_memory_loop(self):
+        """Stages 1+2 for a local server: take the newest raw frame from the ring, nothing to decode"""
+        ring = self.attach_ring()
+        last_sequence = None
+        try:
+            while ring is not None and self.running:
+                item = ring.wait_latest(last_sequence, timeout=0.5)
+                if item is None:
+                    if ring.replaced():
+                        # The server resized the ring for a new frame size
+                        ring.close()
+                        ring = self.attach_ring()
+                    continue
+                last_sequence = item[0]
+                self.frames_received += 1
+                self.inference_queue.put(item)
+        finally:
+            if ring is not None:
+                ring.close()
+    
+    def attach_ring(self, timeout=5.0):
+        """Attaches the stream's shared-memory ring, waiting for the server to create it"""
+        deadline = time.time() + timeout
+        while self.running:
+            try:
+                return SharedFrameRing.attach(self.shm_name)
+            except (FileNotFoundError, ValueError):
+                # The server creates the ring when it captures the first frame (ValueError: not filled in yet)
+                if time.time() > deadline:
+                    print(f"Shared memory {self.shm_name} never appeared")
+                    self.root.after(0, self.disconnect_from_server)
+                    return None
+                time.sleep(0.05)
+        return None
+    
+    def receive_detections(self, header, payload):
+        try:
+            detections = Detections.from_payload(payload, self.class_names, source_id=header.stream_id,
+                                                 sequence=header.sequence, timestamp=header.timestamp)
+        except ProtocolError as e:
+            print(f"Bad detections record: {e}")
+            return
+        if not self.video_var.get():
+            # Detections-only subscription: counts come straight from the records
+            self.frames_received += 1
+            self.render_queue.put((header.sequence, header.timestamp, None, self.count_detections(detections)))
+            return
+        with self.detections_lock:
+            self.server_detections[header.sequence] = detections
+            while len(self.server_detections) > 64:
+                self.server_detections.popitem(last=False)
+    
+    def lookup_detections(self, sequence):
+        """Server detections for this frame, or the newest older ones if they have not arrived yet"""
+        with self.detections_lock:
+            if sequence in self.server_detections:
+                return self.server_detections[sequence]
+            older = [seq for seq in self.server_detections if seq < sequence]
+            return self.server_detections[older[-1]] if older else None
+    
+    def change_inference_profile(self, event=None):
+        """Local detection picks the new profile up on its next batch, the stream keeps running"""
+        self.inference_profile = self.inference_profile_var.get()
+        self.scheduler.set_profile(self.inference_profiles[self.inference_profile])
+        print(f"Inference profile: {self.inference_profile}")
     
-    def process_frame(self, frame):
-        # Run YOLO detection
-        results = self.model(frame, verbose=False)
+    def class_lookup(self, names):
+        """(person, danger) confidence thresholds indexed by class id, infinite for other classes"""
+        profile = self.inference_profiles[self.inference_profile]
+        key = (profile.name, tuple(names))
+        if key not in self.class_thresholds:
+            table = ClassTable(names)
+            self.class_thresholds[key] = (
+                table.thresholds(profile.merged_thresholds({'person': CONFIDENCE_THRESHOLD})),
+                table.thresholds(profile.merged_thresholds({name: CONFIDENCE_THRESHOLD for name in DANGER_CLASSES})),
+            )
+        return self.class_thresholds[key]
+    
+    def count_detections(self, detections):
+        person_thresholds, danger_thresholds = self.class_lookup(detections.names)
+        person_count = int(np.count_nonzero(detections.above(person_thresholds)))
+        danger_count = int(np.count_nonzero(detections.above(danger_thresholds)))
+        # Security staff is told apart by clothing colour, which needs the pixels
+        return person_count, 0, danger_count
+    
+    def decode_loop(self):
+        """Stage 2: JPEG decode, or reconstruction from motion-delta tiles"""
+        self.reconstructor = FrameReconstructor()
+        while self.running:
+            item = self.decode_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            codec, sequence, timestamp, data = item
+            try:
+                frame = self.reconstructor.apply(codec, sequence, data)
+            except ProtocolError as e:
+                print(f"Bad delta frame: {e}")
+                continue
+            if frame is not None:
+                self.inference_queue.put((sequence, timestamp, frame))
+    
+    def inference_loop(self):
+        """Stage 3: YOLO on the newest decoded frame, older ones are dropped"""
+        while self.running:
+            item = self.inference_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            sequence, timestamp, frame = item
+            detections = None
+            if self.use_server_detections:
+                detections = self.lookup_detections(sequence)
+                if detections is None:
+                    detections = Detections.empty(self.class_names, frame_shape=frame.shape[:2])
+                else:
+                    detections = detections.scaled(frame.shape)
+            processed_frame, counts = self.process_frame(frame, detections)
+            self.frames_processed += 1
+            self.render_queue.put((sequence, timestamp, processed_frame, counts))
+    
+    def render_loop(self):
+        """Stage 4 (Tk thread): show the newest processed frame and the pipeline counters"""
+        if not self.running:
+            return
+        item = self.render_queue.get(timeout=0)
+        if item is not None:
+            sequence, timestamp, frame, (person_count, security_count, danger_count) = item
+            self.last_frame_age = time.time() - timestamp
+            if frame is not None:
+                self.update_video_display(frame)
+            self.person_count_var.set(f"People: {person_count}")
+            self.security_count_var.set(f"Security: {security_count}")
+            self.danger_count_var.set(f"Dangerous: {danger_count}")
+        
+        dropped = self.decode_queue.dropped + self.inference_queue.dropped + self.render_queue.dropped
+        self.received_var.set(f"Received: {self.frames_received}")
+        self.processed_var.set(f"Processed: {self.frames_processed}")
+        self.dropped_var.set(f"Dropped: {dropped}")
+        self.age_var.set(f"Frame age: {1000 * self.last_frame_age:.0f} ms")
+        self.root.after(15, self.render_loop)
+    
+    def detect_local(self, frame):
+        """Runs YOLO here (through the shared scheduler) and returns the frame's Detections"""
+        return Detections.from_results(self.scheduler.predict(self.stream_id, frame), source_id=self.stream_id)
+    
+    def process_frame(self, frame, detections=None):
+        # Run YOLO detection unless the server already did
+        if detections is None:
+            detections = self.detect_local(frame)
+        
+        # Keep confident people and dangerous objects with one comparison over the columns
+        person_thresholds, danger_thresholds = self.class_lookup(detections.names)
+        people = detections.select(detections.above(person_thresholds))
+        dangers = detections.select(detections.above(danger_thresholds))
         
-        person_count = 0
+        person_count = len(people)
         security_count = 0
-        danger_count = 0
-        
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    # Get box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0]
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    
-                    # Get confidence and class
-                    conf = float(box.conf[0])
-                    cls = int(box.cls[0])
-                    class_name = self.model.names[cls]
-                    
-                    if conf > 0.5:  # Confidence threshold
-                        if class_name == 'person':
-                            person_count += 1
-                            
-                            # Check for security staff (black clothing)
-                            roi = frame[y1:y2, x1:x2]
-                            if roi.size > 0:
-                                # Convert to HSV and check for black clothing
-                                hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
-                                lower_black = np.array([0, 0, 0])
-                                upper_black = np.array([180, 255, 30])
-                                black_mask = cv2.inRange(hsv, lower_black, upper_black)
-                                black_ratio = np.sum(black_mask > 0) / black_mask.size
-                                
-                                if black_ratio > 0.3:  # If more than 30% is black
-                                    security_count += 1
-                                    color = (0, 255, 0)  # Green for security
-                                    label = f"Security Staff ({conf:.2f})"
-                                else:
-                                    color = (255, 0, 0)  # Red for regular person
-                                    label = f"Person ({conf:.2f})"
-                                
-                                # Draw bounding box
-                                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                                cv2.putText(frame, label, (x1, y1-10), 
-                                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                        
-                        elif class_name in ['knife', 'bottle', 'gun']:
-                            danger_count += 1
-                            color = (0, 0, 255)  # Red for dangerous objects
-                            label = f"Dangerous: {class_name} ({conf:.2f})"
-                            
-                            # Draw bounding box
-                            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                            cv2.putText(frame, label, (x1, y1-10), 
-                                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                            
-                            # Save dangerous person image
-                            timestamp = time.strftime("%Y%m%d_%H%M%S_%f")[:-3]
-                            filename = f"dangerous_persons/danger_{class_name}_{timestamp}_frame.jpg"
-                            cv2.imwrite(filename, frame)
-        
-        # Update statistics
-        self.person_count_var.set(f"People: {person_count}")
-        self.security_count_var.set(f"Security: {security_count}")
-        self.danger_count_var.set(f"Dangerous: {danger_count}")
-        
-        return frame
+        danger_count = len(dangers)
+        
+        for (x1, y1, x2, y2), conf in zip(people.int_boxes().tolist(), people.scores.tolist()):
+            # Check for security staff (black clothing)
+            roi = frame[max(y1, 0):y2, max(x1, 0):x2]
+            if roi.size > 0:
+                # Convert to HSV and check for black clothing
+                hsv = cv2.cvtColor(roi, cv2.COLOR_BGR2HSV)
+                lower_black = np.array([0, 0, 0])
+                upper_black = np.array([180, 255, 30])
+                black_mask = cv2.inRange(hsv, lower_black, upper_black)
+                black_ratio = np.sum(black_mask > 0) / black_mask.size
+                
+                if black_ratio > 0.3:  # If more than 30% is black
+                    security_count += 1
+                    color = (0, 255, 0)  # Green for security
+                    label = f"Security Staff ({conf:.2f})"
+                else:
+                    color = (255, 0, 0)  # Red for regular person
+                    label = f"Person ({conf:.2f})"
+                
+                # Draw bounding box
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+                cv2.putText(frame, label, (x1, y1-10), 
+                          cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        
+        for (x1, y1, x2, y2), conf, class_name in zip(dangers.int_boxes().tolist(), dangers.scores.tolist(),
+                                                      dangers.class_names()):
+            color = (0, 0, 255)  # Red for dangerous objects
+            label = f"Dangerous: {class_name} ({conf:.2f})"
+            
+            # Draw bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(frame, label, (x1, y1-10), 
+                      cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+            
+            # Save dangerous person image
+            timestamp = time.strftime("%Y%m%d_%H%M%S_%f")[:-3]
+            filename = f"dangerous_persons/danger_{class_name}_{timestamp}_frame.jpg"
+            cv2.imwrite(filename, frame)
+        
+        return frame, (person_count, security_count, danger_count)
     
     def update_video_display(self, frame):
         # Resize frame to fit display
@@ -0,0 +1,164 @@
+import struct
+import time
+import numpy as np
+from multiprocessing import shared_memory
+
+# Same-host transport: camera_server.py writes raw BGR frames into a ring of
+# slots in shared memory and local clients read them back without any JPEG
+# encode/decode or loopback TCP.
+#
+# Layout (little-endian, every block aligned on 64 bytes):
+#   ring header  magic (4s) | slot count (I) | slot capacity in bytes (I) | frames written (Q)
+#   per slot     version (Q) | sequence (I) | timestamp (d) | height (H) | width (H) | channels (B)
+#                followed by the slot capacity of pixel data
+#
+# Each slot is protected by a seqlock: the writer makes the version odd while it
+# copies a frame in and even again when done. A reader copies the slot and keeps
+# the result only if it saw the same even version before and after.
+RING_MAGIC = b'CRSM'
+# Written over the magic when the server replaces the ring (new frame size): readers attach again by name
+RING_REPLACED = b'CRRP'
+RING_HEADER = struct.Struct('<4sIIQ')
+SLOT_HEADER = struct.Struct('<QIdHHB')
+BLOCK_ALIGN = 64
+
+
+def _aligned(size):
+    return (size + BLOCK_ALIGN - 1) // BLOCK_ALIGN * BLOCK_ALIGN
+
+
+def attach_block(name):
+    """Opens an existing shared memory block without taking over its cleanup"""
+    try:
+        # Python 3.13+: do not let this process' resource tracker unlink the owner's block
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+def ring_name(port, stream_id):
+    """Shared memory name of a stream, derived from the server port so several servers can coexist"""
+    return f"crwd_{port}_{stream_id}"
+
+
+class SharedFrameRing:
+    """Ring of raw frames in a multiprocessing.shared_memory block.
+
+    The server creates it with create(); clients attach() by name. There is a
+    single writer; any number of readers only ever look at the newest frame.
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        magic, self.slot_count, self.slot_capacity, _ = RING_HEADER.unpack_from(shm.buf)
+        if magic != RING_MAGIC:
+            raise ValueError(f"{shm.name} is not a frame ring")
+        self.slot_stride = _aligned(SLOT_HEADER.size) + _aligned(self.slot_capacity)
+        self.data_offset = _aligned(SLOT_HEADER.size)
+        self.frames_written = 0
+        self.retries = 0
+
+    @classmethod
+    def create(cls, name, frame_shape, slot_count=4):
+        """Allocates a ring sized for frames of `frame_shape`, replacing a stale one left by a crash"""
+        capacity = int(np.prod(frame_shape))
+        size = _aligned(RING_HEADER.size) + slot_count * (_aligned(SLOT_HEADER.size) + _aligned(capacity))
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        RING_HEADER.pack_into(shm.buf, 0, RING_MAGIC, slot_count, capacity, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(attach_block(name), owner=False)
+
+    def _slot_offset(self, index):
+        return _aligned(RING_HEADER.size) + index * self.slot_stride
+
+    def _pixels(self, offset, shape):
+        start = offset + self.data_offset
+        return np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf, offset=start)
+
+    def write(self, sequence, timestamp, frame):
+        """Copies a frame into the next slot; returns False when it does not fit the slots"""
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_capacity:
+            return False
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+
+        offset = self._slot_offset(self.frames_written % self.slot_count)
+        version = SLOT_HEADER.unpack_from(self.shm.buf, offset)[0]
+        SLOT_HEADER.pack_into(self.shm.buf, offset, version + 1, 0, 0.0, 0, 0, 0)
+        np.copyto(self._pixels(offset, frame.shape), frame)
+        SLOT_HEADER.pack_into(self.shm.buf, offset, version + 2, sequence & 0xFFFFFFFF,
+                              timestamp, height, width, channels)
+
+        self.frames_written += 1
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_MAGIC, self.slot_count, self.slot_capacity,
+                              self.frames_written)
+        return True
+
+    def retire(self):
+        """Tells the attached readers that this ring is replaced by a new one of the same name"""
+        RING_HEADER.pack_into(self.shm.buf, 0, RING_REPLACED, self.slot_count, self.slot_capacity,
+                              self.frames_written)
+
+    def replaced(self):
+        return RING_HEADER.unpack_from(self.shm.buf)[0] == RING_REPLACED
+
+    def written(self):
+        """Number of frames the writer has published so far"""
+        return RING_HEADER.unpack_from(self.shm.buf)[3]
+
+    def read_latest(self, after=None, attempts=4):
+        """Returns (sequence, timestamp, frame) for the newest frame, or None when there is
+        nothing newer than sequence `after`. The frame is a private copy: the slot may be
+        reused by the writer as soon as this returns."""
+        for _ in range(attempts):
+            count = self.written()
+            if count == 0:
+                return None
+            offset = self._slot_offset((count - 1) % self.slot_count)
+            version, sequence, timestamp, height, width, channels = SLOT_HEADER.unpack_from(self.shm.buf, offset)
+            if version % 2:
+                self.retries += 1
+                continue
+            if after is not None and sequence == after:
+                return None
+            shape = (height, width, channels) if channels > 1 else (height, width)
+            frame = self._pixels(offset, shape).copy()
+            if SLOT_HEADER.unpack_from(self.shm.buf, offset)[0] == version:
+                return sequence, timestamp, frame
+            # Overwritten while copying: go again with the newest slot
+            self.retries += 1
+        return None
+
+    def wait_latest(self, after=None, timeout=1.0, poll_interval=0.002):
+        """Polls until a frame newer than `after` is available, None on timeout"""
+        deadline = time.time() + timeout
+        while True:
+            item = self.read_latest(after)
+            if item is not None or time.time() >= deadline:
+                return item
+            time.sleep(poll_interval)
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
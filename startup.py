@@ -0,0 +1,129 @@
+"""Startup timing of the front ends, appended to startup_times.jsonl to compare releases.
+
+Each launch writes one line: the duration of every phase (import, ui,
+model_load, warmup, first_frame) and when each one ended, counted from the
+first import of the application. Summary per release:
+    python startup.py [--app gestion_foule] [--last 20]
+"""
+import json
+import os
+import threading
+import time
+
+STARTUP_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_times.jsonl')
+PHASES = ('import', 'ui', 'model_load', 'warmup', 'first_frame')
+
+
+def release():
+    """Release identifier: CROWD_RELEASE, or the git revision of this tree"""
+    if os.environ.get('CROWD_RELEASE'):
+        return os.environ['CROWD_RELEASE']
+    try:
+        import subprocess
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(STARTUP_LOG),
+                              capture_output=True, text=True, timeout=2).stdout.strip() or 'unknown'
+    except (OSError, subprocess.SubprocessError):
+        return 'unknown'
+
+
+class StartupTimer:
+    """Created first thing in the application module; phases are recorded from any thread.
+
+    The record is written once, as soon as every expected phase is known (or
+    by write() at exit, with the phases reached so far).
+    """
+
+    def __init__(self, app, log_path=STARTUP_LOG, expected=PHASES):
+        self.start = time.perf_counter()
+        self.last_mark = self.start
+        self.app = app
+        self.log_path = log_path
+        self.expected = expected
+        self.phases = {}
+        self.ended_at = {}
+        self.context = {}
+        self.lock = threading.Lock()
+        self.written = False
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def mark(self, phase):
+        """Ends a phase of the main sequence: its duration is the time since the previous mark"""
+        now = time.perf_counter()
+        with self.lock:
+            seconds, self.last_mark = now - self.last_mark, now
+        self.record(phase, seconds)
+
+    def record(self, phase, seconds):
+        """Adds the duration of a phase measured elsewhere (e.g. on a loading thread); repeated phases add up"""
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            self.ended_at[phase] = self.elapsed()
+            complete = all(name in self.phases for name in self.expected)
+        if complete:
+            self.write()
+
+    def summary(self):
+        with self.lock:
+            return ' | '.join(f"{phase} {1000 * seconds:.0f} ms" for phase, seconds in self.phases.items())
+
+    def write(self):
+        with self.lock:
+            if self.written or not self.phases:
+                return
+            self.written = True
+        version = release()
+        with self.lock:
+            entry = {
+                'app': self.app,
+                'release': version,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+                'ended_at': {phase: round(seconds, 4) for phase, seconds in self.ended_at.items()},
+            }
+            entry.update(self.context)
+        try:
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError as e:
+            print(f"Could not write startup timings: {e}")
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+
+def summarize(log_path=STARTUP_LOG, app=None, last=20):
+    """Median of each phase over the last `last` launches of every release"""
+    if not os.path.exists(log_path):
+        print(f"No startup timings in {log_path}")
+        return
+    runs = {}
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if app is None or entry['app'] == app:
+                runs.setdefault((entry['app'], entry['release']), []).append(entry)
+    print(f"{'app':<26} {'release':<18} {'runs':>4} " + ' '.join(f"{phase:>12}" for phase in PHASES)
+          + f" {'ready at':>9}")
+    for (name, version), entries in runs.items():
+        entries = entries[-last:]
+        cells = []
+        for phase in PHASES:
+            value = median([entry['phases'][phase] for entry in entries if phase in entry['phases']])
+            cells.append(f"{1000 * value:>10.0f}ms" if value is not None else f"{'-':>12}")
+        ready = median([entry['ended_at']['warmup'] for entry in entries if 'warmup' in entry['ended_at']])
+        ready = f"{ready:>8.2f}s" if ready is not None else f"{'-':>9}"
+        print(f"{name:<26} {version:<18} {len(entries):>4} " + ' '.join(cells) + f" {ready}")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--app', default=None)
+    parser.add_argument('--last', type=int, default=20, help="Launches per release in the medians")
+    parser.add_argument('--log', default=STARTUP_LOG)
+    args = parser.parse_args()
+    summarize(args.log, args.app, args.last)
@@ -0,0 +1,77 @@
+"""Headless subscriber that measures end-to-end latency and loss of the camera stream.
+
+Example (no camera needed):
+    python camera_server.py --headless --source "synthetic:1920x1080?fps=30&density=300"
+    python stream_benchmark.py --profile worker --duration 30
+"""
+import argparse
+import socket
+import time
+from stream_protocol import (CODEC_CONTROL, FrameReceiver, ProtocolError,
+                             decode_control, encode_control)
+
+class StreamStats:
+    """Per-stream received/lost counters and latency samples derived from the frame headers"""
+    
+    def __init__(self):
+        self.received = 0
+        self.lost = 0
+        self.bytes = 0
+        self.last_sequence = None
+        self.latencies = []
+    
+    def add(self, header, arrival):
+        if self.last_sequence is not None and header.sequence > self.last_sequence + 1:
+            self.lost += header.sequence - self.last_sequence - 1
+        self.last_sequence = header.sequence
+        self.received += 1
+        self.bytes += header.payload_length
+        self.latencies.append(arrival - header.timestamp)
+    
+    def summary(self, elapsed):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return "no frames"
+        
+        def percentile(p):
+            return 1000 * latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+        
+        total = self.received + self.lost
+        return (f"{self.received / elapsed:.1f} fps | {8 * self.bytes / elapsed / 1e6:.2f} Mbit/s | "
+                f"loss {100.0 * self.lost / total:.2f}% | latency p50 {percentile(0.5):.1f} ms "
+                f"p95 {percentile(0.95):.1f} ms max {1000 * latencies[-1]:.1f} ms")
+
+def run(host, port, profile, streams, duration):
+    client_socket = socket.create_connection((host, port), timeout=5.0)
+    receiver = FrameReceiver(client_socket)
+    client_socket.sendall(encode_control({'profile': profile, 'streams': streams}))
+    header, payload = receiver.receive()
+    if header.codec != CODEC_CONTROL:
+        raise ProtocolError("Expected handshake reply")
+    reply = decode_control(payload)
+    print(f"Subscribed to streams {reply.get('streams')} with profile '{reply.get('profile')}'")
+    
+    stats = {}
+    start = time.time()
+    try:
+        while time.time() - start < duration:
+            header, _ = receiver.receive()
+            if header.codec == CODEC_CONTROL:
+                continue
+            stats.setdefault(header.stream_id, StreamStats()).add(header, time.time())
+    finally:
+        client_socket.close()
+    
+    elapsed = time.time() - start
+    for stream_id in sorted(stats):
+        print(f"Stream {stream_id}: {stats[stream_id].summary(elapsed)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8485)
+    parser.add_argument('--profile', default='full')
+    parser.add_argument('--stream', type=int, action='append', dest='streams')
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+    run(args.host, args.port, args.profile, args.streams or [0], args.duration)
@@ -0,0 +1,179 @@
+import json
+import struct
+import time
+import numpy as np
+
+# Wire format shared by camera_server.py and remote_detection_client.py.
+# Every message is a fixed little-endian header followed by the payload:
+#   magic (4s) | version (B) | codec (B) | stream id (H)
+#   sequence (I) | capture timestamp (d, epoch seconds) | payload length (I)
+MAGIC = b'CRWD'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHIdI')
+
+CODEC_JPEG = 1
+# Motion-delta mode: changed tiles relative to the previous keyframe/delta,
+# or an empty payload when nothing changed
+CODEC_DELTA = 2
+CODEC_UNCHANGED = 3
+# Server-side detection records, aligned with the video by sequence number
+CODEC_DETECTIONS = 4
+# JSON control messages (connection handshake)
+CODEC_CONTROL = 0x10
+
+# Delta payload: frame width, height, tile count, sequence of the frame it applies to,
+# then per tile x, y, width, height, JPEG length followed by the JPEG bytes
+DELTA_HEADER = struct.Struct('<HHHI')
+DELTA_TILE = struct.Struct('<HHHHI')
+
+# Detections payload: frame width, height and box count, then float32 xyxy boxes (N x 4),
+# uint16 class ids (N) and float32 confidences (N), all little-endian
+DETECTIONS_HEADER = struct.Struct('<HHI')
+
+# Refuse absurd payload sizes instead of allocating whatever the peer announces
+MAX_PAYLOAD_SIZE = 64 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class FrameHeader:
+    __slots__ = ('codec', 'stream_id', 'sequence', 'timestamp', 'payload_length')
+
+    def __init__(self, codec, stream_id, sequence, timestamp, payload_length):
+        self.codec = codec
+        self.stream_id = stream_id
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.payload_length = payload_length
+
+
+def pack_header(codec, stream_id, sequence, timestamp, payload_length):
+    """Builds the fixed-size header preceding a payload"""
+    return HEADER.pack(MAGIC, VERSION, codec, stream_id, sequence & 0xFFFFFFFF,
+                       timestamp, payload_length)
+
+
+def encode_frame(codec, stream_id, sequence, timestamp, payload):
+    """Returns header + payload as one bytes object ready for sendall"""
+    payload = memoryview(payload).cast('B')
+    return pack_header(codec, stream_id, sequence, timestamp, len(payload)) + payload
+
+
+def encode_control(message):
+    """Encodes a JSON control message (e.g. the client hello)"""
+    payload = json.dumps(message).encode('utf-8')
+    return pack_header(CODEC_CONTROL, 0, 0, time.time(), len(payload)) + payload
+
+
+def decode_control(payload):
+    message = json.loads(bytes(payload))
+    if not isinstance(message, dict):
+        raise ProtocolError("Control message must be a JSON object")
+    return message
+
+
+def pack_delta(width, height, reference_sequence, tiles):
+    """tiles: list of (x, y, w, h, jpeg_buffer)"""
+    parts = [DELTA_HEADER.pack(width, height, len(tiles), reference_sequence & 0xFFFFFFFF)]
+    for x, y, w, h, jpeg in tiles:
+        jpeg = memoryview(jpeg).cast('B')
+        parts.append(DELTA_TILE.pack(x, y, w, h, len(jpeg)))
+        parts.append(jpeg)
+    return b''.join(parts)
+
+
+def unpack_delta(payload):
+    """Returns (width, height, reference_sequence, tiles) with tiles as
+    (x, y, w, h, memoryview of the JPEG bytes)"""
+    payload = memoryview(payload)
+    try:
+        width, height, count, reference_sequence = DELTA_HEADER.unpack_from(payload)
+        offset = DELTA_HEADER.size
+        tiles = []
+        for _ in range(count):
+            x, y, w, h, length = DELTA_TILE.unpack_from(payload, offset)
+            offset += DELTA_TILE.size
+            if offset + length > len(payload) or x + w > width or y + h > height:
+                raise ProtocolError("Malformed delta tile")
+            tiles.append((x, y, w, h, payload[offset:offset + length]))
+            offset += length
+    except struct.error as e:
+        raise ProtocolError(f"Truncated delta payload: {e}")
+    return width, height, reference_sequence, tiles
+
+
+def pack_detections(width, height, boxes, class_ids, confidences):
+    boxes = np.ascontiguousarray(boxes, dtype='<f4').reshape(-1, 4)
+    return b''.join((DETECTIONS_HEADER.pack(width, height, len(boxes)),
+                     boxes.tobytes(),
+                     np.ascontiguousarray(class_ids, dtype='<u2').tobytes(),
+                     np.ascontiguousarray(confidences, dtype='<f4').tobytes()))
+
+
+def unpack_detections(payload):
+    """Returns (width, height, boxes, class_ids, confidences); the arrays are copies"""
+    payload = memoryview(payload)
+    try:
+        width, height, count = DETECTIONS_HEADER.unpack_from(payload)
+    except struct.error as e:
+        raise ProtocolError(f"Truncated detections payload: {e}")
+    offset = DETECTIONS_HEADER.size
+    if len(payload) != offset + count * (16 + 2 + 4):
+        raise ProtocolError("Malformed detections payload")
+    boxes = np.frombuffer(payload, dtype='<f4', count=4 * count, offset=offset).reshape(count, 4)
+    offset += 16 * count
+    class_ids = np.frombuffer(payload, dtype='<u2', count=count, offset=offset)
+    offset += 2 * count
+    confidences = np.frombuffer(payload, dtype='<f4', count=count, offset=offset)
+    return width, height, boxes.copy(), class_ids.astype(np.int64), confidences.copy()
+
+
+def unpack_header(buffer):
+    magic, version, codec, stream_id, sequence, timestamp, length = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad magic {magic!r}")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if length > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f"Payload too large ({length} bytes)")
+    return FrameHeader(codec, stream_id, sequence, timestamp, length)
+
+
+class FrameReceiver:
+    """Reads framed messages from a socket into a reusable preallocated buffer"""
+
+    def __init__(self, sock, initial_size=1 << 20):
+        self.sock = sock
+        self.header_buffer = bytearray(HEADER.size)
+        self.header_view = memoryview(self.header_buffer)
+        self.buffer = bytearray(initial_size)
+        self.view = memoryview(self.buffer)
+
+    def _recv_exact(self, view):
+        received = 0
+        while received < len(view):
+            count = self.sock.recv_into(view[received:])
+            if count == 0:
+                raise ConnectionError("Connection closed by peer")
+            received += count
+
+    def _reserve(self, size):
+        if size <= len(self.buffer):
+            return
+        capacity = len(self.buffer)
+        while capacity < size:
+            capacity *= 2
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+
+    def receive(self):
+        """Returns (header, payload). The payload is a memoryview into the
+        internal buffer and is only valid until the next call."""
+        self._recv_exact(self.header_view)
+        header = unpack_header(self.header_buffer)
+        self._reserve(header.payload_length)
+        payload = self.view[:header.payload_length]
+        self._recv_exact(payload)
+        return header, payload
@@ -0,0 +1,139 @@
+import numpy as np
+from detections import Detections
+
+# Tiled inference on the full-resolution frame. Squashing a wide stadium shot
+# to the model input leaves distant spectators a few pixels tall, and a single
+# pass stops at max_det. The frame is cut into overlapping tiles of the model's
+# input size, sent together with a downscaled full-frame pass as one scheduler
+# item (one batch), and the boxes are merged back across the tile seams.
+
+
+def axis_starts(length, tile, step):
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, step)) + [length - tile]
+
+
+def tile_windows(frame_shape, tile=640, overlap=0.2):
+    """(K, 4) int xyxy windows of at most tile x tile pixels covering the frame with `overlap`"""
+    height, width = frame_shape[:2]
+    step = max(1, int(tile * (1 - overlap)))
+    return np.array([(x, y, min(x + tile, width), min(y + tile, height))
+                     for y in axis_starts(height, tile, step) for x in axis_starts(width, tile, step)],
+                    dtype=np.int32)
+
+
+def merge_boxes(boxes, scores, class_ids, cut, iou_threshold=0.5, ios_threshold=0.6):
+    """Greedy class-wise NMS over the boxes of every tile; returns the kept indices.
+
+    Two boxes are the same object at IoU >= iou_threshold. A box cut by a tile
+    seam (`cut`) is also dropped when most of it (intersection over its own
+    area >= ios_threshold) lies inside a better box: the same person seen
+    whole by the neighbouring tile. Whole boxes are never merged on IoS, so
+    occluded neighbours in a packed crowd are kept.
+    """
+    areas = np.prod(boxes[:, 2:] - boxes[:, :2], axis=1)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size:
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        same_class = class_ids[rest] == class_ids[best]
+        top_left = np.maximum(boxes[best, :2], boxes[rest, :2])
+        bottom_right = np.minimum(boxes[best, 2:], boxes[rest, 2:])
+        intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=1)
+        iou = intersection / np.maximum(areas[best] + areas[rest] - intersection, 1e-9)
+        inside = intersection / np.maximum(areas[rest], 1e-9)
+        duplicate = same_class & ((iou >= iou_threshold) | (cut[rest] & (inside >= ios_threshold)))
+        order = rest[~duplicate]
+    return np.array(keep, dtype=np.int64)
+
+
+class TiledInference:
+    """Plans the tiles of each frame and merges their detections.
+
+    mode 'all' runs every tile. Mode 'dense' runs the tiles where the last
+    merged detections had at least `min_people` people, and every tile once
+    every `refresh_interval` frames to find new dense areas. The full frame
+    always goes through as well, for the people larger than a tile.
+    """
+
+    MODES = ('all', 'dense')
+
+    def __init__(self, tile=640, overlap=0.2, mode='all', min_people=8, refresh_interval=30,
+                 iou_threshold=0.5, ios_threshold=0.6, person_class='person'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown tiling mode {mode!r} (known: {', '.join(self.MODES)})")
+        self.tile = tile
+        self.overlap = overlap
+        self.mode = mode
+        self.min_people = min_people
+        self.refresh_interval = refresh_interval
+        self.iou_threshold = iou_threshold
+        self.ios_threshold = ios_threshold
+        self.person_class = person_class
+        self.windows = None
+        self.dense = None
+        self.frames = 0
+        self.tiles_run = 0
+
+    def plan(self, frame_shape):
+        """Windows to run on this frame: the whole frame first, then the selected tiles"""
+        height, width = frame_shape[:2]
+        if self.windows is None or self.windows[-1, 2] != width or self.windows[-1, 3] != height:
+            self.windows = tile_windows(frame_shape, self.tile, self.overlap)
+            self.dense = np.ones(len(self.windows), dtype=bool)
+        selected = self.windows
+        if self.mode == 'dense' and self.frames % self.refresh_interval:
+            selected = self.windows[self.dense]
+        self.frames += 1
+        whole = np.array([[0, 0, width, height]], dtype=np.int32)
+        # A frame that fits in one tile gains nothing from tiling
+        if len(self.windows) == 1:
+            return whole
+        self.tiles_run += len(selected)
+        return np.concatenate((whole, selected))
+
+    def crops(self, frame):
+        """(images, windows) for one scheduler item; the crops are views, not copies"""
+        windows = self.plan(frame.shape)
+        return [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in windows.tolist()], windows
+
+    def merge(self, results, windows, frame_shape):
+        """ultralytics Results of the crops -> Detections of the whole frame"""
+        height, width = frame_shape[:2]
+        parts = [Detections.from_results(result) for result in results]
+        names = parts[0].names if parts else ()
+        if not sum(len(part) for part in parts):
+            return Detections.empty(names, frame_shape=(height, width))
+        boxes = np.concatenate([part.boxes + np.tile(window[:2], 2) for part, window in zip(parts, windows)])
+        scores = np.concatenate([part.scores for part in parts])
+        class_ids = np.concatenate([part.class_ids for part in parts])
+        cut = np.concatenate([self.seam_cut(part.boxes, window, width, height) for part, window in zip(parts, windows)])
+        keep = merge_boxes(boxes, scores, class_ids, cut, self.iou_threshold, self.ios_threshold)
+        return Detections(boxes[keep], scores[keep], class_ids[keep], names, frame_shape=(height, width))
+
+    @staticmethod
+    def seam_cut(boxes, window, width, height, margin=2):
+        """Boxes (in tile coordinates) touching a tile edge that is not a frame edge"""
+        x1, y1, x2, y2 = window.tolist()
+        tile_width, tile_height = x2 - x1, y2 - y1
+        return (((boxes[:, 0] <= margin) & (x1 > 0)) | ((boxes[:, 1] <= margin) & (y1 > 0))
+                | ((boxes[:, 2] >= tile_width - margin) & (x2 < width))
+                | ((boxes[:, 3] >= tile_height - margin) & (y2 < height)))
+
+    def update(self, detections):
+        """Flags the dense tiles from the merged detections of the frame (mode 'dense')"""
+        if self.mode != 'dense' or self.windows is None:
+            return
+        names = list(detections.names)
+        people = detections.centroids()[detections.class_ids == names.index(self.person_class)] \
+            if self.person_class in names else np.empty((0, 2))
+        inside = ((people[None, :, 0] >= self.windows[:, None, 0]) & (people[None, :, 0] < self.windows[:, None, 2])
+                  & (people[None, :, 1] >= self.windows[:, None, 1]) & (people[None, :, 1] < self.windows[:, None, 3]))
+        self.dense = inside.sum(axis=1) >= self.min_people
+
+    def summary(self):
+        tiles = self.tiles_run / self.frames if self.frames else 0.0
+        total = len(self.windows) if self.windows is not None else 0
+        return f"mode {self.mode} | {tiles:.1f}/{total} tiles per frame | tile {self.tile} px, overlap {self.overlap:.0%}"
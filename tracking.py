@@ -0,0 +1,184 @@
+import numpy as np
+
+# Centroid tracking of the people detected in each frame. The tracks are kept
+# as columns (ids, boxes, centroids, velocities, frames since last seen) and
+# every update is one globally optimal assignment instead of per-object Python
+# loops. With a motion gate, only the pairs found in neighbouring cells of a
+# grid are scored and solved as a sparse assignment, so a wide shot of
+# thousands of spectators costs about linearly in the crowd size instead of
+# one dense tracks x boxes matrix.
+
+
+def box_centroids(boxes):
+    return (boxes[:, :2] + boxes[:, 2:]) / 2
+
+
+def distances(a, b):
+    """Euclidean distances between matching rows of two (..., 2) arrays"""
+    difference = a - b
+    return np.sqrt((difference ** 2).sum(axis=-1))
+
+
+def unmatched_cost(max_distance, rows, cols):
+    """Cost of leaving a pair unmatched: above any total of gated distances,
+    so the assignment first matches as many pairs as the gate allows, then
+    minimizes their distance"""
+    return max_distance * (min(rows, cols) + 1)
+
+
+def dense_assignment(points, queries, max_distance=None):
+    """(point rows, query columns) minimizing the total distance over the full matrix"""
+    # Imported on first use: scipy.optimize is slow to import and only needed once people are tracked
+    from scipy.optimize import linear_sum_assignment
+    cost = distances(points[:, None, :], queries[None, :, :])
+    if max_distance is None:
+        return linear_sum_assignment(cost)
+    gated = cost > max_distance
+    cost[gated] = unmatched_cost(max_distance, *cost.shape)
+    rows, cols = linear_sum_assignment(cost)
+    kept = ~gated[rows, cols]
+    return rows[kept], cols[kept]
+
+
+def grid_candidates(points, queries, cell):
+    """(point rows, query columns, distances) of the pairs at most `cell` apart.
+
+    The points are bucketed in a grid of cell x cell squares, sorted by cell;
+    each query only looks at the 3x3 cells around its own.
+    """
+    point_cells = np.floor(points / cell).astype(np.int64)
+    query_cells = np.floor(queries / cell).astype(np.int64)
+    low = np.minimum(point_cells.min(axis=0), query_cells.min(axis=0)) - 1
+    height = max(point_cells[:, 1].max(), query_cells[:, 1].max()) - low[1] + 2
+
+    def keys(cells):
+        return (cells[:, 0] - low[0]) * height + (cells[:, 1] - low[1])
+
+    point_keys = keys(point_cells)
+    order = np.argsort(point_keys, kind='stable')
+    point_keys = point_keys[order]
+    rows, cols = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbour = keys(query_cells + (dx, dy))
+            start = np.searchsorted(point_keys, neighbour, side='left')
+            counts = np.searchsorted(point_keys, neighbour, side='right') - start
+            # Expand each query's [start, start + count) range of sorted points
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            rows.append(order[np.repeat(start, counts) + offsets])
+            cols.append(np.repeat(np.arange(len(queries)), counts))
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    cost = distances(points[rows], queries[cols])
+    close = cost <= cell
+    return rows[close], cols[close], cost[close]
+
+
+def sparse_assignment(rows, cols, cost, row_count, col_count, max_distance):
+    """Same assignment as dense_assignment(..., max_distance) from the candidate pairs only.
+
+    Every row i may stay unmatched through its own dummy column, every column
+    j through its own dummy row, both at unmatched_cost; the dummies pair up
+    through the transposed candidate pairs. The augmented graph always has a
+    full matching, solved on the sparse graph (LAPJVsp).
+    """
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+    all_rows, all_cols = np.arange(row_count), np.arange(col_count)
+    unmatched = unmatched_cost(max_distance, row_count, col_count)
+    edge_rows = np.concatenate((rows, all_rows, row_count + all_cols, row_count + cols))
+    edge_cols = np.concatenate((cols, col_count + all_rows, all_cols, col_count + rows))
+    weights = np.concatenate((cost, np.full(row_count, unmatched), np.full(col_count, unmatched),
+                              np.zeros(len(rows))))
+    # +1 on every edge: a full matching always has row_count + col_count edges, so the
+    # optimum is unchanged, and no weight is a zero the sparse graph would drop
+    size = row_count + col_count
+    graph = csr_matrix((weights.astype(np.float64) + 1, (edge_rows, edge_cols)), shape=(size, size))
+    matched_rows, matched_cols = min_weight_full_bipartite_matching(graph)
+    real = (matched_rows < row_count) & (matched_cols < col_count)
+    return matched_rows[real], matched_cols[real]
+
+
+class CentroidTracker:
+    """Assigns a persistent id to each box from frame to frame.
+
+    Tracks are matched to the new boxes by minimum total distance between the
+    box centroids and the track centroids predicted from their velocity
+    (Hungarian algorithm). A track not matched for more than `max_disappeared`
+    updates is dropped; a pair further apart than `max_distance` pixels (the
+    largest plausible motion per frame) is never matched. With a gate, `grid`
+    solves only the candidate pairs found in a spatial grid; grid=False solves
+    the dense gated matrix, with the same result.
+    """
+
+    def __init__(self, max_disappeared=40, max_distance=None, velocity_smoothing=0.5, grid=True):
+        self.max_disappeared = max_disappeared
+        self.max_distance = max_distance
+        self.velocity_smoothing = velocity_smoothing
+        self.grid = grid
+        self.next_id = 0
+        self.ids = np.empty(0, dtype=np.int64)
+        self.boxes = np.empty((0, 4), dtype=np.float32)
+        self.centroids = np.empty((0, 2), dtype=np.float32)
+        self.velocities = np.empty((0, 2), dtype=np.float32)
+        self.disappeared = np.empty(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def objects(self):
+        """{id: centroid} of the current tracks"""
+        return dict(zip(self.ids.tolist(), self.centroids))
+
+    def predicted(self):
+        """Where each track should be now, given its velocity and the frames it has been missing"""
+        return self.centroids + self.velocities * (self.disappeared + 1)[:, None]
+
+    def match(self, centroids):
+        """(track rows, box columns) of the optimal assignment"""
+        predicted = self.predicted()
+        if self.max_distance is None or not self.grid:
+            return dense_assignment(predicted, centroids, self.max_distance)
+        rows, cols, cost = grid_candidates(predicted, centroids, self.max_distance)
+        return sparse_assignment(rows, cols, cost, len(predicted), len(centroids), self.max_distance)
+
+    def update(self, boxes):
+        """Feeds the (N, 4) xyxy boxes of a frame; returns the (N,) track id of each box"""
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        centroids = box_centroids(boxes)
+        box_ids = np.empty(len(boxes), dtype=np.int64)
+        matched_tracks = np.zeros(len(self.ids), dtype=bool)
+        matched_boxes = np.zeros(len(boxes), dtype=bool)
+
+        if len(self.ids) and len(boxes):
+            rows, cols = self.match(centroids)
+            # Velocity per frame over the frames since the track was last seen, smoothed
+            steps = (self.disappeared[rows] + 1)[:, None]
+            measured = (centroids[cols] - self.centroids[rows]) / steps
+            self.velocities[rows] += self.velocity_smoothing * (measured - self.velocities[rows])
+            self.centroids[rows] = centroids[cols]
+            self.boxes[rows] = boxes[cols]
+            self.disappeared[rows] = 0
+            box_ids[cols] = self.ids[rows]
+            matched_tracks[rows] = True
+            matched_boxes[cols] = True
+
+        # Unmatched tracks age and are dropped after max_disappeared updates
+        self.disappeared[~matched_tracks] += 1
+        keep = self.disappeared <= self.max_disappeared
+        if not keep.all():
+            self.ids, self.boxes, self.centroids, self.velocities, self.disappeared = (
+                self.ids[keep], self.boxes[keep], self.centroids[keep], self.velocities[keep], self.disappeared[keep])
+
+        # Unmatched boxes start new tracks
+        new = np.flatnonzero(~matched_boxes)
+        if len(new):
+            new_ids = np.arange(self.next_id, self.next_id + len(new), dtype=np.int64)
+            self.next_id += len(new)
+            box_ids[new] = new_ids
+            self.ids = np.concatenate((self.ids, new_ids))
+            self.boxes = np.concatenate((self.boxes, boxes[new]))
+            self.centroids = np.concatenate((self.centroids, centroids[new]))
+            self.velocities = np.concatenate((self.velocities, np.zeros((len(new), 2), dtype=np.float32)))
+            self.disappeared = np.concatenate((self.disappeared, np.zeros(len(new), dtype=np.int32)))
+        return box_ids
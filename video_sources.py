@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+import time
+from urllib.parse import parse_qs
+
+# Every source returns (ok, frame, timestamp, sequence) from read(): the
+# timestamp is taken when the frame is produced and the sequence is the
+# source's own frame counter, so receivers can measure latency and loss.
+
+class Pacer:
+    """Sleeps so that successive frames are emitted at a fixed rate (None = as fast as possible)"""
+    
+    def __init__(self, fps=None):
+        self.fps = fps
+        self.next_time = None
+    
+    def wait(self):
+        if not self.fps:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > 1.0:
+            # First frame, or we fell far behind: restart the schedule instead of bursting
+            self.next_time = now
+        self.next_time += 1.0 / self.fps
+        delay = self.next_time - now
+        if delay > 0:
+            time.sleep(delay)
+
+class CaptureSource:
+    """Anything cv2.VideoCapture can open: device index, RTSP/HTTP URL or video file"""
+    
+    def __init__(self, target, name=None):
+        self.target = target
+        self.name = name or str(target)
+        self.cap = None
+        self.sequence = 0
+    
+    def open(self):
+        self.cap = cv2.VideoCapture(self.target)
+        self.sequence = 0
+        return self.cap.isOpened()
+    
+    def read(self):
+        ret, frame = self.cap.read()
+        timestamp = time.time()
+        if not ret:
+            return False, None, timestamp, self.sequence
+        self.sequence += 1
+        return True, frame, timestamp, self.sequence - 1
+    
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+class ReplaySource(CaptureSource):
+    """Video file replayed at its native fps, at a fixed rate or as fast as possible"""
+    
+    def __init__(self, path, rate='native', loop=False, name=None):
+        super().__init__(path, name=name or f"replay:{path}")
+        self.rate = rate
+        self.loop = loop
+        self.pacer = Pacer()
+    
+    def open(self):
+        if not super().open():
+            return False
+        if self.rate == 'native':
+            self.pacer = Pacer(self.cap.get(cv2.CAP_PROP_FPS) or 25.0)
+        elif self.rate == 'max':
+            self.pacer = Pacer(None)
+        else:
+            self.pacer = Pacer(float(self.rate))
+        return True
+    
+    def read(self):
+        self.pacer.wait()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        timestamp = time.time()
+        if not ret:
+            return False, None, timestamp, self.sequence
+        self.sequence += 1
+        return True, frame, timestamp, self.sequence - 1
+
+class SyntheticSource:
+    """Generated crowd scene for machines without a camera.
+    
+    `density` people (head + torso blobs) wander over a static background;
+    a fixed seed makes every run produce the same frames.
+    """
+    
+    def __init__(self, width=1280, height=720, fps=30.0, density=100, seed=0, name=None):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.density = density
+        self.seed = seed
+        self.name = name or f"synthetic:{width}x{height}"
+        self.sequence = 0
+    
+    def open(self):
+        rng = np.random.default_rng(self.seed)
+        self.sequence = 0
+        self.pacer = Pacer(self.fps)
+        
+        # Stand-like background: horizontal bands of seating
+        rows = np.arange(self.height, dtype=np.float32)[:, None]
+        bands = (96 + 32 * np.sin(rows / 12.0)).astype(np.uint8)
+        gray = np.broadcast_to(bands, (self.height, self.width))
+        self.background = cv2.merge([gray, gray, np.full_like(gray, 60)])
+        
+        # People: position, velocity, size and colour
+        self.positions = rng.uniform((0, 0), (self.width, self.height), size=(self.density, 2))
+        self.velocities = rng.normal(0, 1.5, size=(self.density, 2))
+        self.sizes = rng.uniform(8, 24, size=self.density) * (self.height / 720.0)
+        self.colors = rng.integers(0, 255, size=(self.density, 3))
+        return True
+    
+    def read(self):
+        self.pacer.wait()
+        
+        # Move everybody at once and bounce on the borders
+        self.positions += self.velocities
+        bounds = np.array([self.width - 1, self.height - 1], dtype=np.float64)
+        outside = (self.positions < 0) | (self.positions > bounds)
+        self.velocities[outside] *= -1
+        np.clip(self.positions, 0, bounds, out=self.positions)
+        
+        frame = self.background.copy()
+        for (x, y), size, color in zip(self.positions.astype(int), self.sizes.astype(int), self.colors.tolist()):
+            cv2.rectangle(frame, (x - size // 2, y), (x + size // 2, y + 2 * size), color, -1)
+            cv2.circle(frame, (x, y - size // 2), max(size // 2, 1), (150, 180, 220), -1)
+        cv2.putText(frame, f"{self.name} #{self.sequence}", (20, 40),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        
+        self.sequence += 1
+        return True, frame, time.time(), self.sequence - 1
+    
+    def release(self):
+        pass
+
+def open_source(spec):
+    """Builds a source from a command-line spec.
+    
+    "0", "1"...                          camera device index
+    "rtsp://...", "http://..."           network stream
+    "synthetic[:WxH][?fps=30&density=100&seed=0]"
+                                         generated crowd frames
+    "video.mp4[?rate=native|max|25&loop=1]"
+                                         file replay (native fps by default)
+    """
+    if spec.isdigit():
+        return CaptureSource(int(spec), name=f"camera:{spec}")
+    if '://' in spec:
+        return CaptureSource(spec)
+    
+    path, _, query = spec.partition('?')
+    options = {key: values[-1] for key, values in parse_qs(query).items()}
+    if path.startswith('synthetic'):
+        width, height = 1280, 720
+        if ':' in path:
+            width, height = (int(v) for v in path.split(':', 1)[1].lower().split('x'))
+        return SyntheticSource(width, height,
+                               fps=float(options.get('fps', 30)),
+                               density=int(options.get('density', 100)),
+                               seed=int(options.get('seed', 0)))
+    return ReplaySource(path, rate=options.get('rate', 'native'),
+                        loop=options.get('loop', '0') not in ('0', 'false', 'no'))
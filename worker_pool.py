@@ -0,0 +1,434 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future
+import multiprocessing
+from multiprocessing import connection, shared_memory
+import numpy as np
+from backends import RuntimeResult
+from shm_transport import BLOCK_ALIGN, attach_block
+
+# Inference in worker processes, so that the model never holds the GIL of the
+# Tk front ends. Every worker has its own shared memory slot: the parent copies
+# the frame (or the tiles of a frame) into it and sends only the layout; the
+# worker answers with the (N, 6) detection arrays. A worker that dies is
+# replaced and its frame fails with WorkerCrashed; the other sources go on.
+
+
+class WorkerCrashed(RuntimeError):
+    pass
+
+
+def detection_arrays(results):
+    """ultralytics (or backends) Results -> [(frame shape, (N, 6) float32 x1 y1 x2 y2 confidence class)]"""
+    from detections import Detections
+    arrays = []
+    for result in results:
+        detections = Detections.from_results(result)
+        data = np.column_stack((detections.boxes, detections.scores, detections.class_ids)).astype(np.float32)
+        arrays.append((detections.frame_shape, data))
+    return arrays
+
+
+def worker_main(conn, weights, backend, threads, warmup_shape=(480, 640, 3)):
+    """Worker process: loads the model and warms it up, then runs the frames it is sent until it receives None"""
+    start = time.perf_counter()
+    from backends import load_model
+    model = load_model(weights, backend, threads)
+    loaded = time.perf_counter()
+    model(np.zeros(warmup_shape, dtype=np.uint8), verbose=False)
+    names = model.names
+    conn.send(('ready', [names[i] for i in range(len(names))], getattr(model, 'backend', 'torch'),
+               loaded - start, time.perf_counter() - loaded))
+    block = None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        name, layout, args = task
+        if block is None or block.name != name:
+            if block is not None:
+                block.close()
+            block = attach_block(name)
+        # Copied out of the slot: the model may keep references to its inputs until the next call
+        images = [np.ndarray(shape, dtype, buffer=block.buf, offset=offset).copy() for offset, shape, dtype in layout]
+        try:
+            conn.send(('done', detection_arrays(model(images, **args))))
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}"))
+    if block is not None:
+        block.close()
+
+
+class WorkerProcess:
+    """Parent side of one worker: process, pipe, frame slot and the task in flight"""
+
+    def __init__(self, context, weights, backend, threads):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, weights, backend, threads), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.slot = None
+        self.task = None
+        self.ready = False
+        self.backend = None
+        self.startup = None
+        # Set by a backend switch while busy: stopped once its frame is done
+        self.retire = False
+
+    def send(self, images, args):
+        layout, size = [], 0
+        for image in images:
+            layout.append((size, image.shape, image.dtype.str))
+            size += (image.nbytes + BLOCK_ALIGN - 1) // BLOCK_ALIGN * BLOCK_ALIGN
+        if self.slot is None or self.slot.size < size:
+            # Grown with some margin so that a slightly larger frame does not reallocate again
+            self.release_slot()
+            self.slot = shared_memory.SharedMemory(create=True, size=max(size + size // 4, 1))
+        for (offset, shape, dtype), image in zip(layout, images):
+            np.ndarray(shape, dtype, buffer=self.slot.buf, offset=offset)[...] = image
+        self.conn.send((self.slot.name, layout, args))
+
+    def release_slot(self):
+        if self.slot is not None:
+            self.slot.close()
+            self.slot.unlink()
+            self.slot = None
+
+    def close(self, timeout=1.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout)
+        self.conn.close()
+        self.release_slot()
+
+
+class InferencePool:
+    """InferenceScheduler interface (submit/predict/register/unregister/set_profile/summary)
+    with the model running in `workers` processes.
+
+    Each source has at most one pending frame (latest frame wins) and every idle
+    worker takes the oldest pending one, so several sources use several cores.
+    """
+
+    def __init__(self, weights, workers=2, backend='torch', threads=None, latency_window=200, max_start_failures=3,
+                 **predict_args):
+        self.weights = weights
+        self.worker_count = workers
+        self.backend = backend
+        # Backend of the profiles that do not name one
+        self.default_backend = backend
+        # Runtime threads per worker: by default the cores are shared between the workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.base_args = dict(predict_args, verbose=False)
+        self.predict_args = self.base_args
+        self.profile = None
+        self.profile_changed = False
+        self.names = None
+        # spawn: a forked copy of a Tk/torch process is not safe to use
+        self.context = multiprocessing.get_context('spawn')
+        self.condition = threading.Condition()
+        self.pending = collections.OrderedDict()
+        self.sources = set()
+        self.workers = []
+        self.idle = collections.deque()
+        # Workers of the previous backend, stopping; closed by the collector once they exit
+        self.retiring = []
+        self.running = False
+        self.loops = []
+        self.max_start_failures = max_start_failures
+        self.start_failures = 0
+        # Set once no worker is left: later frames fail at once instead of waiting forever
+        self.failed = None
+
+        # Statistics
+        self.tasks = 0
+        self.superseded = 0
+        self.restarts = 0
+        self.latency_window = latency_window
+        self.latencies = {}
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return self
+            self.running = True
+            self.workers = [self.spawn() for _ in range(self.worker_count)]
+        for target in (self.dispatch_loop, self.collect_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+            self.loops.append(thread)
+        return self
+
+    def spawn(self):
+        return WorkerProcess(self.context, self.weights, self.backend, self.threads)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            pending = list(self.pending.values())
+            self.pending.clear()
+            workers, self.workers = self.workers + self.retiring, []
+            self.retiring = []
+            self.idle.clear()
+            self.condition.notify_all()
+        for _, _, future in pending:
+            future.cancel()
+        for thread in self.loops:
+            thread.join(1.0)
+        self.loops = []
+        for worker in workers:
+            # A running Future cannot be cancelled: its waiter gets an error instead
+            if worker.task is not None and not worker.task[3].done():
+                worker.task[3].set_exception(RuntimeError("Inference pool stopped"))
+            worker.close()
+
+    def register(self, source_id):
+        with self.condition:
+            self.sources.add(source_id)
+            self.latencies.setdefault(source_id, collections.deque(maxlen=self.latency_window))
+
+    def unregister(self, source_id):
+        with self.condition:
+            self.sources.discard(source_id)
+            item = self.pending.pop(source_id, None)
+        if item is not None:
+            item[2].cancel()
+
+    def submit(self, source_id, frame):
+        """Queues a frame (or a list of tiles); the Future resolves like InferenceScheduler.submit()"""
+        future = Future()
+        with self.condition:
+            if not self.running:
+                future.set_exception(RuntimeError("Inference pool stopped"))
+                return future
+            if self.failed:
+                future.set_exception(WorkerCrashed(self.failed))
+                return future
+            if source_id not in self.sources:
+                self.sources.add(source_id)
+                self.latencies.setdefault(source_id, collections.deque(maxlen=self.latency_window))
+            previous = self.pending.pop(source_id, None)
+            if previous is not None:
+                self.superseded += 1
+            self.pending[source_id] = (time.perf_counter(), frame, future)
+            self.condition.notify_all()
+        if previous is not None:
+            previous[2].cancel()
+        return future
+
+    def predict(self, source_id, frame, timeout=None):
+        return self.submit(source_id, frame).result(timeout)
+
+    def warmup(self, frame_shape=None, timeout=None):
+        """Waits for the first worker to be ready (workers load and warm up on their own).
+        Returns that worker's (load seconds, warmup seconds)."""
+        with self.condition:
+            # replace() and handle() notify whenever a worker starts, becomes ready or is given up
+            if not self.condition.wait_for(lambda: not self.running or not self.workers
+                                           or any(w.ready for w in self.workers), timeout):
+                raise TimeoutError("No inference worker ready")
+            if not self.workers:
+                raise WorkerCrashed("No inference worker could start")
+            return next(worker.startup for worker in self.workers if worker.ready)
+
+    def set_profile(self, profile):
+        """Prediction arguments of the profile from the next frame on. A profile on another backend
+        restarts the workers on it (like InferenceScheduler reloads its model), each one as soon as
+        it has finished its current frame."""
+        backend = (profile.backend if profile is not None else None) or self.default_backend
+        with self.condition:
+            self.profile = profile
+            self.profile_changed = True
+            if backend == self.backend:
+                return
+            self.backend = backend
+            self.start_failures = 0
+            if self.running and not self.workers:
+                # The workers could not start on the previous backend: try the new one
+                self.failed = None
+                self.workers = [self.spawn() for _ in range(self.worker_count)]
+            elif self.running:
+                for worker in list(self.workers):
+                    if worker.task is None:
+                        self.retire(worker)
+                    else:
+                        worker.retire = True
+        print(f"Inference workers restarting on the {backend} backend")
+
+    def retire(self, worker):
+        """Replaces a worker by one on the current backend and asks it to stop (condition held)"""
+        self.workers[self.workers.index(worker)] = self.spawn()
+        if worker in self.idle:
+            self.idle.remove(worker)
+        self.retiring.append(worker)
+        try:
+            worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.condition.notify_all()
+
+    def dispatch_loop(self):
+        """Hands the oldest pending frame to an idle worker"""
+        while True:
+            with self.condition:
+                while self.running and not (self.pending and self.idle):
+                    self.condition.wait()
+                if not self.running:
+                    return
+                source_id, (submitted, frame, future) = self.pending.popitem(last=False)
+                if not future.set_running_or_notify_cancel():
+                    continue
+                if self.profile_changed:
+                    self.profile_changed = False
+                    args = dict(self.base_args)
+                    if self.profile is not None:
+                        args.update(self.profile.predict_args(self.names))
+                    self.predict_args = args
+                worker = self.idle.popleft()
+                worker.task = (source_id, submitted, frame, future)
+                args = self.predict_args
+            try:
+                worker.send(frame if isinstance(frame, list) else [frame], args)
+            except (OSError, ValueError) as e:
+                # Worker gone: the collector restarts it and fails this frame
+                print(f"Inference worker {worker.process.pid} unreachable ({e})")
+
+    def collect_loop(self):
+        """Receives the results, and replaces the workers that died"""
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                workers = self.workers + self.retiring
+            by_object = {}
+            for worker in workers:
+                by_object[worker.conn] = worker
+                by_object[worker.process.sentinel] = worker
+            for ready in connection.wait(list(by_object), timeout=0.5):
+                worker = by_object[ready]
+                if ready is worker.conn:
+                    try:
+                        message = worker.conn.recv()
+                    except (EOFError, OSError):
+                        self.replace(worker)
+                        continue
+                    self.handle(worker, message)
+                else:
+                    self.replace(worker)
+
+    def handle(self, worker, message):
+        kind = message[0]
+        if kind == 'ready':
+            with self.condition:
+                self.names = dict(enumerate(message[1]))
+                worker.backend = message[2]
+                worker.startup = message[3:5]
+                worker.ready = True
+                self.start_failures = 0
+                if worker in self.workers:
+                    self.idle.append(worker)
+                self.condition.notify_all()
+            return
+
+        done = time.perf_counter()
+        with self.condition:
+            if worker.task is None:
+                return
+            source_id, submitted, frame, future = worker.task
+            worker.task = None
+            if worker.retire and worker in self.workers:
+                self.retire(worker)
+            elif worker in self.workers:
+                self.idle.append(worker)
+                self.condition.notify_all()
+            if kind == 'done':
+                self.tasks += 1
+                if source_id in self.latencies:
+                    self.latencies[source_id].append(done - submitted)
+            names = self.names
+        if kind == 'error':
+            future.set_exception(RuntimeError(message[1]))
+            return
+        results = [RuntimeResult(names, shape, data) for shape, data in message[1]]
+        future.set_result(results if isinstance(frame, list) else results[0])
+
+    def replace(self, worker):
+        """Starts a new worker in place of a dead one and fails the frame it was running"""
+        with self.condition:
+            retired = worker in self.retiring
+            if retired:
+                self.retiring.remove(worker)
+        if retired:
+            # A worker of the previous backend that stopped as asked
+            worker.close(timeout=0.1)
+            return
+        with self.condition:
+            if worker not in self.workers:
+                return
+            if worker in self.idle:
+                self.idle.remove(worker)
+            if not worker.ready:
+                self.start_failures += 1
+            # A worker that cannot even load the model would be restarted forever
+            restart = self.running and self.start_failures < self.max_start_failures
+            index = self.workers.index(worker)
+            if restart:
+                self.workers[index] = self.spawn()
+                self.restarts += 1
+            else:
+                del self.workers[index]
+            task, worker.task = worker.task, None
+            if not self.workers:
+                self.failed = "No inference worker left"
+                pending = list(self.pending.values())
+                self.pending.clear()
+            else:
+                pending = []
+            self.condition.notify_all()
+        exitcode = worker.process.exitcode
+        print(f"Inference worker {worker.process.pid} died (exit code {exitcode})"
+              + ("; restarted" if restart else "; not restarted"))
+        if task is not None:
+            task[3].set_exception(WorkerCrashed(f"Inference worker died (exit code {exitcode})"))
+        worker.close(timeout=0.1)
+        for _, _, future in pending:
+            future.set_exception(WorkerCrashed("No inference worker left"))
+
+    def stats(self):
+        with self.condition:
+            latencies = {source_id: sorted(values) for source_id, values in self.latencies.items() if values}
+            stats = {
+                'workers': len(self.workers),
+                'ready': sum(worker.ready for worker in self.workers),
+                'busy': sum(worker.task is not None for worker in self.workers),
+                'tasks': self.tasks,
+                'superseded': self.superseded,
+                'restarts': self.restarts,
+                'sources': {},
+            }
+        for source_id, values in latencies.items():
+            stats['sources'][source_id] = {
+                'mean_ms': 1000 * sum(values) / len(values),
+                'p95_ms': 1000 * values[min(len(values) - 1, int(0.95 * len(values)))],
+            }
+        return stats
+
+    def summary(self):
+        stats = self.stats()
+        text = f"profile {self.profile.name} | " if self.profile is not None else ""
+        text += (f"{stats['ready']}/{self.worker_count} workers ({self.backend}, {self.threads} threads each) "
+                 f"| frames {stats['tasks']} | superseded {stats['superseded']} | restarts {stats['restarts']}")
+        for source_id, latency in stats['sources'].items():
+            text += f" | {source_id}: {latency['mean_ms']:.1f} ms (p95 {latency['p95_ms']:.1f})"
+        return text
@@ -0,0 +1,363 @@
+import json
+import os
+import time
+import cv2
+import numpy as np
+
+# Polygon zones and counting lines per camera. zones.json, next to this file,
+# maps a camera (the video source as given to the front end, its file name, or
+# "default") to its zones (gates, aisles, stand sections, each with its own
+# capacity) and its counting lines (turnstiles, with a maximum entry rate):
+#     {"cameras": {"tribune_nord.mp4": {
+#         "zones": {"porte_A": {"polygon": [[0.1, 0.5], [0.4, 0.5], [0.4, 1.0], [0.1, 1.0]],
+#                               "threshold": 25, "duration": 5}},
+#         "lines": {"tourniquets_A": {"points": [[0.1, 0.8], [0.4, 0.8]], "threshold": 40}}}}}
+# Points are fractions of the frame width and height, so the same config works
+# at any processing resolution. The zones are rasterized once per frame size
+# into a label mask (0 = no zone; where zones overlap the later one wins): a
+# person's zone is one array lookup at its foot point whatever the number of
+# zones, and all zones are counted with one bincount. Lines are crossed by the
+# moves of the tracks between two frames, all tested at once.
+
+ZONES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'zones.json')
+STATE_COLORS = ((0, 200, 0), (0, 165, 255), (0, 0, 255))
+# Seconds of crossings kept for the rolling rates (one bin per second)
+RATE_WINDOW = 60
+
+
+def held_since(over, since, now):
+    """Since when each value has been over its threshold (NaN when under), given this update's `over`"""
+    return np.where(over, np.where(np.isnan(since), now, since), np.nan)
+
+
+def alert_states(since, durations, default_duration, now):
+    """0 normal, 1 over threshold, 2 over it for its duration (default_duration where unset)"""
+    over = ~np.isnan(since)
+    durations = np.where(np.isnan(durations), default_duration, durations)
+    elapsed = np.where(over, now - np.nan_to_num(since), 0.0)
+    return over.astype(np.int8) + (over & (elapsed >= durations))
+
+
+def optional(values, missing):
+    return np.array([missing if value is None else value for value in values], dtype=np.float64)
+
+
+class Zone:
+    """One named polygon with its alert threshold (people) and duration (seconds over it before danger)"""
+
+    def __init__(self, name, polygon, threshold=None, duration=None, description=''):
+        self.name = name
+        self.polygon = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+        if len(self.polygon) < 3:
+            raise ValueError(f"Zone {name!r} needs at least 3 points")
+        # None: counted and drawn, never alerts
+        self.threshold = threshold
+        # None: the front end's surveillance time
+        self.duration = duration
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, data['polygon'], threshold=data.get('threshold'), duration=data.get('duration'),
+                   description=data.get('description', ''))
+
+    def __repr__(self):
+        return f"Zone({self.name!r})"
+
+
+class CountingLine:
+    """A segment from `points[0]` to `points[1]`, with an alert threshold on the entries per minute.
+
+    Crossing it towards the right of the first -> second point direction (as
+    seen on screen) is an entry, the other way an exit; `invert` swaps them.
+    """
+
+    def __init__(self, name, points, threshold=None, duration=None, invert=False, description=''):
+        self.name = name
+        self.points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        if len(self.points) != 2:
+            raise ValueError(f"Line {name!r} needs exactly 2 points")
+        if invert:
+            self.points = self.points[::-1].copy()
+        self.threshold = threshold
+        self.duration = duration
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, name, data):
+        return cls(name, data['points'], threshold=data.get('threshold'), duration=data.get('duration'),
+                   invert=data.get('invert', False), description=data.get('description', ''))
+
+    def __repr__(self):
+        return f"CountingLine({self.name!r})"
+
+
+def camera_config(camera, path=ZONES_FILE):
+    """Entry of a camera: its own, else the one of its file name, else "default" ({} without a file)"""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        cameras = json.load(f).get('cameras', {})
+    camera = str(camera)
+    for key in (camera, os.path.basename(camera), 'default'):
+        if key in cameras:
+            return cameras[key]
+    return {}
+
+
+def load_zones(camera, path=ZONES_FILE):
+    return [Zone.from_dict(name, data) for name, data in camera_config(camera, path).get('zones', {}).items()]
+
+
+def load_lines(camera, path=ZONES_FILE):
+    return [CountingLine.from_dict(name, data) for name, data in camera_config(camera, path).get('lines', {}).items()]
+
+
+class ZoneMap:
+    """Per-zone people counts and alert states of one camera.
+
+    update() counts the people of a frame in each zone and notes since when
+    each zone has been at or over its threshold; states() gives 0 (normal),
+    1 (over threshold) or 2 (over threshold for its duration) per zone.
+    """
+
+    def __init__(self, zones):
+        self.zones = list(zones)
+        self.names = [zone.name for zone in self.zones]
+        self.thresholds = optional([zone.threshold for zone in self.zones], np.inf)
+        self.durations = optional([zone.duration for zone in self.zones], np.nan)
+        self.counts = np.zeros(len(self.zones), dtype=np.int64)
+        self.over_since = np.full(len(self.zones), np.nan)
+        self.frame_shape = None
+        self.mask = None
+        self.polygons = []
+
+    def __len__(self):
+        return len(self.zones)
+
+    def rasterize(self, frame_shape):
+        """Label mask (zone index + 1, 0 outside every zone) and pixel polygons at this frame size"""
+        height, width = frame_shape[:2]
+        self.frame_shape = (height, width)
+        self.mask = np.zeros((height, width), dtype=np.uint8 if len(self.zones) < 255 else np.uint16)
+        self.polygons = [np.round(zone.polygon * (width, height)).astype(np.int32) for zone in self.zones]
+        for label, polygon in enumerate(self.polygons, 1):
+            cv2.fillPoly(self.mask, [polygon], label)
+
+    def labels(self, points, frame_shape):
+        """Zone label of each (x, y) point in frame pixels"""
+        if self.frame_shape != tuple(frame_shape[:2]):
+            self.rasterize(frame_shape)
+        height, width = self.frame_shape
+        x = np.clip(points[:, 0].astype(np.intp), 0, width - 1)
+        y = np.clip(points[:, 1].astype(np.intp), 0, height - 1)
+        return self.mask[y, x]
+
+    def update(self, points, frame_shape, now=None):
+        """Counts the people standing at `points` (their foot points) in each zone; returns the counts"""
+        if not self.zones:
+            return self.counts
+        now = time.time() if now is None else now
+        self.counts = np.bincount(self.labels(points, frame_shape), minlength=len(self.zones) + 1)[1:]
+        self.over_since = held_since(self.counts >= self.thresholds, self.over_since, now)
+        return self.counts
+
+    def states(self, default_duration, now=None):
+        """0 normal, 1 at or over threshold, 2 over it for the zone's duration (default_duration if unset)"""
+        return alert_states(self.over_since, self.durations, default_duration, time.time() if now is None else now)
+
+    def draw(self, frame, states=None):
+        """Outlines every zone with its count, coloured by state"""
+        if not self.zones or self.frame_shape != frame.shape[:2]:
+            return frame
+        states = np.zeros(len(self.zones), dtype=np.int8) if states is None else states
+        for polygon, name, count, threshold, state in zip(self.polygons, self.names, self.counts.tolist(),
+                                                          self.thresholds.tolist(), states.tolist()):
+            color = STATE_COLORS[state]
+            cv2.polylines(frame, [polygon], True, color, 2)
+            label = f"{name}: {count}" + (f"/{threshold:g}" if np.isfinite(threshold) else "")
+            x, y = polygon.min(axis=0).tolist()
+            cv2.putText(frame, label, (x + 4, y + 16), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        return frame
+
+
+def cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+class LineCounter:
+    """Entries and exits through the counting lines of one camera, from the tracker's tracks.
+
+    Each update takes the tracks seen in the frame with their foot points; the
+    move of every track since it was last seen is tested against every line
+    at once ((tracks, lines) arrays). Crossings go into one-second bins over
+    the last RATE_WINDOW seconds for the rolling rates. A foot point within
+    `band` pixels of a line keeps the side it had, so a track jittering on the
+    line is not counted in and out on every frame.
+    """
+
+    def __init__(self, lines, band=4.0):
+        self.lines = list(lines)
+        self.band = band
+        self.names = [line.name for line in self.lines]
+        self.thresholds = optional([line.threshold for line in self.lines], np.inf)
+        self.durations = optional([line.duration for line in self.lines], np.nan)
+        self.over_since = np.full(len(self.lines), np.nan)
+        # Entries, exits of every line since the config was loaded
+        self.totals = np.zeros((len(self.lines), 2), dtype=np.int64)
+        self.bins = np.zeros((len(self.lines), RATE_WINDOW, 2), dtype=np.int64)
+        self.second = None
+        # Per live track and line: the side it was last clear of the band on (0 not yet) and its foot point there
+        self.track_ids = np.empty(0, dtype=np.int64)
+        self.track_sides = np.empty((0, len(self.lines)), dtype=np.int8)
+        self.track_points = np.empty((0, len(self.lines), 2), dtype=np.float32)
+        self.frame_shape = None
+        self.segments = np.empty((0, 2, 2), dtype=np.float32)
+        self.lengths = np.empty(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def sides(self, points):
+        """(points, lines) array: 1 entry side, -1 exit side, 0 within `band` pixels of the line"""
+        a, b = self.segments[None, :, 0], self.segments[None, :, 1]
+        distance = cross(b - a, points[:, None] - a) / self.lengths
+        return np.where(distance > self.band, 1, np.where(distance < -self.band, -1, 0)).astype(np.int8)
+
+    def crossings(self, sides, starts, ends):
+        """(tracks, lines) array: 1 entry, -1 exit, 0 no crossing, from the (tracks, lines) sides and
+        foot points `starts` where the tracks were last clear of each line to their foot points `ends`.
+        Also returns the updated sides and starts."""
+        a, b = self.segments[None, :, 0], self.segments[None, :, 1]
+        p, q = starts, ends[:, None]
+        side_end = self.sides(ends)
+        # Clear of the line on the other side now, and the line's ends are on both sides of the move
+        crossed = ((sides != 0) & (side_end != 0) & (side_end != sides)
+                   & (cross(q - p, a - p) * cross(q - p, b - p) <= 0))
+        clear = side_end != 0
+        return (np.where(crossed, side_end, 0), np.where(clear, side_end, sides),
+                np.where(clear[..., None], q, starts).astype(np.float32))
+
+    def advance(self, now):
+        """Moves the rate window to the current second, clearing the bins it leaves behind"""
+        second = int(now)
+        if self.second is not None and second > self.second:
+            stale = (self.second + 1 + np.arange(min(second - self.second, RATE_WINDOW))) % RATE_WINDOW
+            self.bins[:, stale] = 0
+        self.second = second if self.second is None else max(second, self.second)
+
+    def update(self, ids, points, frame_shape, alive=None, now=None):
+        """Feeds the tracks seen this frame (ids and foot points, in frame pixels).
+
+        `alive` (the tracker's current ids) lets the counter forget the tracks
+        the tracker dropped.
+        """
+        if not self.lines:
+            return
+        now = time.time() if now is None else now
+        if self.frame_shape != tuple(frame_shape[:2]):
+            self.frame_shape = tuple(frame_shape[:2])
+            height, width = self.frame_shape
+            self.segments = np.stack([line.points * (width, height) for line in self.lines])
+            self.lengths = np.maximum(np.linalg.norm(self.segments[:, 1] - self.segments[:, 0], axis=1), 1e-6)
+        self.advance(now)
+        ids = np.asarray(ids, dtype=np.int64)
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+        # New tracks start from their own foot point, on whichever side they are clear of
+        sides = self.sides(points)
+        starts = np.repeat(points[:, None], len(self.lines), axis=1)
+        _, previous, current = np.intersect1d(self.track_ids, ids, assume_unique=True, return_indices=True)
+        if len(previous):
+            moves, sides[current], starts[current] = self.crossings(
+                self.track_sides[previous], self.track_points[previous], points[current])
+            counts = np.stack(((moves > 0).sum(axis=0), (moves < 0).sum(axis=0)), axis=1)
+            self.totals += counts
+            self.bins[:, self.second % RATE_WINDOW] += counts
+        keep = ~np.isin(self.track_ids, ids)
+        if alive is not None:
+            keep &= np.isin(self.track_ids, alive)
+        self.track_ids = np.concatenate((self.track_ids[keep], ids))
+        self.track_sides = np.concatenate((self.track_sides[keep], sides))
+        self.track_points = np.concatenate((self.track_points[keep], starts))
+        self.over_since = held_since(self.rates(60, now)[:, 0] >= self.thresholds, self.over_since, now)
+
+    def rates(self, seconds, now=None):
+        """(lines, 2) entries and exits over the last `seconds` (at most RATE_WINDOW)"""
+        self.advance(time.time() if now is None else now)
+        slots = (self.second - np.arange(min(seconds, RATE_WINDOW))) % RATE_WINDOW
+        return self.bins[:, slots].sum(axis=1)
+
+    def states(self, default_duration, now=None):
+        """0 normal, 1 entries per minute at or over threshold, 2 over it for the line's duration"""
+        return alert_states(self.over_since, self.durations, default_duration, time.time() if now is None else now)
+
+    def draw(self, frame, states=None):
+        """Draws every line, an arrow towards its entry side and its counts and rates"""
+        if not self.lines or self.frame_shape != frame.shape[:2]:
+            return frame
+        states = np.zeros(len(self.lines), dtype=np.int8) if states is None else states
+        per_10s, per_minute = self.rates(10), self.rates(60)
+        for segment, name, total, recent, minute, state in zip(self.segments, self.names, self.totals.tolist(),
+                                                               per_10s.tolist(), per_minute.tolist(), states.tolist()):
+            color = STATE_COLORS[state]
+            start, end = segment.astype(np.int32).tolist()
+            cv2.line(frame, tuple(start), tuple(end), color, 2)
+            # Arrow from the middle of the line towards the entry side (the right of start -> end)
+            direction = segment[1] - segment[0]
+            normal = np.array([-direction[1], direction[0]]) / max(float(np.hypot(*direction)), 1e-6)
+            middle = segment.mean(axis=0)
+            cv2.arrowedLine(frame, tuple(middle.astype(np.int32).tolist()),
+                            tuple((middle + 20 * normal).astype(np.int32).tolist()), color, 2)
+            label = f"{name}: +{total[0]} -{total[1]} | {recent[0]}/10s {minute[0]}/min"
+            cv2.putText(frame, label, (start[0], start[1] - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 2)
+        return frame
+
+    def summary(self):
+        return ' | '.join(f"{name}: {entries} in, {exits} out"
+                          for name, (entries, exits) in zip(self.names, self.totals.tolist()))
+
+
+class ZoneConfig:
+    """The ZoneMap and LineCounter of one camera, rebuilt when zones.json changes on disk.
+
+    poll() is cheap (one stat every `check_interval` seconds) and meant to be
+    called from the video loop: edited zones apply without stopping the video.
+    A file that fails to load keeps the previous zones and sets `error`.
+    """
+
+    def __init__(self, camera, path=ZONES_FILE, check_interval=2.0):
+        self.camera = camera
+        self.path = path
+        self.check_interval = check_interval
+        self.map = ZoneMap([])
+        self.lines = LineCounter([])
+        self.modified = None
+        self.checked_at = None
+        self.error = None
+        self.poll()
+
+    def poll(self, now=None):
+        """Reloads the zones if the file changed since the last check; True when it was read again"""
+        now = time.monotonic() if now is None else now
+        if self.checked_at is not None and now - self.checked_at < self.check_interval:
+            return False
+        self.checked_at = now
+        modified = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+        if modified == self.modified:
+            return False
+        self.modified = modified
+        try:
+            zones, lines = load_zones(self.camera, self.path), load_lines(self.camera, self.path)
+            self.map, self.lines = ZoneMap(zones), LineCounter(lines)
+            self.error = None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.error = f"{os.path.basename(self.path)}: {e}"
+        return True
+
+    def summary(self):
+        if self.error:
+            return f"invalid zones ({self.error}), keeping {len(self.map)} zone(s) and {len(self.lines)} line(s)"
+        if not len(self.map) and not len(self.lines):
+            return f"no zones for {self.camera}"
+        return (f"{len(self.map)} zone(s), {len(self.lines)} line(s) for {self.camera}: "
+                f"{', '.join(self.map.names + self.lines.names)}")